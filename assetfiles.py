@@ -0,0 +1,26 @@
+"""
+GalHub - 资源文件模块
+资源优化和离线包生成共用的文件写入函数及WebP版本的命名；只依赖标准库，
+服务器提供文件时导入它不会加载优化模块使用的进程池
+"""
+
+import hashlib
+import os
+
+# WebP版本的文件名后缀，如 bg.png 的WebP版本为 bg.png.webp
+WEBP_SUFFIX = ".webp"
+
+def write_file(path, data):
+    """原子地写入文件（内容未变化时不重写），返回新的清单条目信息"""
+    try:
+        with open(path, "rb") as f:
+            unchanged = f.read() == data
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        tmp_path = path + ".opt.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": hashlib.sha256(data).hexdigest()}
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+GalHub - 启动时间测试脚本
+在新进程中多次运行各子命令，测量冷启动耗时；也可测试build.py编译出的可执行文件
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# 要测试的命令，均在临时工作目录中运行，不影响现有数据
+COMMANDS = [
+    ["--help"],
+    ["list"],
+    ["config"],
+    ["remove", "--alias", "bench-missing"],
+    ["stats", "--days", "1", "--json"],
+    ["serve"],
+]
+# 等待服务器就绪的最长时间（秒）
+SERVE_TIMEOUT = 30
+
+def get_base_command(exe=None):
+    """获取启动GalHub的命令：指定可执行文件时直接运行，否则用当前Python运行main.py"""
+    if exe:
+        return [os.path.abspath(exe)]
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def time_command(base, args, workdir):
+    """运行一次命令直到退出，返回耗时（秒）"""
+    started = time.perf_counter()
+    subprocess.run(base + args, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+def time_serve(base, workdir):
+    """启动服务器直到开始监听，返回耗时（秒）"""
+    # 服务器开始监听后会写入 GALHUB_READY_FILE 指定的文件（与热重启使用同一机制）
+    ready_file = os.path.join(workdir, "ready")
+    if os.path.exists(ready_file):
+        os.remove(ready_file)
+    env = dict(os.environ, GALHUB_READY_FILE=ready_file)
+    command = base + ["serve", "--port", str(find_free_port())]
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(ready_file):
+            if proc.poll() is not None:
+                raise RuntimeError("server exited before it started listening")
+            if time.perf_counter() - started > SERVE_TIMEOUT:
+                raise RuntimeError("server did not start listening in time")
+            time.sleep(0.005)
+        return time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def run_benchmark(base, runs):
+    """
+    测试所有命令
+
+    Args:
+        base (list): 启动GalHub的命令
+        runs (int): 每个命令运行的次数
+
+    Returns:
+        dict: 命令到耗时列表（毫秒）的映射
+    """
+    workdir = tempfile.mkdtemp(prefix="galhub-bench-")
+    try:
+        # 先初始化一次，测量的是数据库已存在时的日常调用
+        subprocess.run(base + ["init"], cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+        results = {}
+        for args in COMMANDS:
+            timings = []
+            for _ in range(runs):
+                if args == ["serve"]:
+                    elapsed = time_serve(base, workdir)
+                else:
+                    elapsed = time_command(base, args, workdir)
+                timings.append(elapsed * 1000)
+            results[" ".join(args)] = timings
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def print_results(results):
+    print(f"{'Command':<40} {'Min (ms)':>10} {'Median (ms)':>12} {'Max (ms)':>10}")
+    print("-" * 75)
+    for command, timings in results.items():
+        print(f"{command:<40} {min(timings):>10.1f} {statistics.median(timings):>12.1f} {max(timings):>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="GalHub - 启动时间测试")
+    parser.add_argument("--exe", help="测试编译后的可执行文件，如 dist/main/main.exe")
+    parser.add_argument("--runs", type=int, default=5, help="每个命令运行的次数")
+    parser.add_argument("--record", help="把本次结果追加到JSON Lines文件，用于跟踪启动时间的变化")
+    args = parser.parse_args()
+
+    base = get_base_command(args.exe)
+    print(f"测试命令: {' '.join(base)}，每个子命令运行 {args.runs} 次")
+    results = run_benchmark(base, args.runs)
+    print_results(results)
+
+    if args.record:
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "target": "exe" if args.exe else "source",
+                "median_ms": {command: round(statistics.median(timings), 1) for command, timings in results.items()},
+            }, ensure_ascii=False) + "\n")
+        print(f"结果已追加到 {args.record}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -89,6 +89,7 @@ def show_instructions():
     print("  main.exe upload --name \"游戏名称\" --alias \"游戏别名\" --path \"游戏文件路径\"")
     print("  main.exe list               # 列出所有游戏")
     print("  main.exe serve --port 8000  # 启动HTTP服务器")
+    print("\n测试启动时间: python bench_startup.py --exe dist/main/main.exe")
     print("="*50)
 
 def main():
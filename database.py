@@ -1,9 +1,12 @@
 import sqlite3
 from datetime import datetime
+import json
 import os
 
 # 数据库文件路径
 DB_PATH = 'games.db'
+# 数据库结构版本，修改 init_db 中的表结构时需要递增
+SCHEMA_VERSION = 5
 
 def init_db():
     """
@@ -23,6 +26,11 @@ def init_db():
         )
     ''')
     
+    # 游戏列表按上传时间排序、按别名和名称前缀搜索时使用的索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_upload_time ON games (upload_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_alias_nocase ON games (alias COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_name_nocase ON games (name COLLATE NOCASE)')
+    
     # 创建设置表，用于存储域名等设置
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS settings (
@@ -37,9 +45,92 @@ def init_db():
         VALUES ('domain', 'localhost')
     ''')
     
+    # 创建游戏文件清单表，记录每个文件的大小和内容哈希
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_files (
+            alias TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (alias, path)
+        )
+    ''')
+    
+    # 创建预加载提示表，保存分析入口页面得到的关键子资源（JSON）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS preload_hints (
+            alias TEXT PRIMARY KEY,
+            hints TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建资源优化报告表，记录每个游戏最近一次优化节省的字节数
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS optimization_reports (
+            alias TEXT PRIMARY KEY,
+            files INTEGER NOT NULL,
+            optimized INTEGER NOT NULL,
+            bytes_before INTEGER NOT NULL,
+            bytes_after INTEGER NOT NULL,
+            webp_files INTEGER NOT NULL,
+            webp_bytes INTEGER NOT NULL,
+            optimized_time TIMESTAMP NOT NULL
+        )
+    ''')
+    
+    # 创建游戏热度统计表，由服务器定期批量累加游玩次数和发送字节数
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_stats (
+            alias TEXT PRIMARY KEY,
+            play_count INTEGER NOT NULL DEFAULT 0,
+            bytes_served INTEGER NOT NULL DEFAULT 0,
+            last_played TIMESTAMP
+        )
+    ''')
+    
+    # 创建ZIP下载布局表，缓存每个文件的CRC和压缩后大小（JSON），文件清单变化后重新生成
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS zip_layouts (
+            alias TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            layout TEXT NOT NULL
+        )
+    ''')
+    
+    # 创建目录变更记录表，供其他节点增量同步
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            alias TEXT NOT NULL,
+            op TEXT NOT NULL,
+            change_time TIMESTAMP NOT NULL
+        )
+    ''')
+    
+    # 为变更记录出现之前已存在的游戏补充记录
+    cursor.execute('''
+        INSERT INTO catalog_changes (alias, op, change_time)
+        SELECT alias, 'upsert', upload_time FROM games
+        WHERE alias NOT IN (SELECT alias FROM catalog_changes)
+    ''')
+    
+    # 记录结构版本，之后启动时只需检查版本号
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
     conn.commit()
     conn.close()
 
+def ensure_db():
+    """
+    数据库结构版本低于当前版本（包括新建的数据库）时执行 init_db，否则不做任何修改
+    """
+    conn = sqlite3.connect(DB_PATH)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.close()
+    if version < SCHEMA_VERSION:
+        init_db()
+
 def add_game(name, alias, path):
     """
     添加游戏到数据库
@@ -60,6 +151,7 @@ def add_game(name, alias, path):
             INSERT INTO games (name, alias, upload_time, path)
             VALUES (?, ?, ?, ?)
         ''', (name, alias, datetime.now(), path))
+        record_change(cursor, alias, 'upsert')
         
         conn.commit()
         conn.close()
@@ -70,6 +162,40 @@ def add_game(name, alias, path):
     except Exception:
         return False
 
+def add_games(games):
+    """
+    在一个事务中批量添加游戏及其文件清单
+    
+    Args:
+        games (list): 字典列表（name, alias, path, files）
+    
+    Returns:
+        list: 成功添加的游戏别名，别名已存在的游戏被跳过
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    added = []
+    try:
+        for game in games:
+            cursor.execute('''
+                INSERT OR IGNORE INTO games (name, alias, upload_time, path)
+                VALUES (?, ?, ?, ?)
+            ''', (game['name'], game['alias'], datetime.now(), game['path']))
+            if cursor.rowcount == 0:
+                continue
+            cursor.execute('DELETE FROM game_files WHERE alias = ?', (game['alias'],))
+            cursor.executemany('''
+                INSERT INTO game_files (alias, path, size, mtime, sha256)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(game['alias'], f['path'], f['size'], f['mtime'], f['sha256']) for f in game['files']])
+            record_change(cursor, game['alias'], 'upsert')
+            added.append(game['alias'])
+        conn.commit()
+    finally:
+        conn.close()
+    return added
+
 def get_all_games():
     """
     获取所有游戏信息
@@ -87,6 +213,51 @@ def get_all_games():
     conn.close()
     return games
 
+def search_games(query='', limit=100, offset=0, order='recent'):
+    """
+    分页查询游戏，按别名或名称前缀搜索（不区分大小写）
+    
+    前缀匹配可以使用别名和名称上的索引，大量游戏时也不需要全表扫描。
+    
+    Args:
+        query (str): 搜索内容，为空时返回全部游戏
+        limit (int): 最多返回的条数，-1表示不限
+        offset (int): 跳过的条数
+        order (str): 'recent' 按上传时间降序，'popular' 按游玩次数降序
+    
+    Returns:
+        list: (alias, name, upload_time, play_count, bytes_served) 列表
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    if order == 'popular':
+        order_by = 'play_count DESC, bytes_served DESC, g.upload_time DESC'
+    else:
+        order_by = 'g.upload_time DESC'
+    sql = '''
+        SELECT g.alias, g.name, g.upload_time,
+               COALESCE(s.play_count, 0) AS play_count, COALESCE(s.bytes_served, 0) AS bytes_served
+        FROM games g LEFT JOIN game_stats s ON s.alias = g.alias
+    '''
+    if query:
+        # 转义LIKE通配符，只做前缀匹配
+        pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        cursor.execute(sql + f'''
+            WHERE g.alias LIKE ? ESCAPE '\\' OR g.name LIKE ? ESCAPE '\\'
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+        ''', (pattern, pattern, limit, offset))
+    else:
+        cursor.execute(sql + f'''
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+        ''', (limit, offset))
+    games = cursor.fetchall()
+    
+    conn.close()
+    return games
+
 def get_game_by_alias(alias):
     """
     根据别名获取游戏信息
@@ -129,10 +300,18 @@ def delete_game(alias):
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM games WHERE alias = ?', (alias,))
+        deleted = cursor.rowcount > 0
+        cursor.execute('DELETE FROM game_files WHERE alias = ?', (alias,))
+        cursor.execute('DELETE FROM preload_hints WHERE alias = ?', (alias,))
+        cursor.execute('DELETE FROM optimization_reports WHERE alias = ?', (alias,))
+        cursor.execute('DELETE FROM game_stats WHERE alias = ?', (alias,))
+        cursor.execute('DELETE FROM zip_layouts WHERE alias = ?', (alias,))
+        if deleted:
+            record_change(cursor, alias, 'delete')
         
         conn.commit()
         conn.close()
-        return cursor.rowcount > 0
+        return deleted
     except Exception:
         return False
 
@@ -168,4 +347,467 @@ def set_domain(domain):
     cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('domain', domain))
     
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+def get_setting(key, default=None):
+    """
+    获取设置项
+    
+    Args:
+        key (str): 设置项名称
+        default: 设置项不存在时返回的默认值
+    
+    Returns:
+        str: 设置值
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+    result = cursor.fetchone()
+    
+    conn.close()
+    
+    if result:
+        return result[0]
+    return default
+
+def parse_setting(value, default):
+    """
+    把设置值转换为默认值的类型
+    
+    整数类型的设置项也接受 "3.0" 这样值为整数的小数写法。
+    
+    Args:
+        value (str): 设置值
+        default: 默认值，决定转换后的类型
+    
+    Returns:
+        转换后的值
+    
+    Raises:
+        ValueError: 无法转换
+    """
+    if isinstance(default, bool) or not isinstance(default, (int, float)):
+        return type(default)(value)
+    if isinstance(default, float):
+        return float(value)
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{value} is not an integer")
+        return int(number)
+
+def load_typed_settings(defaults, log=print):
+    """
+    读取一组设置项，按各自默认值的类型转换
+    
+    Args:
+        defaults (dict): 设置项名称到默认值的映射
+        log (callable): 设置值无效时输出警告的函数
+    
+    Returns:
+        dict: 设置项名称到值的映射；未设置或无效的项使用默认值
+    """
+    stored = dict(get_all_settings())
+    values = {}
+    for key, default in defaults.items():
+        value = stored.get(key)
+        if value is None:
+            values[key] = default
+            continue
+        try:
+            values[key] = parse_setting(value, default)
+        except (TypeError, ValueError):
+            log(f"Warning: Invalid value {value!r} for setting '{key}', using default {default!r}")
+            values[key] = default
+    return values
+
+def get_all_settings():
+    """
+    获取所有设置项
+    
+    Returns:
+        list: (key, value) 列表
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT key, value FROM settings ORDER BY key')
+    settings = cursor.fetchall()
+    
+    conn.close()
+    return settings
+
+def set_setting(key, value):
+    """
+    保存设置项
+    
+    Args:
+        key (str): 设置项名称
+        value (str): 设置值
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
+    
+    conn.commit()
+    conn.close()
+
+def record_change(cursor, alias, op):
+    """
+    在当前事务中记录一条目录变更
+    
+    Args:
+        cursor (sqlite3.Cursor): 数据库游标
+        alias (str): 游戏别名
+        op (str): 'upsert' 或 'delete'
+    """
+    cursor.execute('''
+        INSERT INTO catalog_changes (alias, op, change_time)
+        VALUES (?, ?, ?)
+    ''', (alias, op, datetime.now()))
+
+def upsert_game(name, alias, upload_time, path):
+    """
+    添加或更新游戏信息（用于从其他节点同步）
+    
+    Args:
+        name (str): 游戏名
+        alias (str): 游戏别名
+        upload_time (str): 源节点上的上传时间
+        path (str): 游戏文件路径
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT INTO games (name, alias, upload_time, path)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(alias) DO UPDATE SET
+            name = excluded.name,
+            upload_time = excluded.upload_time,
+            path = excluded.path
+    ''', (name, alias, upload_time, path))
+    record_change(cursor, alias, 'upsert')
+    
+    conn.commit()
+    conn.close()
+
+def get_game_files(alias):
+    """
+    获取游戏的文件清单
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 文件信息字典列表（path, size, mtime, sha256），按路径排序
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT path, size, mtime, sha256 FROM game_files
+        WHERE alias = ? ORDER BY path
+    ''', (alias,))
+    rows = cursor.fetchall()
+    
+    conn.close()
+    return [
+        {'path': row[0], 'size': row[1], 'mtime': row[2], 'sha256': row[3]}
+        for row in rows
+    ]
+
+def set_game_files(alias, files, changed=False):
+    """
+    替换游戏的文件清单
+    
+    Args:
+        alias (str): 游戏别名
+        files (list): 文件信息字典列表（path, size, mtime, sha256）
+        changed (bool): 已发布的游戏文件被修改时为True，同时记录目录变更，其他节点会重新同步
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('DELETE FROM game_files WHERE alias = ?', (alias,))
+    cursor.executemany('''
+        INSERT INTO game_files (alias, path, size, mtime, sha256)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(alias, f['path'], f['size'], f['mtime'], f['sha256']) for f in files])
+    if changed:
+        record_change(cursor, alias, 'upsert')
+    
+    conn.commit()
+    conn.close()
+
+def update_game_files(alias, files, removed):
+    """
+    只更新游戏文件清单中变化的条目，并记录目录变更，其他节点会重新同步
+    
+    Args:
+        alias (str): 游戏别名
+        files (list): 新增或修改的文件信息字典列表（path, size, mtime, sha256）
+        removed (list): 已删除的文件路径列表
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.executemany('DELETE FROM game_files WHERE alias = ? AND path = ?', [(alias, path) for path in removed])
+    cursor.executemany('''
+        INSERT OR REPLACE INTO game_files (alias, path, size, mtime, sha256)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(alias, f['path'], f['size'], f['mtime'], f['sha256']) for f in files])
+    record_change(cursor, alias, 'upsert')
+    
+    conn.commit()
+    conn.close()
+
+def get_preload_hints(alias):
+    """
+    获取游戏的预加载提示
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 预加载提示字典列表，尚未分析过时返回None
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT hints FROM preload_hints WHERE alias = ?', (alias,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def set_preload_hints(alias, hints):
+    """
+    保存游戏的预加载提示
+    
+    Args:
+        alias (str): 游戏别名
+        hints (list): 预加载提示字典列表
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO preload_hints (alias, hints) VALUES (?, ?)
+    ''', (alias, json.dumps(hints, ensure_ascii=False)))
+    
+    conn.commit()
+    conn.close()
+
+def get_zip_layout(alias):
+    """
+    获取缓存的ZIP下载布局
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        tuple: (文件清单摘要, 布局JSON)，没有缓存时返回None
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT digest, layout FROM zip_layouts WHERE alias = ?', (alias,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    return row
+
+def set_zip_layout(alias, digest, layout):
+    """
+    保存ZIP下载布局
+    
+    Args:
+        alias (str): 游戏别名
+        digest (str): 生成布局时的文件清单摘要
+        layout (str): 布局JSON
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO zip_layouts (alias, digest, layout) VALUES (?, ?, ?)
+    ''', (alias, digest, layout))
+    
+    conn.commit()
+    conn.close()
+
+def get_optimization_report(alias):
+    """
+    获取游戏最近一次的资源优化报告
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        dict: 优化报告，尚未优化过时返回None
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT files, optimized, bytes_before, bytes_after, webp_files, webp_bytes, optimized_time
+        FROM optimization_reports WHERE alias = ?
+    ''', (alias,))
+    row = cursor.fetchone()
+    
+    conn.close()
+    if row is None:
+        return None
+    keys = ('files', 'optimized', 'bytes_before', 'bytes_after', 'webp_files', 'webp_bytes', 'optimized_time')
+    return dict(zip(keys, row))
+
+def set_optimization_report(alias, report):
+    """
+    保存游戏的资源优化报告
+    
+    Args:
+        alias (str): 游戏别名
+        report (dict): 优化报告（files, optimized, bytes_before, bytes_after, webp_files, webp_bytes）
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO optimization_reports
+            (alias, files, optimized, bytes_before, bytes_after, webp_files, webp_bytes, optimized_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (alias, report['files'], report['optimized'], report['bytes_before'], report['bytes_after'],
+          report['webp_files'], report['webp_bytes'], datetime.now()))
+    
+    conn.commit()
+    conn.close()
+
+def add_game_stats(counts):
+    """
+    在一个事务中累加多个游戏的热度统计
+    
+    Args:
+        counts (dict): 游戏别名到 (游玩次数, 发送字节数) 的映射
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    now = datetime.now()
+    try:
+        cursor.executemany('''
+            INSERT INTO game_stats (alias, play_count, bytes_served, last_played)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(alias) DO UPDATE SET
+                play_count = play_count + excluded.play_count,
+                bytes_served = bytes_served + excluded.bytes_served,
+                last_played = COALESCE(excluded.last_played, last_played)
+        ''', [(alias, plays, nbytes, now if plays else None) for alias, (plays, nbytes) in counts.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_catalog_version():
+    """
+    获取最新的目录变更序号，用于判断游戏目录是否变化
+    
+    Returns:
+        int: 最新的变更序号，没有变更记录时返回0
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT MAX(seq) FROM catalog_changes')
+    seq = cursor.fetchone()[0]
+    
+    conn.close()
+    return seq or 0
+
+def get_changes_since(seq, limit=100):
+    """
+    获取指定序号之后的目录变更，每个游戏只返回最新的一条
+    
+    Args:
+        seq (int): 上次同步到的变更序号
+        limit (int): 最多返回的条数
+    
+    Returns:
+        list: (seq, alias, op) 列表，按序号升序
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT c.seq, c.alias, c.op FROM catalog_changes c
+        JOIN (
+            SELECT alias, MAX(seq) AS seq FROM catalog_changes
+            WHERE seq > ? GROUP BY alias
+        ) latest ON latest.seq = c.seq
+        ORDER BY c.seq
+        LIMIT ?
+    ''', (seq, limit))
+    changes = cursor.fetchall()
+    
+    conn.close()
+    return changes
+
+def backup_db(target_path):
+    """
+    使用SQLite备份API把数据库复制到指定文件，得到一致的快照（备份期间其他连接可以继续读写）
+    
+    Args:
+        target_path (str): 备份文件路径
+    """
+    source = sqlite3.connect(DB_PATH)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def read_catalog(db_path=DB_PATH):
+    """
+    读取数据库中所有游戏的文件清单
+    
+    Args:
+        db_path (str): 数据库文件路径，可以是备份或快照中的数据库
+    
+    Returns:
+        dict: 游戏别名到文件信息字典列表（path, size, mtime, sha256）的映射，没有文件的游戏对应空列表
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT alias FROM games ORDER BY alias')
+    catalog = {row[0]: [] for row in cursor.fetchall()}
+    cursor.execute('SELECT alias, path, size, mtime, sha256 FROM game_files ORDER BY alias, path')
+    for alias, path, size, mtime, sha256 in cursor.fetchall():
+        if alias in catalog:
+            catalog[alias].append({'path': path, 'size': size, 'mtime': mtime, 'sha256': sha256})
+    
+    conn.close()
+    return catalog
+
+def check_db_integrity(db_path=DB_PATH):
+    """
+    检查数据库文件是否完好
+    
+    Args:
+        db_path (str): 数据库文件路径
+    
+    Returns:
+        str: 检查结果，完好时为 "ok"
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
\ No newline at end of file
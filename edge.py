@@ -0,0 +1,342 @@
+"""
+GalHub - 边缘缓存模块
+本地没有的游戏文件从上游GalHub源站拉取，边转发边写入有容量上限的本地磁盘缓存
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+# 默认缓存目录
+CACHE_DIR = "cache"
+# 默认缓存容量（字节）
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# 缓存条目在多少秒内直接使用，超过后用ETag向源站重新验证
+REVALIDATE_AFTER = 60
+# 请求源站的超时时间（秒）
+UPSTREAM_TIMEOUT = 30
+# 从源站读取时每次读取的块大小
+CHUNK_SIZE = 64 * 1024
+
+class EdgeError(Exception):
+    """源站请求失败且没有可用的缓存副本"""
+
+class EdgeResponse:
+    """
+    边缘缓存的响应
+
+    Attributes:
+        status (int): 200 或 404
+        meta (dict): 缓存条目信息（content_type, size, etag）
+        body: 可读取响应内容的文件对象，使用完毕后必须调用close()
+        source (str): HIT、MISS、REVALIDATED 或 STALE
+    """
+    def __init__(self, status, meta=None, body=None, source="MISS"):
+        self.status = status
+        self.meta = meta or {}
+        self.body = body
+        self.source = source
+
+class TeeReader:
+    """
+    后台线程把源站响应写入缓存临时文件，客户端从临时文件中读取已写入的部分
+
+    写入完成后立即登记缓存条目并唤醒等待同一对象的其他请求，不受第一个客户端读取速度（如被限速）的影响；
+    客户端中途断开也不影响缓存。
+    """
+    def __init__(self, cache, key, response, meta):
+        self.cache = cache
+        self.key = key
+        self.response = response
+        self.meta = meta
+        self.tmp_path = cache.data_path(key) + ".tmp"
+        self.tmp_file = open(self.tmp_path, "wb")
+        # 客户端读取的文件：写入完成前为临时文件，登记后为缓存文件
+        self.path = self.tmp_path
+        self.reader = None
+        self.position = 0
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+        threading.Thread(target=self.fill, name="edge-fill", daemon=True).start()
+
+    def fill(self):
+        """在后台线程中读取源站响应并写入缓存"""
+        try:
+            try:
+                while True:
+                    chunk = self.response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.tmp_file.write(chunk)
+                    # 客户端用另一个文件对象读取，写入的内容需要立即可见
+                    self.tmp_file.flush()
+                    with self.condition:
+                        self.size += len(chunk)
+                        self.condition.notify_all()
+            finally:
+                self.tmp_file.close()
+                self.response.close()
+            expected = self.meta.get("size")
+            if expected is not None and expected != self.size:
+                raise EdgeError(f"truncated upstream response: {self.size}/{expected} bytes")
+            self.meta["size"] = self.size
+            # 客户端读取时也持有此锁；Windows上打开的文件不能改名，先关闭读取用的文件对象，下次读取时重新打开
+            with self.condition:
+                self.close_reader()
+                self.cache.commit(self.key, self.tmp_path, self.meta)
+                self.path = self.cache.data_path(self.key)
+        except Exception as e:
+            with self.condition:
+                self.close_reader()
+                self.error = e
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            if self.cache.log:
+                self.cache.log(f"Edge cache fill failed: {self.key} - {str(e)}")
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+            self.cache.release(self.key)
+
+    def read(self, size=CHUNK_SIZE):
+        with self.condition:
+            while self.position >= self.size and not self.done:
+                self.condition.wait()
+            if self.error is not None:
+                raise EdgeError(f"upstream fetch failed: {self.error}")
+            if self.position >= self.size:
+                return b""
+            if self.reader is None:
+                try:
+                    self.reader = open(self.path, "rb")
+                except OSError:
+                    # 登记后立即被淘汰（对象大于缓存上限）
+                    raise EdgeError(f"cache entry vanished: {self.key}")
+                self.reader.seek(self.position)
+            chunk = self.reader.read(min(size, self.size - self.position))
+            self.position += len(chunk)
+            return chunk
+
+    def close_reader(self):
+        # 调用方需持有 self.condition
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def close(self):
+        with self.condition:
+            self.close_reader()
+
+class EdgeCache:
+    """
+    边缘节点的磁盘缓存
+
+    同一对象的并发未命中只向源站发起一次请求，其余请求等待其完成后从本地缓存读取。
+    缓存总大小超过上限时按最近最少使用的顺序淘汰。
+    """
+    def __init__(self, upstream, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES,
+                 revalidate_after=REVALIDATE_AFTER, timeout=UPSTREAM_TIMEOUT, log=None):
+        self.upstream = upstream.rstrip("/")
+        self.log = log
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.timeout = timeout
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.load_index()
+
+    def data_path(self, key):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    def load_index(self):
+        """启动时从缓存目录的元数据文件恢复索引，清理未完成的临时文件"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if filename.endswith(".tmp"):
+                os.remove(path)
+            elif filename.endswith(".json"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                    if os.path.getsize(self.data_path(meta["key"])) != meta["size"]:
+                        raise ValueError("size mismatch")
+                    entries.append(meta)
+                except (OSError, ValueError, KeyError):
+                    os.remove(path)
+        entries.sort(key=lambda meta: meta.get("checked_at", 0))
+        for meta in entries:
+            self.index[meta["key"]] = meta
+            self.total_bytes += meta["size"]
+        self.evict()
+
+    def open(self, key):
+        """
+        获取缓存对象，未命中时向源站请求
+
+        Args:
+            key (str): 对象路径，如 "alias/js/main.js"
+
+        Returns:
+            EdgeResponse: 响应
+
+        Raises:
+            EdgeError: 源站不可用且没有缓存副本
+        """
+        while True:
+            with self.lock:
+                meta = self.index.get(key)
+                if meta and time.time() - meta["checked_at"] < self.revalidate_after:
+                    self.index.move_to_end(key)
+                    self.hits += 1
+                    return self.open_local(key, meta, "HIT")
+                event = self.inflight.get(key)
+                if event is None:
+                    self.inflight[key] = threading.Event()
+                    break
+            # 其他请求正在拉取同一对象，等待其完成后重新检查缓存
+            event.wait(self.timeout)
+
+        try:
+            return self.fetch(key, meta)
+        except BaseException:
+            self.release(key)
+            raise
+
+    def fetch(self, key, meta):
+        """向源站请求对象，调用方已占有该对象的拉取权"""
+        request = urllib.request.Request(f"{self.upstream}/{key}")
+        if meta and meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and meta:
+                with self.lock:
+                    meta["checked_at"] = time.time()
+                    self.revalidated += 1
+                self.write_meta(meta)
+                self.release(key)
+                return self.open_local(key, meta, "REVALIDATED")
+            if e.code == 404:
+                self.remove(key)
+                self.release(key)
+                return EdgeResponse(404)
+            if meta:
+                self.release(key)
+                return self.open_local(key, meta, "STALE")
+            raise EdgeError(f"upstream returned {e.code}")
+        except OSError as e:
+            # 源站不可达时继续使用过期的缓存副本
+            if meta:
+                self.release(key)
+                return self.open_local(key, meta, "STALE")
+            raise EdgeError(f"upstream unreachable: {e}")
+
+        length = response.headers.get("Content-Length")
+        new_meta = {
+            "key": key,
+            "etag": response.headers.get("ETag"),
+            "content_type": response.headers.get("Content-Type", "application/octet-stream"),
+            "size": int(length) if length is not None else None,
+        }
+        with self.lock:
+            self.misses += 1
+        return EdgeResponse(200, new_meta, TeeReader(self, key, response, new_meta), "MISS")
+
+    def open_local(self, key, meta, source):
+        try:
+            body = open(self.data_path(key), "rb")
+        except OSError:
+            # 文件已被淘汰或删除，下次请求重新拉取
+            self.remove(key)
+            raise EdgeError(f"cache entry vanished: {key}")
+        return EdgeResponse(200, meta, body, source)
+
+    def commit(self, key, tmp_path, meta):
+        """把拉取完成的临时文件登记为缓存条目"""
+        meta["checked_at"] = time.time()
+        os.replace(tmp_path, self.data_path(key))
+        self.write_meta(meta)
+        with self.lock:
+            old = self.index.pop(key, None)
+            if old:
+                self.total_bytes -= old["size"]
+            self.index[key] = meta
+            self.total_bytes += meta["size"]
+        self.evict()
+
+    def write_meta(self, meta):
+        with open(self.data_path(meta["key"]) + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def release(self, key):
+        """释放对象的拉取权并唤醒等待的请求"""
+        with self.lock:
+            event = self.inflight.pop(key, None)
+        if event:
+            event.set()
+
+    def remove(self, key):
+        with self.lock:
+            meta = self.index.pop(key, None)
+            if meta:
+                self.total_bytes -= meta["size"]
+        if meta:
+            self.delete_files(key)
+
+    def delete_files(self, key):
+        for path in (self.data_path(key), self.data_path(key) + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """淘汰最久未使用的条目，直到缓存总大小不超过上限"""
+        victims = []
+        with self.lock:
+            while self.total_bytes > self.max_bytes and len(self.index) > 1:
+                key, meta = self.index.popitem(last=False)
+                self.total_bytes -= meta["size"]
+                self.evictions += 1
+                victims.append(key)
+        for key in victims:
+            self.delete_files(key)
+
+    def get_stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中、未命中、重新验证、淘汰次数及缓存占用
+        """
+        with self.lock:
+            return {
+                "upstream": self.upstream,
+                "entries": len(self.index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "inflight": len(self.inflight),
+            }
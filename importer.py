@@ -0,0 +1,237 @@
+"""
+GalHub - 批量导入模块
+按CSV清单或目录批量导入游戏，并行复制文件，复制完成后在一个事务中写入游戏目录
+"""
+
+import csv
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from database import add_games, get_all_games
+from manager import GAMES_ROOT, is_valid_alias, copy_game_files, record_preload_hints
+
+# 默认并行复制的游戏数
+DEFAULT_WORKERS = 4
+# 导入中的游戏先复制到暂存目录，全部完成后再移动到游戏目录
+STAGING_DIR = os.path.join(GAMES_ROOT, ".import")
+
+def read_manifest(manifest_path):
+    """
+    读取CSV清单
+
+    清单需包含 name, alias, path 三列，相对路径以清单文件所在目录为基准。
+
+    Args:
+        manifest_path (str): 清单文件路径
+
+    Returns:
+        list: 字典列表（name, alias, path）
+
+    Raises:
+        ValueError: 清单缺少必需的列
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    with open(manifest_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = {"name", "alias", "path"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"manifest is missing column(s): {', '.join(sorted(missing))}")
+        for row in reader:
+            path = (row["path"] or "").strip()
+            entries.append({
+                "name": (row["name"] or "").strip(),
+                "alias": (row["alias"] or "").strip(),
+                "path": os.path.join(base_dir, path) if path else "",
+            })
+    return entries
+
+def scan_directory(scan_dir):
+    """
+    把目录下的每个子目录作为一个游戏，目录名同时作为游戏名和别名
+
+    Args:
+        scan_dir (str): 要扫描的目录
+
+    Returns:
+        list: 字典列表（name, alias, path）
+    """
+    entries = []
+    for dirname in sorted(os.listdir(scan_dir)):
+        path = os.path.join(scan_dir, dirname)
+        if os.path.isdir(path) and not dirname.startswith("."):
+            entries.append({"name": dirname, "alias": dirname, "path": path})
+    return entries
+
+def get_staging_path(alias):
+    return os.path.join(STAGING_DIR, alias)
+
+def load_staged(alias, source_path):
+    """读取已复制完成的暂存记录，来源不同或记录损坏时返回None"""
+    try:
+        with open(get_staging_path(alias) + ".json", "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if record.get("source") != os.path.abspath(source_path):
+        return None
+    return record
+
+def stage_game(entry):
+    """
+    把一个游戏复制到暂存目录
+
+    复制完成后写入记录文件，中断后重新导入时直接复用，未完成的暂存目录会被重新复制。
+
+    Returns:
+        tuple: (文件清单, 是否复用了上次的复制结果)
+    """
+    alias = entry["alias"]
+    record = load_staged(alias, entry["path"])
+    if record is not None:
+        return record["files"], True
+
+    staged = get_staging_path(alias)
+    if os.path.exists(staged):
+        shutil.rmtree(staged)
+    files = copy_game_files(entry["path"], staged)
+
+    record_path = staged + ".json"
+    with open(record_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(entry["path"]), "files": files}, f, ensure_ascii=False)
+    os.replace(record_path + ".tmp", record_path)
+    return files, False
+
+def check_entries(entries):
+    """
+    检查清单条目
+
+    Returns:
+        tuple: (待导入的条目, 已导入的别名列表, (别名, 原因) 失败列表)
+    """
+    existing = {game[0] for game in get_all_games()}
+    pending, skipped, failures = [], [], []
+    seen = set()
+    for number, entry in enumerate(entries, 1):
+        alias = entry["alias"]
+        if not entry["name"] or not alias or not entry["path"]:
+            failures.append((alias or f"row {number}", "name, alias and path are required"))
+        elif not is_valid_alias(alias):
+            failures.append((alias, "invalid alias"))
+        elif alias in seen:
+            failures.append((alias, "duplicate alias in manifest"))
+        elif alias in existing:
+            skipped.append(alias)
+        elif not os.path.exists(entry["path"]):
+            failures.append((alias, f"source path does not exist: {entry['path']}"))
+        elif os.path.exists(os.path.join(GAMES_ROOT, alias)) and load_staged(alias, entry["path"]) is None:
+            failures.append((alias, "target directory already exists"))
+        else:
+            pending.append(entry)
+        seen.add(alias)
+    return pending, skipped, failures
+
+def publish_games(staged):
+    """
+    把暂存的游戏移动到游戏目录，并在一个事务中写入数据库
+
+    Returns:
+        tuple: (成功导入的别名列表, (别名, 原因) 失败列表)
+    """
+    games, failures = [], []
+    for game in staged:
+        alias = game["alias"]
+        source = get_staging_path(alias)
+        target = os.path.join(GAMES_ROOT, alias)
+        try:
+            if os.path.exists(source):
+                os.replace(source, target)
+            elif not os.path.isdir(target):
+                # 上次中断在移动之后、写入数据库之前时，文件已在游戏目录中
+                raise FileNotFoundError("staged files are missing")
+        except OSError as e:
+            failures.append((alias, str(e)))
+            continue
+        games.append({"name": game["name"], "alias": alias, "path": target, "files": game["files"]})
+
+    added = add_games(games)
+    for alias in added:
+        os.remove(get_staging_path(alias) + ".json")
+        record_preload_hints(alias)
+    for game in games:
+        if game["alias"] not in added:
+            failures.append((game["alias"], "alias already exists"))
+    return added, failures
+
+def import_games(entries, workers=DEFAULT_WORKERS):
+    """
+    批量导入游戏
+
+    单个游戏失败不影响其他游戏，中断或失败后重新运行同一命令即可继续。
+
+    Args:
+        entries (list): 字典列表（name, alias, path）
+        workers (int): 并行复制的游戏数
+
+    Returns:
+        bool: 全部导入成功返回True，否则返回False
+    """
+    started = time.monotonic()
+    pending, skipped, failures = check_entries(entries)
+    print(f"Importing {len(pending)} game(s) with {workers} worker(s), "
+          f"{len(skipped)} already imported, {len(failures)} invalid")
+
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    staged = []
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(stage_game, entry): entry for entry in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            entry = futures[future]
+            try:
+                files, reused = future.result()
+            except Exception as e:
+                failures.append((entry["alias"], str(e)))
+                print(f"[{count}/{len(pending)}] {entry['alias']}: failed: {e}")
+                continue
+            nbytes = sum(f["size"] for f in files)
+            if not reused:
+                total_bytes += nbytes
+            print(f"[{count}/{len(pending)}] {entry['alias']}: {len(files)} file(s), {nbytes} bytes"
+                  f"{' (copied earlier)' if reused else ''}")
+            staged.append(dict(entry, files=files))
+
+    try:
+        added, publish_failures = publish_games(staged)
+    except Exception as e:
+        print(f"Error: Failed to write the catalog: {e}")
+        print("Copied files are kept; run the same command again to retry")
+        return False
+    failures.extend(publish_failures)
+    if not os.listdir(STAGING_DIR):
+        os.rmdir(STAGING_DIR)
+
+    print(f"\nImport finished in {time.monotonic() - started:.1f}s: {len(added)} imported, "
+          f"{len(skipped)} already present, {len(failures)} failed, {total_bytes} bytes copied")
+    for alias, reason in failures:
+        print(f"  {alias}: {reason}")
+    if failures:
+        print("Fix the errors above and run the same command again to import the remaining games")
+    return not failures
+
+def run_import(manifest=None, scan_dir=None, workers=DEFAULT_WORKERS):
+    """
+    从CSV清单或目录批量导入游戏
+
+    Returns:
+        bool: 全部导入成功返回True，否则返回False
+    """
+    try:
+        entries = read_manifest(manifest) if manifest else scan_directory(scan_dir)
+    except (OSError, ValueError) as e:
+        print(f"Error: Failed to read import list: {e}")
+        return False
+    return import_games(entries, workers)
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+GalHub - 日志文件模块
+按日期和大小切分服务器日志，在后台压缩切分出的日志段，并按保留天数和总大小清理旧日志
+"""
+
+import gzip
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta
+from database import load_typed_settings
+
+# 日志目录
+LOGS_DIR = "logs"
+
+# 设置表中的日志配置项，值为0表示不限制
+LOG_SETTINGS = {
+    'log_max_bytes': 100 * 1024 * 1024,          # 单个日志段的大小上限，超过后切分出新的日志段
+    'log_retention_days': 30,                    # 日志保留天数
+    'log_retention_bytes': 2 * 1024 * 1024 * 1024,  # 日志目录的总大小上限
+}
+
+# 日志文件名：server_2024-01-01.log 为当天正在写入的日志段，
+# server_2024-01-01.2.log.gz 为当天切分出的第2段（已压缩）
+LOG_FILE_PATTERN = re.compile(r'^server_(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.log(\.gz)?$')
+# 压缩时每次读取的块大小
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+def parse_log_filename(filename):
+    """
+    解析日志文件名
+
+    Returns:
+        tuple: (日期, 段编号) ，当天正在写入或某天最后一段的编号为None；不是日志文件时返回None
+    """
+    match = LOG_FILE_PATTERN.match(filename)
+    if not match:
+        return None
+    date, segment, _ = match.groups()
+    return date, int(segment) if segment else None
+
+def list_log_files(logs_dir=LOGS_DIR, start_date=None, end_date=None):
+    """
+    获取日志文件，按时间先后排序
+
+    同一天中编号的日志段在前，未编号的日志段（最后写入的一段）在最后。
+    压缩过程中原文件和压缩文件可能同时存在，此时只返回原文件。
+
+    Args:
+        logs_dir (str): 日志目录
+        start_date (str): 开始日期 YYYY-MM-DD，None表示不限
+        end_date (str): 结束日期 YYYY-MM-DD，None表示不限
+
+    Returns:
+        list: 日志文件路径列表
+    """
+    if not os.path.isdir(logs_dir):
+        return []
+    filenames = set(os.listdir(logs_dir))
+    entries = []
+    for filename in filenames:
+        parsed = parse_log_filename(filename)
+        if parsed is None:
+            continue
+        date, segment = parsed
+        if start_date and date < start_date:
+            continue
+        if end_date and date > end_date:
+            continue
+        if filename.endswith('.gz') and filename[:-3] in filenames:
+            continue
+        entries.append(((date, segment if segment is not None else float('inf')), filename))
+    entries.sort()
+    return [os.path.join(logs_dir, filename) for _, filename in entries]
+
+def open_log(path):
+    """
+    以二进制方式打开日志文件，.gz 日志段透明解压
+
+    Returns:
+        file: 可按行迭代的文件对象
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def compress_file(path):
+    """把日志段压缩为 .gz 文件并删除原文件"""
+    gz_path = path + '.gz'
+    tmp_path = gz_path + '.tmp'
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COMPRESS_CHUNK_SIZE)
+    shutil.copystat(path, tmp_path)
+    os.replace(tmp_path, gz_path)
+    os.remove(path)
+
+def enforce_retention(logs_dir, retention_days, retention_bytes, keep=None):
+    """
+    删除超过保留天数的日志，总大小仍超过上限时从最旧的日志开始删除
+
+    Args:
+        logs_dir (str): 日志目录
+        retention_days (int): 保留天数，0表示不限
+        retention_bytes (int): 总大小上限，0表示不限
+        keep (str): 不删除的文件（当前正在写入的日志段）
+
+    Returns:
+        list: 删除的文件路径
+    """
+    files = []
+    for path in list_log_files(logs_dir):
+        try:
+            files.append((path, os.path.getsize(path)))
+        except OSError:
+            pass
+
+    removed = []
+    if retention_days:
+        oldest = (datetime.now() - timedelta(days=retention_days - 1)).strftime("%Y-%m-%d")
+        for path, size in files:
+            if path != keep and parse_log_filename(os.path.basename(path))[0] < oldest:
+                removed.append(path)
+    if retention_bytes:
+        total = sum(size for path, size in files if path not in removed)
+        for path, size in files:
+            if total <= retention_bytes:
+                break
+            if path != keep and path not in removed:
+                removed.append(path)
+                total -= size
+
+    for path in removed:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return removed
+
+class LogWriter:
+    """
+    写入服务器日志并按日期和大小切分
+
+    每条日志都以追加方式重新打开文件写入，热重启期间新旧两个进程可以同时写入同一日志文件。
+    切分出的日志段和之前日期的日志在后台线程中压缩，压缩后按保留设置清理旧日志。
+    """
+    def __init__(self, logs_dir=LOGS_DIR, max_bytes=LOG_SETTINGS['log_max_bytes'],
+                 retention_days=LOG_SETTINGS['log_retention_days'],
+                 retention_bytes=LOG_SETTINGS['log_retention_bytes']):
+        self.logs_dir = logs_dir
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        self.current_date = None
+        self.maintenance_thread = None
+        self.maintenance_pending = False
+        self.lock = threading.Lock()
+
+    def get_active_path(self, date):
+        return os.path.join(self.logs_dir, f"server_{date}.log")
+
+    def write(self, line):
+        """
+        追加一行日志，调用方负责串行化同一进程内的写入
+
+        Args:
+            line (str): 日志内容（不含换行符）
+        """
+        date = datetime.now().strftime("%Y-%m-%d")
+        if date != self.current_date:
+            # 刚启动或日期变化：压缩之前遗留的日志段
+            os.makedirs(self.logs_dir, exist_ok=True)
+            self.current_date = date
+            self.schedule_maintenance()
+        path = self.get_active_path(date)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            size = f.tell()
+        if self.max_bytes and size >= self.max_bytes:
+            self.rotate(path, date)
+
+    def rotate(self, path, date):
+        """把当前日志段改名为下一个编号的日志段，之后的日志写入新文件"""
+        numbers = [0]
+        for filename in os.listdir(self.logs_dir):
+            parsed = parse_log_filename(filename)
+            if parsed and parsed[0] == date and parsed[1] is not None:
+                numbers.append(parsed[1])
+        try:
+            os.rename(path, os.path.join(self.logs_dir, f"server_{date}.{max(numbers) + 1}.log"))
+        except OSError:
+            # 其他进程已经完成了切分
+            return
+        self.schedule_maintenance()
+
+    def schedule_maintenance(self):
+        """在后台压缩日志段并清理旧日志，正在进行时只标记需要再运行一次"""
+        with self.lock:
+            if self.maintenance_thread is not None and self.maintenance_thread.is_alive():
+                self.maintenance_pending = True
+                return
+            self.maintenance_pending = False
+            self.maintenance_thread = threading.Thread(target=self.run_maintenance, daemon=True)
+            self.maintenance_thread.start()
+
+    def run_maintenance(self):
+        while True:
+            try:
+                self.compress_segments()
+                enforce_retention(self.logs_dir, self.retention_days, self.retention_bytes,
+                                  keep=self.get_active_path(self.current_date))
+            except Exception as e:
+                # 不能写入日志本身，只输出到控制台
+                print(f"Log maintenance failed: {e}")
+            with self.lock:
+                if not self.maintenance_pending:
+                    return
+                self.maintenance_pending = False
+
+    def compress_segments(self):
+        """压缩除当前正在写入的日志段以外的所有未压缩日志"""
+        active = self.get_active_path(self.current_date)
+        for path in list_log_files(self.logs_dir):
+            if path.endswith('.log') and path != active:
+                compress_file(path)
+
+def load_log_writer(logs_dir=LOGS_DIR):
+    """
+    根据设置表中的配置创建日志写入器
+
+    Returns:
+        LogWriter: 日志写入器
+    """
+    values = load_typed_settings(LOG_SETTINGS)
+    return LogWriter(logs_dir, values['log_max_bytes'], values['log_retention_days'],
+                     values['log_retention_bytes'])
\ No newline at end of file
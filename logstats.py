@@ -0,0 +1,267 @@
+"""
+GalHub - 日志统计模块
+流式解析每日服务器日志，统计各游戏、各路径的请求数、状态码和流量
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from logfiles import list_log_files, open_log
+
+# 日志目录
+LOGS_DIR = "logs"
+# 每个日志文件的解析结果缓存目录
+CACHE_DIR = os.path.join(LOGS_DIR, ".stats_cache")
+# 缓存格式版本，解析规则变化时递增
+CACHE_VERSION = 2
+# 用文件开头的内容识别同名的日志段是否已被切分替换
+HEAD_SIZE = 256
+
+# 访问日志行，如 '[2024-01-01 12:00:00] 127.0.0.1 - "GET /alias/ HTTP/1.1" 200 -'
+ACCESS_PATTERN = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}):\d{2}:\d{2}\] \S+ - "\S+ (\S+)[^"]*" (\d{3}) ')
+# 发送完成的日志行，如 "[2024-01-01 12:00:00] 200 OK: /alias/ (text/html, 1024 bytes)"
+SERVED_PATTERN = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}):\d{2}:\d{2}\] 20[06] [A-Za-z ]+: (\S+) \(.*?(\d+) bytes\)$')
+
+def new_result():
+    """创建空的统计结果"""
+    return {'requests': 0, 'bytes': 0, 'games': {}, 'paths': {}, 'status': {}, 'buckets': {}}
+
+def add_count(table, key, requests=0, nbytes=0):
+    entry = table.get(key)
+    if entry is None:
+        entry = table[key] = {'requests': 0, 'bytes': 0}
+    entry['requests'] += requests
+    entry['bytes'] += nbytes
+
+def get_game_alias(path):
+    """请求路径的第一段即游戏别名"""
+    alias = path.split('?', 1)[0].strip('/').split('/', 1)[0]
+    return alias or '/'
+
+def parse_lines(lines, result):
+    """
+    逐行累加统计结果
+
+    Args:
+        lines: 可迭代的日志行
+        result (dict): 要累加到的统计结果
+    """
+    for line in lines:
+        line = line.rstrip('\n')
+        match = ACCESS_PATTERN.match(line)
+        if match:
+            hour, path, status = match.groups()
+            path = path.split('?', 1)[0]
+            result['requests'] += 1
+            result['status'][status] = result['status'].get(status, 0) + 1
+            add_count(result['games'], get_game_alias(path), requests=1)
+            add_count(result['paths'], path, requests=1)
+            add_count(result['buckets'], hour, requests=1)
+            continue
+        match = SERVED_PATTERN.match(line)
+        if match:
+            hour, path, nbytes = match.groups()
+            path = path.split('?', 1)[0]
+            nbytes = int(nbytes)
+            result['bytes'] += nbytes
+            add_count(result['games'], get_game_alias(path), nbytes=nbytes)
+            add_count(result['paths'], path, nbytes=nbytes)
+            add_count(result['buckets'], hour, nbytes=nbytes)
+
+def merge_result(total, result):
+    """把一个统计结果累加到另一个上"""
+    total['requests'] += result['requests']
+    total['bytes'] += result['bytes']
+    for status, count in result['status'].items():
+        total['status'][status] = total['status'].get(status, 0) + count
+    for table in ('games', 'paths', 'buckets'):
+        for key, entry in result[table].items():
+            add_count(total[table], key, entry['requests'], entry['bytes'])
+
+def get_cache_path(log_file):
+    return os.path.join(CACHE_DIR, os.path.basename(log_file) + '.json')
+
+def analyze_file(log_file):
+    """
+    统计单个日志文件，结果按文件大小和修改时间缓存
+
+    正在写入的日志段只会追加，文件变大时从上次解析到的位置继续，只解析新增的内容；
+    已压缩的日志段不再变化，只在缓存失效时完整解析一次。
+
+    Args:
+        log_file (str): 日志文件路径
+
+    Returns:
+        dict: 统计结果
+    """
+    stat = os.stat(log_file)
+    cache_path = get_cache_path(log_file)
+    cached = None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('version') != CACHE_VERSION:
+            cached = None
+    except (OSError, ValueError):
+        cached = None
+
+    if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+        return cached['result']
+
+    with open_log(log_file) as f:
+        head = f.read(HEAD_SIZE).decode('latin-1')
+        # 日志段切分后会出现同名的新文件，开头内容不同时重新解析
+        if (cached and not log_file.endswith('.gz') and cached['offset'] <= stat.st_size
+                and head.startswith(cached['head'])):
+            result = cached['result']
+            offset = cached['offset']
+        else:
+            result = new_result()
+            offset = 0
+        f.seek(offset)
+        # 只解析完整的行，最后一行可能仍在写入
+        lines = []
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            offset += len(raw)
+            lines.append(raw.decode('utf-8', errors='replace'))
+            if len(lines) >= 10000:
+                parse_lines(lines, result)
+                lines = []
+        parse_lines(lines, result)
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'offset': offset,
+                'head': head,
+                'result': result,
+            }, f, ensure_ascii=False)
+    except OSError:
+        pass
+    return result
+
+def find_log_files(start_date=None, end_date=None, logs_dir=LOGS_DIR):
+    """
+    获取日期范围内的日志文件，包括已压缩的日志段
+
+    Args:
+        start_date (str): 开始日期 YYYY-MM-DD，None表示不限
+        end_date (str): 结束日期 YYYY-MM-DD，None表示不限
+
+    Returns:
+        list: 日志文件路径列表，按时间先后排序
+    """
+    return list_log_files(logs_dir, start_date, end_date)
+
+def analyze_logs(log_files, workers=None):
+    """
+    并行统计多个日志文件并汇总
+
+    Args:
+        log_files (list): 日志文件路径列表
+        workers (int): 进程数，None表示使用CPU核数
+
+    Returns:
+        dict: 汇总的统计结果
+    """
+    total = new_result()
+    if len(log_files) <= 1 or workers == 1:
+        for result in map(analyze_file, log_files):
+            merge_result(total, result)
+        return total
+    # 服务器通过 memstats 导入本模块的 format_bytes，进程池只在并行统计时加载
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(analyze_file, log_files):
+            merge_result(total, result)
+    return total
+
+def summarize(total, top=20, bucket='hour'):
+    """
+    生成用于输出的统计摘要
+
+    Args:
+        total (dict): 汇总的统计结果
+        top (int): 游戏和路径各保留前多少名
+        bucket (str): 时间分桶粒度，'hour' 或 'day'
+
+    Returns:
+        dict: 统计摘要
+    """
+    def ranked(table):
+        items = sorted(table.items(), key=lambda item: (item[1]['bytes'], item[1]['requests']), reverse=True)
+        return [dict(entry, name=name) for name, entry in items[:top]]
+
+    buckets = {}
+    for hour, entry in total['buckets'].items():
+        key = hour[:10] if bucket == 'day' else f"{hour}:00"
+        add_count(buckets, key, entry['requests'], entry['bytes'])
+
+    return {
+        'requests': total['requests'],
+        'bytes': total['bytes'],
+        'status': dict(sorted(total['status'].items())),
+        'games': ranked(total['games']),
+        'paths': ranked(total['paths']),
+        'buckets': [dict(entry, time=key) for key, entry in sorted(buckets.items())],
+    }
+
+def format_bytes(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+def print_summary(summary):
+    """以表格形式输出统计摘要"""
+    print(f"\nTotal: {summary['requests']} requests, {format_bytes(summary['bytes'])}")
+    print("Status: " + ", ".join(f"{code}={count}" for code, count in summary['status'].items()))
+
+    for title, key in (('Games', 'games'), ('Paths', 'paths')):
+        print(f"\n{title}:")
+        print("-" * 80)
+        print(f"{'Name':<50} {'Requests':>12} {'Bytes':>15}")
+        print("-" * 80)
+        for entry in summary[key]:
+            print(f"{entry['name'][:50]:<50} {entry['requests']:>12} {format_bytes(entry['bytes']):>15}")
+
+    print("\nTraffic:")
+    print("-" * 80)
+    print(f"{'Time':<50} {'Requests':>12} {'Bytes':>15}")
+    print("-" * 80)
+    for entry in summary['buckets']:
+        print(f"{entry['time']:<50} {entry['requests']:>12} {format_bytes(entry['bytes']):>15}")
+    print()
+
+def run_stats(days=7, start_date=None, end_date=None, top=20, bucket='hour', as_json=False, workers=None):
+    """
+    统计日志并输出
+
+    Args:
+        days (int): 未指定开始日期时统计最近几天
+        start_date (str): 开始日期 YYYY-MM-DD
+        end_date (str): 结束日期 YYYY-MM-DD
+        top (int): 游戏和路径各输出前多少名
+        bucket (str): 时间分桶粒度，'hour' 或 'day'
+        as_json (bool): 以JSON格式输出
+        workers (int): 并行进程数
+    """
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    log_files = find_log_files(start_date, end_date)
+    summary = summarize(analyze_logs(log_files, workers), top, bucket)
+    summary['files'] = [os.path.basename(f) for f in log_files]
+    if as_json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"Analyzed {len(log_files)} log file(s) from {start_date} to {end_date or 'today'}")
+        print_summary(summary)
@@ -0,0 +1,255 @@
+"""
+GalHub - 日志文件分页读取模块
+通过内存映射读取日志文件，在后台建立稀疏行索引，只读取当前需要显示的行
+"""
+
+import gzip
+import mmap
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+
+# 每隔多少行记录一个行首偏移
+CHECKPOINT_INTERVAL = 64
+# 建立索引和搜索时每次处理的字节数
+WINDOW_SIZE = 16 * 1024 * 1024
+
+class LogFile:
+    """
+    按行分页读取的日志文件
+
+    行索引只记录每 CHECKPOINT_INTERVAL 行的起始偏移，大文件的索引也只占很少内存。
+    build_index() 和 search() 可在后台线程中调用，get_lines() 在索引未完成时返回已索引部分。
+    .gz 日志段在 build_index() 中逐块解压到临时文件，已解压的部分即可显示和查找。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.source = None
+        if path.endswith(".gz"):
+            self.source = gzip.open(path, "rb")
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.file = open(path, "rb")
+        self.map = None
+        self.size = 0
+        self.checkpoints = array("Q", [0])
+        self.line_count = 0
+        self.indexed_to = 0
+        self.lock = threading.RLock()
+        self.remap()
+
+    def remap(self):
+        """
+        文件变大时重新映射
+
+        Returns:
+            bool: 文件大小是否变化
+        """
+        with self.lock:
+            size = os.fstat(self.file.fileno()).st_size
+            if size == self.size and (self.map is not None or size == 0):
+                return False
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            if size < self.indexed_to:
+                # 文件被截断，重新建立索引
+                self.checkpoints = array("Q", [0])
+                self.line_count = 0
+                self.indexed_to = 0
+            self.size = size
+            if size:
+                self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+            return True
+
+    def decompress(self):
+        """把压缩日志段的下一块解压到临时文件末尾"""
+        if self.source is None:
+            return
+        chunk = self.source.read(WINDOW_SIZE)
+        with self.lock:
+            if chunk:
+                self.file.seek(0, os.SEEK_END)
+                self.file.write(chunk)
+                self.file.flush()
+            else:
+                self.source.close()
+                self.source = None
+        self.remap()
+
+    def build_index(self, cancel_event=None):
+        """
+        从上次索引到的位置继续建立行索引，直到文件末尾
+
+        Args:
+            cancel_event (threading.Event): 设置后提前结束
+        """
+        while True:
+            self.decompress()
+            with self.lock:
+                if self.map is None or self.indexed_to >= self.size:
+                    if self.source is None:
+                        return
+                    continue
+                start = self.indexed_to
+                end = min(self.size, start + WINDOW_SIZE)
+                data = self.map[start:end]
+            # 在锁外查找换行，界面线程可以同时读取已索引的行
+            new_checkpoints = []
+            line_count = self.line_count
+            pos = 0
+            last_end = 0
+            while True:
+                newline = data.find(b"\n", pos)
+                if newline < 0:
+                    break
+                line_count += 1
+                pos = newline + 1
+                last_end = pos
+                if line_count % CHECKPOINT_INTERVAL == 0:
+                    new_checkpoints.append(start + pos)
+            with self.lock:
+                self.checkpoints.extend(new_checkpoints)
+                self.line_count = line_count
+                if last_end:
+                    self.indexed_to = start + last_end
+                elif end >= self.size:
+                    # 末尾是没有换行的不完整行，等待追加或继续解压
+                    if self.source is None:
+                        return
+                else:
+                    # 超长的行，跳过这一窗口继续查找换行
+                    self.indexed_to = end
+            if cancel_event is not None and cancel_event.is_set():
+                return
+
+    def is_indexed(self):
+        """索引是否已覆盖到文件末尾的最后一个完整行"""
+        with self.lock:
+            if self.source is not None:
+                return False
+            return self.map is None or self.map.find(b"\n", self.indexed_to) < 0
+
+    def total_lines(self):
+        """已索引的行数，末尾不完整的行也计入"""
+        with self.lock:
+            return self.line_count + (1 if self.size > self.indexed_to else 0)
+
+    def line_offset(self, line):
+        """获取指定行的起始偏移，调用方需持有锁"""
+        offset = self.checkpoints[line // CHECKPOINT_INTERVAL]
+        for _ in range(line % CHECKPOINT_INTERVAL):
+            offset = self.map.find(b"\n", offset) + 1
+        return offset
+
+    def line_at(self, offset):
+        """获取偏移所在的行号，调用方需持有锁"""
+        index = bisect_right(self.checkpoints, offset) - 1
+        line = index * CHECKPOINT_INTERVAL
+        return line + self.map[self.checkpoints[index]:offset].count(b"\n")
+
+    def get_lines(self, start, count):
+        """
+        读取指定范围的行
+
+        Args:
+            start (int): 起始行号（从0开始）
+            count (int): 行数
+
+        Returns:
+            list: 行文本列表（不含换行符）
+        """
+        with self.lock:
+            total = self.total_lines()
+            if self.map is None or start >= total:
+                return []
+            count = min(count, total - start)
+            begin = self.line_offset(start)
+            end = begin
+            for _ in range(count):
+                newline = self.map.find(b"\n", end)
+                if newline < 0:
+                    end = self.size
+                    break
+                end = newline + 1
+            data = self.map[begin:end]
+        return data.decode("utf-8", errors="replace").splitlines()
+
+    def search(self, pattern, regex=False, ignore_case=True, start_line=0, backwards=False, cancel_event=None):
+        """
+        查找包含匹配内容的行
+
+        Args:
+            pattern (str): 查找的文本或正则表达式
+            regex (bool): pattern是否为正则表达式
+            ignore_case (bool): 是否忽略大小写
+            start_line (int): 从哪一行开始查找（向前查找时不包含该行）
+            backwards (bool): 是否向文件开头方向查找
+            cancel_event (threading.Event): 设置后提前结束
+
+        Returns:
+            int: 匹配的行号，未找到时返回-1
+
+        Raises:
+            re.error: 正则表达式无效
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        compiled = re.compile(pattern.encode("utf-8") if regex else re.escape(pattern.encode("utf-8")), flags)
+        with self.lock:
+            if self.map is None:
+                return -1
+            # 只在已索引的范围内查找，否则无法换算行号
+            limit = self.size if self.is_indexed() else self.indexed_to
+            if start_line >= self.total_lines():
+                start_offset = limit
+            else:
+                start_offset = min(self.line_offset(start_line), limit)
+
+        if backwards:
+            end = start_offset
+            while end > 0:
+                if cancel_event is not None and cancel_event.is_set():
+                    return -1
+                with self.lock:
+                    begin = max(0, end - WINDOW_SIZE)
+                    if begin:
+                        # 窗口从完整行开始，避免把一行截成两半
+                        newline = self.map.find(b"\n", begin, end - 1)
+                        if newline >= 0:
+                            begin = newline + 1
+                    last = None
+                    for match in compiled.finditer(self.map, begin, end):
+                        last = match
+                    if last is not None:
+                        return self.line_at(last.start())
+                end = begin
+            return -1
+
+        position = start_offset
+        while position < limit:
+            if cancel_event is not None and cancel_event.is_set():
+                return -1
+            with self.lock:
+                end = min(limit, position + WINDOW_SIZE)
+                if end < limit:
+                    newline = self.map.rfind(b"\n", position, end)
+                    if newline >= 0:
+                        end = newline + 1
+                match = compiled.search(self.map, position, end)
+                if match is not None:
+                    return self.line_at(match.start())
+            position = end
+        return -1
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            if self.source is not None:
+                self.source.close()
+                self.source = None
+            self.file.close()
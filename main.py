@@ -4,17 +4,19 @@ GalHub - CDN控制器
 A CDN program for managing web-based games as static HTML sites
 """
 
-import os
 import sys
 import argparse
-from database import init_db, get_all_games
-from manager import upload_game, list_games, remove_game, init_manager
-from server import start_server
+
+# 各子命令用到的模块在执行该命令时才导入，避免每次调用都加载HTTP服务器等模块
+
+# 不需要数据库和游戏目录的命令
+NO_INIT_COMMANDS = ('stats', 'ui')
 
 def show_games():
     """
     显示游戏列表
     """
+    from manager import list_games
     games = list_games()
     
     if not games:
@@ -27,14 +29,29 @@ def show_games():
     print("-" * 80)
     
     for game in games:
-        name, alias, upload_time = game
+        alias, name, upload_time = game
         print(f"{name:<30} {alias:<20} {upload_time:<20}")
     print()
 
-def main():
-    # 初始化数据库和目录
-    init_manager()
+def show_config(key=None, value=None):
+    """
+    查看或修改设置项
     
+    Args:
+        key (str): 设置项名称，为None时列出所有设置
+        value (str): 新的设置值，为None时只显示当前值
+    """
+    from database import get_setting, get_all_settings, set_setting
+    if key is None:
+        for setting_key, setting_value in get_all_settings():
+            print(f"{setting_key} = {setting_value}")
+    elif value is None:
+        print(f"{key} = {get_setting(key, '')}")
+    else:
+        set_setting(key, value)
+        print(f"{key} = {value}")
+
+def main():
     parser = argparse.ArgumentParser(description="GalHub - CDN控制器")
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
@@ -43,6 +60,34 @@ def main():
     upload_parser.add_argument('--name', required=True, help='Game name')
     upload_parser.add_argument('--alias', required=True, help='Game alias (folder name)')
     upload_parser.add_argument('--path', required=True, help='Source path of the game files')
+    upload_parser.add_argument('--optimize', action='store_true',
+                               help='Minify JS/CSS/JSON and recompress images after copying')
+    upload_parser.add_argument('--webp', action='store_true', help='Also create WebP variants of PNG/JPEG images')
+    upload_parser.add_argument('--offline', action='store_true',
+                               help='Add a service worker so browsers cache the whole game for offline play')
+    
+    # 重新优化命令
+    reoptimize_parser = subparsers.add_parser('reoptimize', help='Optimize the assets of uploaded games')
+    reoptimize_target = reoptimize_parser.add_mutually_exclusive_group(required=True)
+    reoptimize_target.add_argument('--alias', help='Game alias to optimize')
+    reoptimize_target.add_argument('--all', action='store_true', help='Optimize all games')
+    reoptimize_parser.add_argument('--webp', action='store_true', help='Also create WebP variants of PNG/JPEG images')
+    reoptimize_parser.add_argument('--workers', type=int, help='Parallel worker processes')
+    reoptimize_parser.add_argument('--report', action='store_true',
+                                   help='Only show the saved optimization reports')
+    
+    # 离线缓存命令
+    offline_parser = subparsers.add_parser('offline', help='Enable or disable the offline cache of a game')
+    offline_parser.add_argument('--alias', required=True, help='Game alias')
+    offline_parser.add_argument('--disable', action='store_true',
+                                help='Disable it (installed service workers clear their cache and unregister)')
+    
+    # 批量导入命令
+    import_parser = subparsers.add_parser('import', help='Import many games from a CSV manifest or a directory')
+    import_source = import_parser.add_mutually_exclusive_group(required=True)
+    import_source.add_argument('--manifest', help='CSV file with name,alias,path columns')
+    import_source.add_argument('--scan', help='Directory whose subdirectories are imported as games')
+    import_parser.add_argument('--workers', type=int, default=4, help='Games copied in parallel')
     
     # 列表命令
     subparsers.add_parser('list', help='List all games')
@@ -54,25 +99,142 @@ def main():
     # 启动服务器命令
     server_parser = subparsers.add_parser('serve', help='Start the HTTP server')
     server_parser.add_argument('--port', type=int, default=8000, help='Port to run the server on')
+    server_parser.add_argument('--drain-timeout', type=float, default=10,
+                               help='Seconds to wait for in-flight requests on shutdown')
+    server_parser.add_argument('--upstream', help='Upstream GalHub origin URL (run as an edge cache node)')
+    server_parser.add_argument('--cache-dir', default='cache', help='Edge cache directory')
+    server_parser.add_argument('--cache-size', type=int, default=1024, help='Edge cache size limit in MB')
+    server_parser.add_argument('--prewarm-mb', type=int, default=0,
+                               help='Read the most requested files (from recent logs) into the page cache, up to this many MB')
+    server_parser.add_argument('--prewarm-rate', type=int, default=50, help='Prewarm read rate limit in MB/s (0 = unlimited)')
     
     # 初始化命令
     subparsers.add_parser('init', help='Initialize the system')
     
+    # 同步命令
+    replicate_parser = subparsers.add_parser('replicate', help='Pull catalog and game files from another GalHub node')
+    replicate_parser.add_argument('--origin', required=True, help='Origin URL, e.g. http://origin:8000')
+    replicate_parser.add_argument('--workers', type=int, default=4, help='Parallel file transfers')
+    
+    # 日志统计命令
+    stats_parser = subparsers.add_parser('stats', help='Analyze server logs (requests, status codes, bandwidth)')
+    stats_parser.add_argument('--days', type=int, default=7, help='Analyze the last N days (default 7)')
+    stats_parser.add_argument('--from', dest='start_date', help='Start date YYYY-MM-DD')
+    stats_parser.add_argument('--to', dest='end_date', help='End date YYYY-MM-DD')
+    stats_parser.add_argument('--top', type=int, default=20, help='Number of games and paths to show')
+    stats_parser.add_argument('--bucket', choices=['hour', 'day'], default='hour', help='Traffic time bucket')
+    stats_parser.add_argument('--json', action='store_true', help='Output JSON')
+    stats_parser.add_argument('--workers', type=int, help='Parallel worker processes')
+    
+    # 设置命令
+    config_parser = subparsers.add_parser('config', help='Show or change settings (e.g. rate_limit_rps)')
+    config_parser.add_argument('key', nargs='?', help='Setting name')
+    config_parser.add_argument('value', nargs='?', help='New value')
+    
+    # 内存统计命令
+    memory_parser = subparsers.add_parser('memory', help='Show memory usage of a running server, or control tracemalloc')
+    memory_parser.add_argument('--url', default='http://localhost:8000', help='Server URL')
+    memory_parser.add_argument('--token', help='Admin token (default: the admin_token setting)')
+    memory_action = memory_parser.add_mutually_exclusive_group()
+    memory_action.add_argument('--start', dest='action', action='store_const', const='start',
+                               help='Start tracemalloc in the server')
+    memory_action.add_argument('--stop', dest='action', action='store_const', const='stop',
+                               help='Stop tracemalloc')
+    memory_action.add_argument('--snapshot', dest='action', action='store_const', const='snapshot',
+                               help='Take a tracemalloc snapshot and diff it against the previous one')
+    memory_parser.add_argument('--frames', type=int, default=1, help='Stack frames recorded per allocation')
+    memory_parser.add_argument('--top', type=int, default=20, help='Number of snapshot entries to show')
+    memory_parser.add_argument('--group', choices=['lineno', 'filename', 'traceback'], default='lineno',
+                               help='Group snapshot entries by')
+    
+    # 完整性巡检命令
+    scrub_parser = subparsers.add_parser('scrub', help='Re-hash game files and compare them with the recorded hashes')
+    scrub_parser.add_argument('--alias', action='append', help='Only check this game (can be repeated)')
+    scrub_parser.add_argument('--quarantine', action='store_true',
+                              help='Move mismatched files into games/.quarantine')
+    scrub_parser.add_argument('--workers', type=int, default=2, help='Parallel hashing threads')
+    scrub_parser.add_argument('--rate', type=int, default=0, help='Read at most N MB/s (0 = unlimited)')
+    
+    # 快照命令
+    snapshot_parser = subparsers.add_parser('snapshot', help='Export the database and all games into one archive, '
+                                                            'or restore a new node from it')
+    snapshot_parser.add_argument('action', choices=['export', 'import'], help='Export or import a snapshot')
+    snapshot_parser.add_argument('-f', '--file', required=True, help='Snapshot file ("-" for stdout/stdin)')
+    snapshot_parser.add_argument('--workers', type=int, default=4, help='Threads verifying files during import')
+    
     # UI界面命令
     subparsers.add_parser('ui', help='Start the graphical user interface')
     
     args = parser.parse_args()
     
+    # 初始化数据库和目录（数据库结构已是最新版本时不执行建表语句）
+    if args.command not in NO_INIT_COMMANDS:
+        from manager import init_manager
+        init_manager(verbose=args.command == 'init')
+    
     if args.command == 'upload':
-        upload_game(args.name, args.alias, args.path)
+        from manager import upload_game
+        upload_game(args.name, args.alias, args.path, optimize=args.optimize or args.webp, webp=args.webp,
+                    offline=args.offline)
+    elif args.command == 'reoptimize':
+        from manager import list_games, reoptimize_game, show_optimization_report
+        aliases = [game[0] for game in list_games()] if args.all else [args.alias]
+        if args.report:
+            for alias in aliases:
+                show_optimization_report(alias)
+        elif not all([reoptimize_game(alias, args.webp, args.workers) is not None for alias in aliases]):
+            sys.exit(1)
+    elif args.command == 'offline':
+        from manager import set_offline
+        if not set_offline(args.alias, not args.disable):
+            sys.exit(1)
+    elif args.command == 'import':
+        from importer import run_import
+        if not run_import(args.manifest, args.scan, args.workers):
+            sys.exit(1)
     elif args.command == 'list':
         show_games()
     elif args.command == 'remove':
+        from manager import remove_game
         remove_game(args.alias)
     elif args.command == 'serve':
-        start_server(args.port)
+        from server import start_server, install_signal_handlers
+        # SIGTERM/Ctrl+C 优雅停止，SIGHUP（Windows上为Ctrl+Break）热重启
+        install_signal_handlers()
+        start_server(args.port, args.drain_timeout, args.upstream,
+                     args.cache_dir, args.cache_size * 1024 * 1024,
+                     args.prewarm_mb * 1024 * 1024, args.prewarm_rate * 1024 * 1024)
     elif args.command == 'init':
-        init_manager()
+        # 显式初始化时总是重新执行建表语句
+        from database import init_db
+        init_db()
+    elif args.command == 'replicate':
+        from replication import replicate
+        if not replicate(args.origin, args.workers):
+            sys.exit(1)
+    elif args.command == 'stats':
+        from logstats import run_stats
+        run_stats(args.days, args.start_date, args.end_date, args.top, args.bucket, args.json, args.workers)
+    elif args.command == 'config':
+        show_config(args.key, args.value)
+    elif args.command == 'memory':
+        from database import get_setting
+        from memstats import run_memory_command
+        token = args.token or get_setting('admin_token', '')
+        if not run_memory_command(args.url, token, args.action, args.frames, args.top, args.group):
+            sys.exit(1)
+    elif args.command == 'scrub':
+        from scrubber import run_scrub
+        if not run_scrub(args.alias, args.quarantine, args.workers, args.rate):
+            sys.exit(1)
+    elif args.command == 'snapshot':
+        from snapshot import export_snapshot, import_snapshot
+        if args.action == 'export':
+            ok = export_snapshot(args.file)
+        else:
+            ok = import_snapshot(args.file, args.workers)
+        if not ok:
+            sys.exit(1)
     elif args.command == 'ui':
         # 启动图形界面
         try:
@@ -91,10 +253,19 @@ def main():
             print("GalHub - CDN控制器")
             print("Available commands:")
             print("  upload    Upload a game")
+            print("  import    Import many games at once")
+            print("  reoptimize Optimize assets of uploaded games")
+            print("  offline   Enable or disable the offline cache of a game")
             print("  list      List all games")
             print("  remove    Remove a game")
             print("  serve     Start the HTTP server")
             print("  init      Initialize the system")
+            print("  replicate Pull games from another node")
+            print("  scrub     Check game files against the recorded hashes")
+            print("  snapshot  Export or import a snapshot of the whole node")
+            print("  memory    Show memory usage of a running server")
+            print("  stats     Analyze server logs")
+            print("  config    Show or change settings")
             print("  ui        Start the graphical user interface")
         print("\nAvailable games:")
         show_games()
@@ -110,4 +281,8 @@ def ui_main():
         print("Make sure all required modules are installed")
 
 if __name__ == "__main__":
+    # PyInstaller打包后使用多进程需要先调用freeze_support（源码运行时无需调用，也就不必导入multiprocessing）
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -19,4 +19,8 @@ def main():
         main_main()
 
 if __name__ == "__main__":
+    # PyInstaller打包后使用多进程需要先调用freeze_support（源码运行时无需调用，也就不必导入multiprocessing）
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -1,12 +1,293 @@
 import os
 import shutil
-from database import add_game, get_all_games, delete_game, init_db, get_domain, set_domain
+import hashlib
+from database import add_game, get_all_games, get_game_by_alias, delete_game, init_db, ensure_db, get_domain, set_domain, get_game_files, set_game_files, update_game_files, get_preload_hints, set_preload_hints, get_optimization_report, set_optimization_report
+from preload import analyze_entry_page
 from datetime import datetime
 
 # 游戏文件根目录
 GAMES_ROOT = "games"
+# 计算文件哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
 
-def upload_game(name, alias, source_path):
+def hash_file(file_path):
+    """
+    计算文件的SHA-256哈希
+    
+    Args:
+        file_path (str): 文件路径
+    
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_valid_alias(alias):
+    """
+    检查别名能否作为游戏目录名：不能为空、不能以 . 开头（暂存目录等）、不能包含路径分隔符和控制字符（如NUL）
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        bool: 可以使用返回True
+    """
+    return (isinstance(alias, str) and bool(alias) and not alias.startswith(".")
+            and "/" not in alias and "\\" not in alias
+            and not any(ord(char) < 32 or ord(char) == 127 for char in alias))
+
+def get_game_file_path(alias, path, root=GAMES_ROOT):
+    """
+    拼接游戏中文件的路径，用于来自其他节点或快照等不可信来源的别名和路径
+    
+    Args:
+        alias (str): 游戏别名
+        path (str): 以/分隔的相对路径
+        root (str): 游戏根目录
+    
+    Returns:
+        str: 文件的绝对路径
+    
+    Raises:
+        ValueError: 别名或路径不安全（为空、包含 .. 或绝对路径等可能跳出游戏目录的写法）
+    """
+    if not is_valid_alias(alias):
+        raise ValueError(f"Invalid alias: {alias!r}")
+    parts = path.split("/") if isinstance(path, str) else []
+    if not parts or any(part in ("", ".", "..") or "\\" in part or "\0" in part for part in parts):
+        raise ValueError(f"Unsafe path: {alias}/{path}")
+    base = os.path.abspath(os.path.join(root, alias))
+    file_path = os.path.abspath(os.path.join(base, *parts))
+    # Windows上的盘符等写法也会使拼接结果离开游戏目录
+    if os.path.dirname(base) != os.path.abspath(root) or not file_path.startswith(base + os.sep):
+        raise ValueError(f"Unsafe path: {alias}/{path}")
+    return file_path
+
+def scan_game_files(alias):
+    """
+    扫描游戏目录，生成文件清单
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 文件信息字典列表（path, size, mtime, sha256），path为以/分隔的相对路径
+    """
+    game_path = os.path.join(GAMES_ROOT, alias)
+    files = []
+    for root, dirs, filenames in os.walk(game_path):
+        dirs.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(root, filename)
+            stat = os.stat(file_path)
+            files.append({
+                'path': os.path.relpath(file_path, game_path).replace(os.sep, '/'),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'sha256': hash_file(file_path),
+            })
+    return files
+
+def record_manifest(alias):
+    """
+    重新扫描游戏目录并保存文件清单
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 文件清单
+    """
+    files = scan_game_files(alias)
+    set_game_files(alias, files)
+    return files
+
+def get_manifest(alias):
+    """
+    获取游戏的文件清单，尚未记录时（如旧版本上传的游戏）先扫描生成
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 文件清单
+    """
+    files = get_game_files(alias)
+    if not files and os.path.isdir(os.path.join(GAMES_ROOT, alias)):
+        files = record_manifest(alias)
+    return files
+
+def record_preload_hints(alias):
+    """
+    分析游戏入口页面并保存预加载提示
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 预加载提示
+    """
+    hints = analyze_entry_page(os.path.join(GAMES_ROOT, alias))
+    set_preload_hints(alias, hints)
+    return hints
+
+def get_preload(alias):
+    """
+    获取游戏的预加载提示，尚未分析时（如旧版本上传的游戏）先分析入口页面
+    
+    Args:
+        alias (str): 游戏别名
+    
+    Returns:
+        list: 预加载提示
+    """
+    hints = get_preload_hints(alias)
+    if hints is None and os.path.isdir(os.path.join(GAMES_ROOT, alias)):
+        hints = record_preload_hints(alias)
+    return hints or []
+
+def sync_game_files(alias, paths=None):
+    """
+    把游戏目录中被直接修改的文件同步到文件清单和预加载提示
+    
+    只重新计算大小或修改时间与清单不一致的文件的哈希。
+    
+    Args:
+        alias (str): 游戏别名
+        paths (set): 变化的相对路径（文件或目录），None表示检查整个游戏目录
+    
+    Returns:
+        list: 清单中变化的路径
+    """
+    game_path = os.path.join(GAMES_ROOT, alias)
+    manifest = {f['path']: f for f in get_game_files(alias)}
+    
+    # 找出需要检查的文件：清单中位于变化路径下的文件，以及磁盘上位于变化路径下的文件
+    if paths is None:
+        prefixes = ['']
+    else:
+        prefixes = [path.rstrip('/') + '/' for path in paths]
+    candidates = {path for path in manifest if paths is None or path in paths
+                  or any(path.startswith(prefix) for prefix in prefixes)}
+    for prefix in prefixes:
+        top = os.path.join(game_path, *prefix.rstrip('/').split('/')) if prefix else game_path
+        if os.path.isfile(top):
+            candidates.add(prefix.rstrip('/'))
+        for root, dirs, filenames in os.walk(top):
+            for filename in filenames:
+                candidates.add(os.path.relpath(os.path.join(root, filename), game_path).replace(os.sep, '/'))
+    
+    updated, removed = [], []
+    for path in sorted(candidates):
+        file_path = os.path.join(game_path, *path.split('/'))
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            if path in manifest:
+                removed.append(path)
+            continue
+        old = manifest.get(path)
+        if old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+            continue
+        try:
+            digest = hash_file(file_path)
+        except OSError:
+            continue
+        if old is None or old['sha256'] != digest or old['size'] != stat.st_size or old['mtime'] != stat.st_mtime:
+            updated.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest})
+    
+    if updated or removed:
+        update_game_files(alias, updated, removed)
+        # 启用了离线缓存的游戏更新预缓存清单（只有生成的文件变化时不需要）
+        from offline import OFFLINE_FILES, is_offline_enabled
+        changed = [f['path'] for f in updated] + removed
+        if is_offline_enabled(game_path) and any(path not in OFFLINE_FILES for path in changed):
+            refresh_offline_bundle(alias, game_path)
+        # 入口页面或它引用的资源变化时重新生成预加载提示
+        record_preload_hints(alias)
+    return [f['path'] for f in updated] + removed
+
+def refresh_offline_bundle(alias, game_path):
+    """根据数据库中的文件清单重新生成离线缓存文件，只更新变化的清单条目"""
+    from offline import generate_offline_bundle
+    manifest = get_game_files(alias)
+    old = {f['path']: f for f in manifest}
+    files = generate_offline_bundle(alias, game_path, manifest)
+    changed = [f for f in files if old.get(f['path']) != f]
+    if changed:
+        update_game_files(alias, changed, [])
+
+class UploadCancelled(Exception):
+    """上传被用户取消"""
+
+def copy_game_files(source_path, target_path, progress=None, cancel_event=None):
+    """
+    复制游戏文件，复制的同时计算每个文件的哈希
+    
+    Args:
+        source_path (str): 源文件或目录
+        target_path (str): 目标目录
+        progress (callable): 进度回调，参数为 (已复制文件数, 总文件数, 已复制字节数, 总字节数)
+        cancel_event (threading.Event): 设置后中止复制并抛出UploadCancelled
+    
+    Returns:
+        list: 文件清单（path, size, mtime, sha256）
+    """
+    if os.path.isfile(source_path):
+        files = [(source_path, os.path.basename(source_path))]
+    else:
+        files = []
+        for root, dirs, filenames in os.walk(source_path, followlinks=True):
+            dirs.sort()
+            # 保留空目录，与copytree的行为一致
+            for dirname in dirs:
+                relative_dir = os.path.relpath(os.path.join(root, dirname), source_path)
+                os.makedirs(os.path.join(target_path, relative_dir), exist_ok=True)
+            for filename in sorted(filenames):
+                file_path = os.path.join(root, filename)
+                files.append((file_path, os.path.relpath(file_path, source_path).replace(os.sep, '/')))
+    
+    total_bytes = sum(os.path.getsize(file_path) for file_path, _ in files)
+    copied_bytes = 0
+    manifest = []
+    os.makedirs(target_path, exist_ok=True)
+    for index, (file_path, relative) in enumerate(files):
+        target_file = os.path.join(target_path, *relative.split('/'))
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as fsrc, open(target_file, 'wb') as fdst:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelled("Upload cancelled")
+                chunk = fsrc.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+                digest.update(chunk)
+                copied_bytes += len(chunk)
+                if progress:
+                    progress(index, len(files), copied_bytes, total_bytes)
+        shutil.copystat(file_path, target_file)
+        stat = os.stat(target_file)
+        manifest.append({
+            'path': relative,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': digest.hexdigest(),
+        })
+    if progress:
+        progress(len(files), len(files), copied_bytes, total_bytes)
+    return manifest
+
+def upload_game(name, alias, source_path, progress=None, cancel_event=None, optimize=False, webp=False,
+                offline=False):
     """
     上传游戏到CDN
     
@@ -14,6 +295,11 @@ def upload_game(name, alias, source_path):
         name (str): 游戏名
         alias (str): 游戏别名（将作为文件夹名）
         source_path (str): 源文件路径
+        progress (callable): 复制进度回调，参数为 (已复制文件数, 总文件数, 已复制字节数, 总字节数)
+        cancel_event (threading.Event): 设置后取消上传并清理已复制的文件
+        optimize (bool): 是否压缩复制后的JS、CSS、JSON和图片
+        webp (bool): 优化时是否为PNG/JPEG生成WebP版本
+        offline (bool): 是否生成离线缓存用的 Service Worker 和预缓存清单
     
     Returns:
         bool: 上传成功返回True，否则返回False
@@ -35,36 +321,169 @@ def upload_game(name, alias, source_path):
         return False
     
     try:
-        # 复制游戏文件
-        if os.path.isfile(source_path):
-            # 如果是单个文件，创建目录并将文件复制进去
-            os.makedirs(target_path, exist_ok=True)
-            shutil.copy2(source_path, os.path.join(target_path, os.path.basename(source_path)))
-        else:
-            # 如果是目录，直接复制整个目录
-            shutil.copytree(source_path, target_path)
+        # 复制游戏文件（单个文件会放入以别名命名的目录），同时生成文件清单
+        manifest = copy_game_files(source_path, target_path, progress, cancel_event)
+    except Exception as e:
+        # 清理已复制的文件
+        remove_path(target_path)
+        print(f"Error uploading game: {str(e)}")
+        return False
+    
+    return publish_game(name, alias, target_path, manifest, optimize, webp, offline)
+
+def publish_game(name, alias, target_path, manifest, optimize=False, webp=False, offline=False):
+    """
+    发布已放入游戏目录的文件：可选优化，写入数据库、文件清单和预加载提示；失败时删除游戏目录
+    
+    Args:
+        name (str): 游戏名
+        alias (str): 游戏别名
+        target_path (str): 游戏目录
+        manifest (list): 文件清单（path, size, mtime, sha256）
+        optimize (bool): 是否压缩JS、CSS、JSON和图片
+        webp (bool): 优化时是否为PNG/JPEG生成WebP版本
+        offline (bool): 是否生成离线缓存用的 Service Worker 和预缓存清单
+    
+    Returns:
+        bool: 发布成功返回True，否则返回False
+    """
+    try:
+        # 优化复制后的文件，不影响源文件
+        report = None
+        if optimize:
+            # 优化模块会加载多进程相关模块，只在需要时导入
+            from optimize import optimize_game, format_report
+            manifest, report = optimize_game(target_path, manifest, webp)
+        
+        # 预缓存清单中的哈希需要在优化之后计算
+        if offline:
+            from offline import generate_offline_bundle
+            manifest = generate_offline_bundle(alias, target_path, manifest)
         
         # 添加到数据库
         if add_game(name, alias, target_path):
+            # 记录文件清单，用于节点间同步
+            set_game_files(alias, manifest)
+            # 分析入口页面，记录首屏需要的关键子资源
+            record_preload_hints(alias)
+            if report is not None:
+                set_optimization_report(alias, report)
+                print(format_report(alias, report))
             print(f"Game '{name}' uploaded successfully with alias '{alias}'")
             return True
         else:
             # 如果数据库添加失败，清理已复制的文件
-            if os.path.exists(target_path):
-                shutil.rmtree(target_path)
+            remove_path(target_path)
             print(f"Error: Failed to add game to database")
             return False
             
     except Exception as e:
         # 清理已复制的文件
-        if os.path.exists(target_path):
-            if os.path.isfile(target_path):
-                os.remove(target_path)
-            else:
-                shutil.rmtree(target_path)
+        remove_path(target_path)
         print(f"Error uploading game: {str(e)}")
         return False
 
+def remove_path(path):
+    """删除文件或目录（不存在时忽略）"""
+    if os.path.isfile(path):
+        os.remove(path)
+    elif os.path.exists(path):
+        shutil.rmtree(path)
+
+def reoptimize_game(alias, webp=False, workers=None):
+    """
+    优化已上传游戏的资源文件
+    
+    修改过的文件会更新到文件清单并记录目录变更，其他节点下次同步时会下载新的文件。
+    
+    Args:
+        alias (str): 游戏别名
+        webp (bool): 是否为PNG/JPEG生成WebP版本
+        workers (int): 进程数，None表示使用CPU核数
+    
+    Returns:
+        dict: 优化报告，失败时返回None
+    """
+    game_path = os.path.join(GAMES_ROOT, alias)
+    if get_game_by_alias(alias) is None or not os.path.isdir(game_path):
+        print(f"Error: Game with alias '{alias}' does not exist")
+        return None
+    
+    from optimize import optimize_game, format_report
+    from offline import is_offline_enabled, generate_offline_bundle
+    try:
+        manifest = get_manifest(alias)
+        files, report = optimize_game(game_path, manifest, webp, workers)
+        if is_offline_enabled(game_path) and files != manifest:
+            files = generate_offline_bundle(alias, game_path, files)
+    except Exception as e:
+        print(f"Error optimizing game '{alias}': {str(e)}")
+        return None
+    
+    if files != manifest:
+        set_game_files(alias, files, changed=True)
+        # 入口页面引用的资源大小可能变化，重新生成预加载提示
+        record_preload_hints(alias)
+    print(format_report(alias, report))
+    
+    # 保存的报告累计历次优化节省的字节数
+    previous = get_optimization_report(alias)
+    saved = previous['bytes_before'] - previous['bytes_after'] if previous else 0
+    set_optimization_report(alias, dict(report, bytes_before=report['bytes_before'] + saved))
+    return report
+
+def set_offline(alias, enabled=True):
+    """
+    为已上传的游戏启用或停用离线缓存
+    
+    修改的文件会更新到文件清单并记录目录变更，其他节点下次同步时会下载新的文件。
+    
+    Args:
+        alias (str): 游戏别名
+        enabled (bool): True表示启用，False表示停用
+    
+    Returns:
+        bool: 成功返回True，否则返回False
+    """
+    from offline import is_offline_enabled, generate_offline_bundle, remove_offline_bundle
+    game_path = os.path.join(GAMES_ROOT, alias)
+    if get_game_by_alias(alias) is None or not os.path.isdir(game_path):
+        print(f"Error: Game with alias '{alias}' does not exist")
+        return False
+    if not enabled and not is_offline_enabled(game_path):
+        print(f"Offline cache is not enabled for '{alias}'")
+        return True
+    
+    try:
+        manifest = get_manifest(alias)
+        if enabled:
+            files = generate_offline_bundle(alias, game_path, manifest)
+        else:
+            files = remove_offline_bundle(alias, game_path, manifest)
+    except Exception as e:
+        print(f"Error updating offline cache for '{alias}': {str(e)}")
+        return False
+    
+    if files != manifest:
+        set_game_files(alias, files, changed=True)
+        record_preload_hints(alias)
+    print(f"Offline cache {'enabled' if enabled else 'disabled'} for '{alias}'")
+    return True
+
+def show_optimization_report(alias):
+    """
+    输出游戏最近一次的资源优化报告
+    
+    Args:
+        alias (str): 游戏别名
+    """
+    report = get_optimization_report(alias)
+    if report is None:
+        print(f"{alias}: not optimized")
+    else:
+        from optimize import format_report
+        print(f"{format_report(alias, report)} at {report['optimized_time']}")
+
 def list_games():
     """
     列出所有游戏
@@ -110,15 +529,19 @@ def remove_game(alias):
     
     return db_success or fs_success
 
-def init_manager():
+def init_manager(verbose=True):
     """
     初始化管理器
+    
+    Args:
+        verbose (bool): 是否输出初始化完成的提示
     """
-    # 初始化数据库
-    init_db()
+    # 初始化数据库（结构已是最新版本时只检查版本号）
+    ensure_db()
     # 确保游戏目录存在
     os.makedirs(GAMES_ROOT, exist_ok=True)
-    print("Manager initialized successfully")
+    if verbose:
+        print("Manager initialized successfully")
 
 def get_game_url(alias, protocol='http', port=None):
     """
@@ -0,0 +1,354 @@
+"""
+GalHub - 内存统计模块
+统计服务器进程的RSS和进程内各数据结构（日志缓冲、各种缓存）的大小，
+按需用 tracemalloc 拍摄内存快照并与上一次快照比较，找出分配内存最多的代码行
+"""
+
+import gc
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import types
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from logstats import format_bytes
+
+# 计算一个数据结构的大小时最多遍历的对象数，超出时结果为下限
+MAX_SIZEOF_OBJECTS = 500000
+# 没有锁保护的数据结构在遍历时被修改的重试次数
+MEASURE_ATTEMPTS = 3
+# tracemalloc 默认记录的调用栈深度和快照中默认显示的条目数
+TRACE_FRAMES = 1
+TOP_ENTRIES = 20
+# 快照的分组方式
+GROUP_KEYS = ("lineno", "filename", "traceback")
+# 命令行查询服务器时的超时时间（秒）
+REQUEST_TIMEOUT = 60
+
+# 快照中忽略的内部分配
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+def get_process_memory():
+    """
+    获取当前进程的内存占用
+
+    Returns:
+        dict: rss（当前常驻内存）和 peak_rss（峰值），无法获取的项为None
+    """
+    memory = {'rss': None, 'peak_rss': None}
+    try:
+        # Linux
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    memory['rss' if key == "VmRSS" else 'peak_rss'] = int(value.split()[0]) * 1024
+        return memory
+    except OSError:
+        pass
+    if sys.platform == "win32":
+        return get_windows_memory()
+    try:
+        import resource
+        # macOS 上 ru_maxrss 以字节为单位，其他系统以KB为单位
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory['peak_rss'] = peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        pass
+    return memory
+
+def get_windows_memory():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return {'rss': counters.WorkingSetSize, 'peak_rss': counters.PeakWorkingSetSize}
+    except (AttributeError, OSError):
+        pass
+    return {'rss': None, 'peak_rss': None}
+
+def deep_sizeof(obj, max_objects=MAX_SIZEOF_OBJECTS):
+    """
+    估算对象及其引用的容器、字符串等占用的内存（同一对象只计算一次）
+
+    Returns:
+        tuple: (字节数, 对象数, 是否因超出 max_objects 而提前结束)
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        if len(seen) >= max_objects:
+            return total, len(seen), True
+        current = stack.pop()
+        # 类、模块和函数属于代码而不是数据，不计算
+        if id(current) in seen or isinstance(current, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)) or hasattr(current, "maxlen"):
+            stack.extend(current)
+        elif hasattr(current, "__dict__"):
+            stack.append(vars(current))
+        elif hasattr(current, "__slots__"):
+            names = (current.__slots__,) if isinstance(current.__slots__, str) else current.__slots__
+            stack.extend(getattr(current, name) for name in names if hasattr(current, name))
+    return total, len(seen), False
+
+def measure_structures(structures):
+    """
+    统计各数据结构的条目数和估算大小
+
+    Args:
+        structures (dict): 名称到 (对象, 锁) 的映射，锁为None表示不需要加锁
+
+    Returns:
+        dict: 名称到 {entries, bytes, objects, truncated} 的映射
+    """
+    result = {}
+    for name, (obj, lock) in structures.items():
+        if obj is None:
+            continue
+        for attempt in range(MEASURE_ATTEMPTS):
+            try:
+                if lock is not None:
+                    with lock:
+                        size, objects, truncated = deep_sizeof(obj)
+                else:
+                    # 没有锁保护的结构可能在遍历时被其他线程修改，重试几次
+                    size, objects, truncated = deep_sizeof(obj)
+                break
+            except RuntimeError:
+                size = objects = None
+                truncated = True
+        entries = len(obj) if hasattr(obj, "__len__") else None
+        result[name] = {'entries': entries, 'bytes': size, 'objects': objects, 'truncated': truncated}
+    return result
+
+def format_statistics(stats, top, diff=False):
+    """把 tracemalloc 的统计结果转换为可序列化的列表"""
+    entries = []
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        entry = {
+            'location': f"{frame.filename}:{frame.lineno}",
+            'size': stat.size,
+            'count': stat.count,
+        }
+        if len(stat.traceback) > 1:
+            entry['traceback'] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        if diff:
+            entry['size_diff'] = stat.size_diff
+            entry['count_diff'] = stat.count_diff
+        entries.append(entry)
+    return entries
+
+class MemoryTracer:
+    """
+    管理 tracemalloc：开启、停止、拍摄快照并与上一次快照比较，线程安全
+
+    tracemalloc 开启期间每次分配都要记录调用栈，会明显降低速度并增加内存占用，排查完毕后应停止。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.previous = None
+        self.previous_time = None
+        self.snapshots = 0
+
+    def start(self, frames=TRACE_FRAMES):
+        with self.lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(max(1, frames))
+            self.previous = None
+            self.previous_time = None
+
+    def stop(self):
+        with self.lock:
+            tracemalloc.stop()
+            self.previous = None
+            self.previous_time = None
+
+    def snapshot(self, top=TOP_ENTRIES, group="lineno"):
+        """
+        拍摄快照，返回分配最多的位置以及与上一次快照相比增长最多的位置
+
+        Args:
+            top (int): 返回的条目数
+            group (str): 分组方式：lineno（代码行）、filename（文件）或 traceback（调用栈）
+
+        Returns:
+            dict: top、diff（第一次快照时为None）、traced_bytes 和 peak_bytes
+        """
+        if group not in GROUP_KEYS:
+            raise ValueError(f"group must be one of {', '.join(GROUP_KEYS)}")
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running")
+            snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            traced, peak = tracemalloc.get_traced_memory()
+            result = {
+                'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'traced_bytes': traced,
+                'peak_bytes': peak,
+                'top': format_statistics(snapshot.statistics(group), top),
+                'diff': None,
+                'previous_time': self.previous_time,
+            }
+            if self.previous is not None:
+                result['diff'] = format_statistics(snapshot.compare_to(self.previous, group), top, diff=True)
+            self.previous = snapshot
+            self.previous_time = result['time']
+            self.snapshots += 1
+        return result
+
+    def get_stats(self):
+        with self.lock:
+            tracing = tracemalloc.is_tracing()
+            traced, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+            return {
+                'tracing': tracing,
+                'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+                'traced_bytes': traced,
+                'peak_bytes': peak,
+                'snapshots': self.snapshots,
+                'previous_snapshot': self.previous_time,
+            }
+
+def get_memory_report(structures, tracer):
+    """
+    生成内存报告
+
+    Args:
+        structures (dict): 名称到 (对象, 锁) 的映射，见 measure_structures()
+        tracer (MemoryTracer): tracemalloc 管理器
+
+    Returns:
+        dict: process、structures、gc、threads 和 tracemalloc
+    """
+    return {
+        'pid': os.getpid(),
+        'process': get_process_memory(),
+        'structures': measure_structures(structures),
+        'gc': {'counts': gc.get_count(), 'tracked_objects': len(gc.get_objects())},
+        'threads': threading.active_count(),
+        'tracemalloc': tracer.get_stats(),
+    }
+
+# ---------- 命令行 ----------
+
+def request_memory_api(url, token, params=None):
+    """调用服务器的 /api/memory，params 不为None时使用POST"""
+    address = url.rstrip("/") + "/api/memory"
+    if params:
+        address += "?" + urllib.parse.urlencode(params)
+    request = urllib.request.Request(address, data=b"" if params is not None else None,
+                                     headers={"Authorization": f"Bearer {token}"})
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+def print_snapshot(snapshot):
+    print(f"\ntracemalloc snapshot at {snapshot['time']}: traced {format_bytes(snapshot['traced_bytes'])}, "
+          f"peak {format_bytes(snapshot['peak_bytes'])}")
+    print("\nTop allocations:")
+    for entry in snapshot['top']:
+        print(f"  {format_bytes(entry['size']):>11}  {entry['count']:>8} blocks  {entry['location']}")
+    if snapshot['diff'] is not None:
+        print(f"\nGrowth since {snapshot['previous_time']}:")
+        for entry in snapshot['diff']:
+            size = ("+" if entry['size_diff'] >= 0 else "-") + format_bytes(abs(entry['size_diff']))
+            print(f"  {size:>11}  {entry['count_diff']:>+8} blocks  "
+                  f"{entry['location']}")
+
+def print_report(report):
+    process = report['process']
+    rss = format_bytes(process['rss']) if process['rss'] is not None else "unknown"
+    peak = format_bytes(process['peak_rss']) if process['peak_rss'] is not None else "unknown"
+    print(f"Process {report['pid']}: RSS {rss}, peak {peak}, {report['threads']} threads, "
+          f"{report['gc']['tracked_objects']} GC-tracked objects")
+    in_flight = report.get('in_flight')
+    if in_flight:
+        print(f"In flight: {in_flight['requests']} request(s), "
+              f"~{format_bytes(in_flight['buffer_bytes'])} in response buffers")
+    print("\nStructures:")
+    for name, entry in sorted(report['structures'].items(), key=lambda item: -(item[1]['bytes'] or 0)):
+        if entry['bytes'] is None:
+            size = "busy"
+        else:
+            size = format_bytes(entry['bytes']) + ("+" if entry['truncated'] else "")
+        entries = "" if entry['entries'] is None else f"{entry['entries']} entries"
+        print(f"  {name:<24} {size:>12}  {entries}")
+    tracing = report['tracemalloc']
+    if tracing['tracing']:
+        print(f"\ntracemalloc: on ({tracing['frames']} frame(s)), traced {format_bytes(tracing['traced_bytes'])}, "
+              f"{tracing['snapshots']} snapshot(s)")
+    else:
+        print("\ntracemalloc: off")
+
+def run_memory_command(url, token, action=None, frames=TRACE_FRAMES, top=TOP_ENTRIES, group="lineno"):
+    """
+    查询运行中的服务器的内存占用，或控制 tracemalloc
+
+    Args:
+        url (str): 服务器地址
+        token (str): 管理令牌（设置项 admin_token）
+        action (str): None（只输出报告）、start、stop 或 snapshot
+        frames (int): 开启 tracemalloc 时记录的调用栈深度
+        top (int): 快照中显示的条目数
+        group (str): 快照的分组方式
+
+    Returns:
+        bool: 成功返回True
+    """
+    if not token:
+        print("Error: admin_token is not set (python main.py config admin_token <token>)")
+        return False
+    try:
+        if action == "snapshot":
+            print_snapshot(request_memory_api(url, token, {'snapshot': 1, 'top': top, 'group': group}))
+        elif action in ("start", "stop"):
+            request_memory_api(url, token, {'tracemalloc': action, 'frames': frames})
+            print(f"tracemalloc {'started' if action == 'start' else 'stopped'}")
+        else:
+            print_report(request_memory_api(url, token))
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read().decode("utf-8")).get('error', e.reason)
+        except ValueError:
+            message = e.reason
+        print(f"Error: HTTP {e.code}: {message}")
+        return False
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Error: cannot reach {url}: {e}")
+        return False
+    return True
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+GalHub - 404缓存模块
+缓存不存在的游戏别名和文件路径，重复的404请求不再查询数据库和文件系统
+"""
+
+import html
+import http.server
+import threading
+import time
+from collections import OrderedDict
+from database import get_catalog_version, load_typed_settings
+
+# 设置表中的404缓存配置项
+NEGATIVE_CACHE_SETTINGS = {
+    'negative_cache_entries': 10000,   # 最多缓存的条目数，0表示不缓存
+    'negative_cache_ttl': 60,          # 条目有效期（秒），直接修改游戏目录中的文件后最迟在此时间后生效
+}
+# 检查游戏目录是否变化（数据库中最新的变更序号）的最短间隔（秒）
+CATALOG_CHECK_INTERVAL = 1.0
+
+def render_error_page(code, message):
+    """按 http.server 默认的错误页格式预先生成响应内容"""
+    short, explain = http.server.BaseHTTPRequestHandler.responses[code]
+    return (http.server.DEFAULT_ERROR_MESSAGE % {
+        'code': code,
+        'message': html.escape(message, quote=False),
+        'explain': html.escape(explain, quote=False),
+    }).encode('utf-8', 'replace')
+
+class NegativeCache:
+    """
+    不存在的游戏别名和文件路径的有界缓存，线程安全
+
+    键为 (别名, None) 时表示整个别名不存在，为 (别名, 路径) 时表示游戏中的文件不存在。
+    游戏目录变化（新增、删除或同步了游戏）时清空全部条目；检查变化最多每秒查询一次数据库。
+    """
+    def __init__(self, max_entries=NEGATIVE_CACHE_SETTINGS['negative_cache_entries'],
+                 ttl=NEGATIVE_CACHE_SETTINGS['negative_cache_ttl']):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.catalog_version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.invalidations = 0
+
+    def check_catalog(self, now):
+        # 调用方需持有 self.lock
+        if now - self.checked_at < CATALOG_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        try:
+            version = get_catalog_version()
+        except Exception:
+            version = None
+        if version != self.catalog_version:
+            self.catalog_version = version
+            if self.entries:
+                self.entries.clear()
+                self.invalidations += 1
+
+    def lookup(self, alias, path):
+        """
+        判断请求是否已知为404
+
+        Args:
+            alias (str): 游戏别名
+            path (str): 游戏中的文件路径
+
+        Returns:
+            bool: 别名或文件已知不存在时返回True
+        """
+        if not self.max_entries:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.check_catalog(now)
+            for key in ((alias, None), (alias, path)):
+                expires = self.entries.get(key)
+                if expires is None:
+                    continue
+                if expires < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+        return False
+
+    def add(self, alias, path=None):
+        """
+        记录不存在的别名（path为None）或文件
+
+        Args:
+            alias (str): 游戏别名
+            path (str): 游戏中的文件路径
+        """
+        if not self.max_entries:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.check_catalog(now)
+            self.entries[(alias, path)] = now + self.ttl
+            self.entries.move_to_end((alias, path))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, alias=None):
+        """
+        删除缓存条目
+
+        Args:
+            alias (str): 只删除该游戏的条目，None表示全部删除
+        """
+        with self.lock:
+            if alias is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0] == alias]:
+                    del self.entries[key]
+            self.invalidations += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'invalidations': self.invalidations,
+            }
+
+def load_negative_cache():
+    """
+    根据设置表中的配置创建404缓存
+
+    Returns:
+        NegativeCache: 404缓存
+    """
+    values = load_typed_settings(NEGATIVE_CACHE_SETTINGS)
+    return NegativeCache(values['negative_cache_entries'], values['negative_cache_ttl'])
\ No newline at end of file
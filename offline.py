@@ -0,0 +1,245 @@
+"""
+GalHub - 离线缓存模块
+为选择启用离线缓存的游戏生成 Service Worker 和预缓存清单：浏览器第一次访问时缓存整个游戏，
+之后只下载哈希变化的文件，断网时也能完整加载
+"""
+
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+from assetfiles import WEBP_SUFFIX, write_file
+from preload import ENTRY_PAGE
+
+# 生成的 Service Worker 脚本和预缓存清单，放在游戏根目录中
+SW_SCRIPT = "galhub-sw.js"
+PRECACHE_MANIFEST = "galhub-precache.json"
+OFFLINE_FILES = (SW_SCRIPT, PRECACHE_MANIFEST)
+# 预缓存地址中附带的哈希长度
+URL_HASH_LENGTH = 16
+# 同时下载的文件数
+PRECACHE_CONCURRENCY = 6
+
+# 注入入口页面的注册脚本，页面加载完成后再注册，不与首屏资源争抢带宽
+REGISTER_SCRIPT = (
+    '<script data-galhub-sw>if("serviceWorker"in navigator)addEventListener("load",function(){'
+    'navigator.serviceWorker.register(__SCRIPT__,{scope:__SCOPE__}).catch(function(){})});</script>\n'
+)
+REGISTER_PATTERN = re.compile(rb'<script data-galhub-sw>.*?</script>\n?', re.S)
+REGISTER_ANCHOR = re.compile(rb'</head\s*>|</body\s*>', re.I)
+
+SERVICE_WORKER = """// GalHub 离线缓存，由服务器根据游戏文件清单生成，请勿手动修改
+const VERSION = __VERSION__;
+const CACHE = __CACHE__;
+const MANIFEST = __MANIFEST__;
+const ENTRY = __ENTRY__;
+const CONCURRENCY = __CONCURRENCY__;
+const SCOPE = new URL(self.registration.scope);
+const MANIFEST_URL = new URL(MANIFEST + "?v=" + VERSION, SCOPE).href;
+let files = null;
+
+function loadFiles(manifest) {
+    return new Map(manifest.files.map(file => [file.path, new URL(file.url, SCOPE).href]));
+}
+
+// 安装：下载预缓存清单，只下载缓存中没有的（哈希变化的）文件
+self.addEventListener("install", event => {
+    event.waitUntil((async () => {
+        const response = await fetch(MANIFEST_URL, {cache: "no-store"});
+        if (!response.ok) {
+            throw new Error("precache manifest: HTTP " + response.status);
+        }
+        const manifest = await response.clone().json();
+        const cache = await caches.open(CACHE);
+        const cached = new Set((await cache.keys()).map(request => request.url));
+        const missing = [...loadFiles(manifest).values()].filter(url => !cached.has(url));
+        for (let i = 0; i < missing.length; i += CONCURRENCY) {
+            await Promise.all(missing.slice(i, i + CONCURRENCY).map(async url => {
+                const file = await fetch(url, {cache: "no-cache"});
+                if (!file.ok) {
+                    throw new Error(url + ": HTTP " + file.status);
+                }
+                await cache.put(url, file);
+            }));
+        }
+        await cache.put(MANIFEST_URL, response);
+    })());
+});
+
+// 激活：删除不在当前清单中的旧版本文件
+self.addEventListener("activate", event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(CACHE);
+        const response = await cache.match(MANIFEST_URL);
+        if (response) {
+            files = loadFiles(await response.json());
+            const keep = new Set(files.values());
+            keep.add(MANIFEST_URL);
+            for (const request of await cache.keys()) {
+                if (!keep.has(request.url)) {
+                    await cache.delete(request);
+                }
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+async function getFiles() {
+    if (files === null) {
+        const response = await caches.match(MANIFEST_URL, {cacheName: CACHE});
+        files = response ? loadFiles(await response.json()) : new Map();
+    }
+    return files;
+}
+
+// 请求：游戏中的文件优先从缓存返回，缓存中没有时从网络获取
+self.addEventListener("fetch", event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== "GET" || url.origin !== SCOPE.origin || !url.pathname.startsWith(SCOPE.pathname)) {
+        return;
+    }
+    let path;
+    try {
+        path = decodeURIComponent(url.pathname.slice(SCOPE.pathname.length));
+    } catch (e) {
+        return;
+    }
+    if (path === "" || path.endsWith("/")) {
+        path += ENTRY;
+    }
+    event.respondWith((async () => {
+        const hashed = (await getFiles()).get(path);
+        const cached = hashed && await caches.match(hashed, {cacheName: CACHE});
+        return cached || fetch(request);
+    })());
+});
+"""
+
+# 停用离线缓存后替换原来的脚本：浏览器检查更新时安装此脚本，删除缓存并注销自己
+RETIRED_SERVICE_WORKER = """// GalHub 离线缓存已停用
+self.addEventListener("install", () => self.skipWaiting());
+self.addEventListener("activate", event => {
+    event.waitUntil((async () => {
+        await caches.delete(__CACHE__);
+        await self.registration.unregister();
+    })());
+});
+"""
+
+def render(template, **values):
+    """把模板中的 __NAME__ 替换为JSON编码的值"""
+    for name, value in values.items():
+        template = template.replace(f"__{name}__", json.dumps(value, ensure_ascii=False))
+    return template
+
+def get_cache_name(alias):
+    return f"galhub-{alias}"
+
+def is_offline_enabled(game_dir):
+    """游戏目录中有预缓存清单时表示已启用离线缓存"""
+    return os.path.isfile(os.path.join(game_dir, PRECACHE_MANIFEST))
+
+def is_precached(path, paths):
+    """生成的文件和优化时生成的WebP版本（页面不直接引用）不需要预缓存"""
+    if path in OFFLINE_FILES:
+        return False
+    return not (path.endswith(WEBP_SUFFIX) and path[:-len(WEBP_SUFFIX)] in paths)
+
+def build_precache(manifest):
+    """
+    根据文件清单生成预缓存清单，地址中附带内容哈希，文件变化后地址随之变化
+
+    Args:
+        manifest (list): 文件清单（path, size, mtime, sha256）
+
+    Returns:
+        dict: 预缓存清单（version, total_bytes, files）
+    """
+    paths = {entry['path'] for entry in manifest}
+    files = []
+    digest = hashlib.sha256()
+    for entry in sorted(manifest, key=lambda entry: entry['path']):
+        if not is_precached(entry['path'], paths):
+            continue
+        files.append({
+            'path': entry['path'],
+            'url': urllib.parse.quote(entry['path']) + "?v=" + entry['sha256'][:URL_HASH_LENGTH],
+            'size': entry['size'],
+            'sha256': entry['sha256'],
+        })
+        digest.update(f"{entry['path']}\0{entry['sha256']}\n".encode('utf-8'))
+    return {
+        'version': digest.hexdigest()[:URL_HASH_LENGTH],
+        'total_bytes': sum(f['size'] for f in files),
+        'files': files,
+    }
+
+def update_entry_page(game_dir, alias, enabled):
+    """
+    在入口页面中插入或删除注册脚本
+
+    Returns:
+        dict: 入口页面新的清单条目信息，入口页面不存在时返回None
+    """
+    entry_path = os.path.join(game_dir, ENTRY_PAGE)
+    if not os.path.isfile(entry_path):
+        return None
+    with open(entry_path, "rb") as f:
+        html = f.read()
+    data = REGISTER_PATTERN.sub(b"", html)
+    if enabled:
+        script = render(REGISTER_SCRIPT, SCRIPT=f"/{alias}/{SW_SCRIPT}", SCOPE=f"/{alias}/").encode('utf-8')
+        anchor = REGISTER_ANCHOR.search(data)
+        position = anchor.start() if anchor else len(data)
+        data = data[:position] + script + data[position:]
+    return write_file(entry_path, data)
+
+def write_offline_file(game_dir, path, data, entries):
+    entries[path] = dict(write_file(os.path.join(game_dir, path), data.encode('utf-8')), path=path)
+
+def generate_offline_bundle(alias, game_dir, manifest):
+    """
+    生成或更新游戏的 Service Worker 和预缓存清单，并在入口页面中注册
+
+    Args:
+        alias (str): 游戏别名
+        game_dir (str): 游戏目录
+        manifest (list): 文件清单（path, size, mtime, sha256）
+
+    Returns:
+        list: 更新后的文件清单
+    """
+    entries = {entry['path']: dict(entry) for entry in manifest}
+    entry = update_entry_page(game_dir, alias, True)
+    if entry is not None:
+        entries[ENTRY_PAGE] = dict(entry, path=ENTRY_PAGE)
+
+    precache = build_precache(list(entries.values()))
+    write_offline_file(game_dir, PRECACHE_MANIFEST, json.dumps(precache, ensure_ascii=False, indent=1), entries)
+    write_offline_file(game_dir, SW_SCRIPT, render(
+        SERVICE_WORKER, VERSION=precache['version'], CACHE=get_cache_name(alias), MANIFEST=PRECACHE_MANIFEST,
+        ENTRY=ENTRY_PAGE, CONCURRENCY=PRECACHE_CONCURRENCY), entries)
+    return [entries[path] for path in sorted(entries)]
+
+def remove_offline_bundle(alias, game_dir, manifest):
+    """
+    停用离线缓存：删除注册脚本和预缓存清单，Service Worker 替换为删除缓存并注销自己的脚本
+
+    已安装的 Service Worker 只有在脚本更新后才会停止工作，因此不能直接删除脚本文件。
+
+    Returns:
+        list: 更新后的文件清单
+    """
+    entries = {entry['path']: dict(entry) for entry in manifest}
+    entry = update_entry_page(game_dir, alias, False)
+    if entry is not None:
+        entries[ENTRY_PAGE] = dict(entry, path=ENTRY_PAGE)
+    precache_path = os.path.join(game_dir, PRECACHE_MANIFEST)
+    if os.path.exists(precache_path):
+        os.remove(precache_path)
+    entries.pop(PRECACHE_MANIFEST, None)
+    write_offline_file(game_dir, SW_SCRIPT, render(RETIRED_SERVICE_WORKER, CACHE=get_cache_name(alias)), entries)
+    return [entries[path] for path in sorted(entries)]
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""
+GalHub - 资源优化模块
+压缩游戏中的JS、CSS、JSON，无损重新压缩PNG/JPEG，可选生成WebP版本；优化后不更小的文件保持原样
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from assetfiles import WEBP_SUFFIX, write_file
+
+# 调用外部优化工具的超时时间（秒）
+TOOL_TIMEOUT = 120
+
+# 可用的外部工具，按优先顺序排列；找不到时跳过对应类型的优化
+TOOLS = {
+    "js": [
+        ("esbuild", lambda src, dst: ["esbuild", src, "--minify", f"--outfile={dst}", "--log-level=error"]),
+        ("terser", lambda src, dst: ["terser", src, "--compress", "--mangle", "--output", dst]),
+    ],
+    "css": [
+        ("esbuild", lambda src, dst: ["esbuild", src, "--minify", f"--outfile={dst}", "--log-level=error"]),
+    ],
+    "png": [
+        ("oxipng", lambda src, dst: ["oxipng", "--quiet", "--opt", "2", "--strip", "safe", "--out", dst, src]),
+        ("optipng", lambda src, dst: ["optipng", "-quiet", "-o2", "-out", dst, src]),
+    ],
+    "jpeg": [
+        ("jpegtran", lambda src, dst: ["jpegtran", "-copy", "all", "-optimize", "-progressive", "-outfile", dst, src]),
+    ],
+    "webp_png": [
+        ("cwebp", lambda src, dst: ["cwebp", "-quiet", "-lossless", src, "-o", dst]),
+    ],
+    "webp_jpeg": [
+        ("cwebp", lambda src, dst: ["cwebp", "-quiet", "-q", "90", src, "-o", dst]),
+    ],
+}
+
+# 文件扩展名对应的优化类型
+FILE_KINDS = {
+    ".js": "js",
+    ".mjs": "js",
+    ".css": "css",
+    ".json": "json",
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+}
+
+# CSS中的字符串、注释和空白
+CSS_TOKEN_PATTERN = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)|(\s+)', re.S)
+CSS_PUNCTUATION_PATTERN = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+
+def find_tool(kind):
+    """
+    查找某类优化可用的外部工具
+
+    Returns:
+        tuple: (工具名, 生成命令行的函数)，没有可用工具时返回None
+    """
+    for name, command in TOOLS.get(kind, []):
+        if shutil.which(name):
+            return name, command
+    return None
+
+def minify_json(data):
+    """去掉JSON中的空白，内容不是合法JSON时返回None"""
+    try:
+        value = json.loads(data.decode("utf-8-sig"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def minify_css(data):
+    """
+    保守地压缩CSS：去掉注释（保留 /*! 开头的版权注释）和多余的空白，字符串内容保持不变
+
+    Returns:
+        bytes: 压缩后的内容，无法按UTF-8解码时返回None
+    """
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    parts = []
+    position = 0
+
+    def add_code(code):
+        code = CSS_PUNCTUATION_PATTERN.sub(lambda match: match.group(1) or match.group(2), code)
+        parts.append(code.replace(";}", "}"))
+
+    code = ""
+    for match in CSS_TOKEN_PATTERN.finditer(text):
+        code += text[position:match.start()]
+        position = match.end()
+        string, comment, _ = match.groups()
+        if string:
+            add_code(code)
+            parts.append(string)
+            code = ""
+        elif comment and comment.startswith("/*!"):
+            add_code(code)
+            parts.append(comment)
+            code = ""
+        else:
+            code += " "
+    add_code(code + text[position:])
+    return "".join(parts).strip().encode("utf-8")
+
+def run_tool(command, src, dst):
+    """运行外部工具，成功时返回输出文件的内容"""
+    try:
+        subprocess.run(command(src, dst), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       timeout=TOOL_TIMEOUT, check=True)
+        with open(dst, "rb") as f:
+            return f.read()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    finally:
+        if os.path.exists(dst):
+            os.remove(dst)
+
+def optimize_file(task):
+    """
+    优化单个文件，在进程池中执行
+
+    Args:
+        task (tuple): (游戏目录, 以/分隔的相对路径, 是否生成WebP版本)
+
+    Returns:
+        dict: 优化结果（path, kind, before, after, tool, entry, webp）
+    """
+    game_dir, relative, webp = task
+    path = os.path.join(game_dir, *relative.split("/"))
+    kind = FILE_KINDS[os.path.splitext(relative)[1].lower()]
+    with open(path, "rb") as f:
+        original = f.read()
+    result = {"path": relative, "kind": kind, "before": len(original), "after": len(original),
+              "tool": None, "entry": None, "webp": None}
+
+    optimized = None
+    if kind == "json":
+        optimized, result["tool"] = minify_json(original), "builtin"
+    else:
+        tool = find_tool(kind)
+        if tool:
+            result["tool"] = tool[0]
+            optimized = run_tool(tool[1], path, path + ".opt" + os.path.splitext(path)[1])
+        elif kind == "css":
+            optimized, result["tool"] = minify_css(original), "builtin"
+
+    # 只有更小时才替换原文件
+    if optimized and len(optimized) < len(original):
+        result["entry"] = write_file(path, optimized)
+        result["after"] = len(optimized)
+
+    if webp and kind in ("png", "jpeg"):
+        tool = find_tool("webp_" + kind)
+        if tool:
+            data = run_tool(tool[1], path, path + ".opt" + WEBP_SUFFIX)
+            if data and len(data) < result["after"]:
+                result["webp"] = dict(write_file(path + WEBP_SUFFIX, data), path=relative + WEBP_SUFFIX)
+            elif os.path.exists(path + WEBP_SUFFIX):
+                # 之前生成的WebP版本已不比原图小
+                os.remove(path + WEBP_SUFFIX)
+    return result
+
+def optimize_game(game_dir, manifest, webp=False, workers=None):
+    """
+    优化游戏目录中的资源文件，并更新文件清单
+
+    Args:
+        game_dir (str): 游戏目录
+        manifest (list): 文件清单（path, size, mtime, sha256）
+        webp (bool): 是否为PNG/JPEG生成WebP版本
+        workers (int): 进程数，None表示使用CPU核数
+
+    Returns:
+        tuple: (更新后的文件清单, 优化报告)
+    """
+    entries = {entry["path"]: dict(entry) for entry in manifest}
+    tasks = [(game_dir, path, webp) for path in entries
+             if os.path.splitext(path)[1].lower() in FILE_KINDS]
+    report = {"files": 0, "optimized": 0, "bytes_before": 0, "bytes_after": 0,
+              "webp_files": 0, "webp_bytes": 0, "skipped": {}}
+
+    if len(tasks) <= 1 or workers == 1:
+        results = map(optimize_file, tasks)
+        executor = None
+    else:
+        # 上传接口在服务器的请求处理线程中调用，fork可能复制其他线程持有的锁，改用spawn启动新解释器
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = executor.map(optimize_file, tasks, chunksize=16)
+    try:
+        for result in results:
+            report["files"] += 1
+            report["bytes_before"] += result["before"]
+            report["bytes_after"] += result["after"]
+            if result["tool"] is None:
+                report["skipped"][result["kind"]] = report["skipped"].get(result["kind"], 0) + 1
+            if result["entry"]:
+                report["optimized"] += 1
+                entries[result["path"]].update(result["entry"])
+            if result["webp"]:
+                report["webp_files"] += 1
+                report["webp_bytes"] += result["webp"]["size"]
+                entries[result["webp"]["path"]] = result["webp"]
+            elif result["path"] + WEBP_SUFFIX in entries and not os.path.exists(
+                    os.path.join(game_dir, *(result["path"] + WEBP_SUFFIX).split("/"))):
+                del entries[result["path"] + WEBP_SUFFIX]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return [entries[path] for path in sorted(entries)], report
+
+def format_report(alias, report):
+    """生成一行优化报告"""
+    saved = report["bytes_before"] - report["bytes_after"]
+    percent = saved * 100 / report["bytes_before"] if report["bytes_before"] else 0
+    text = (f"{alias}: {report['optimized']}/{report['files']} file(s) optimized, "
+            f"{report['bytes_before']} -> {report['bytes_after']} bytes (saved {saved} bytes, {percent:.1f}%)")
+    if report["webp_files"]:
+        text += f", {report['webp_files']} WebP variant(s) ({report['webp_bytes']} bytes)"
+    if report.get("skipped"):
+        text += ", no tool for: " + ", ".join(f"{kind} x{count}" for kind, count in sorted(report["skipped"].items()))
+    return text
\ No newline at end of file
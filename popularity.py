@@ -0,0 +1,120 @@
+"""
+GalHub - 游戏热度统计模块
+在内存中累计每个游戏的游玩次数和发送字节数，由后台线程定期批量写入数据库
+"""
+
+import threading
+from database import add_game_stats, load_typed_settings
+
+# 设置表中的热度统计配置项
+POPULARITY_SETTINGS = {
+    'stats_flush_interval': 10.0,  # 计数写入数据库的间隔（秒），可以是小数
+}
+
+class PopularityCounter:
+    """
+    每个游戏的游玩次数和发送字节数计数器，线程安全
+
+    请求处理线程只更新内存中的计数，写入数据库由 flush() 在一个事务中批量完成，
+    写入失败时计数保留到下一次写入。
+    """
+    def __init__(self, flush_interval=POPULARITY_SETTINGS['stats_flush_interval']):
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def record(self, alias, nbytes, play=False):
+        """
+        记录一次响应
+
+        Args:
+            alias (str): 游戏别名
+            nbytes (int): 发送的字节数
+            play (bool): 是否为游戏入口页面的完整请求，计为一次游玩
+        """
+        with self.lock:
+            counts = self.pending.get(alias)
+            if counts is None:
+                counts = self.pending[alias] = [0, 0]
+            counts[0] += play
+            counts[1] += nbytes
+
+    def get_pending(self):
+        """
+        获取尚未写入数据库的计数
+
+        Returns:
+            dict: 游戏别名到 (游玩次数, 发送字节数) 的映射
+        """
+        with self.lock:
+            return {alias: tuple(counts) for alias, counts in self.pending.items()}
+
+    def flush(self):
+        """
+        把累计的计数写入数据库
+
+        Returns:
+            int: 写入的游戏数
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        try:
+            add_game_stats(pending)
+        except Exception:
+            # 写回内存，下次再试
+            with self.lock:
+                for alias, (plays, nbytes) in pending.items():
+                    counts = self.pending.setdefault(alias, [0, 0])
+                    counts[0] += plays
+                    counts[1] += nbytes
+                self.flush_errors += 1
+            raise
+        self.flushes += 1
+        return len(pending)
+
+    def run(self, stop_event, log=None):
+        """
+        定期写入计数，直到 stop_event 被设置；退出前再写入一次
+
+        Args:
+            stop_event (threading.Event): 停止事件
+            log (callable): 写入失败时输出日志的函数
+        """
+        while True:
+            stopped = stop_event.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                if log:
+                    log(f"Failed to save game stats: {e}")
+            if stopped:
+                return
+
+    def start(self, stop_event, log=None):
+        """在后台线程中定期写入计数"""
+        thread = threading.Thread(target=self.run, args=(stop_event, log), daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'flush_interval': self.flush_interval,
+                'pending_games': len(self.pending),
+                'flushes': self.flushes,
+                'flush_errors': self.flush_errors,
+            }
+
+def load_popularity_counter():
+    """
+    根据设置表中的配置创建热度计数器
+
+    Returns:
+        PopularityCounter: 热度计数器
+    """
+    interval = load_typed_settings(POPULARITY_SETTINGS)['stats_flush_interval']
+    return PopularityCounter(max(interval, 0.1))
\ No newline at end of file
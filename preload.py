@@ -0,0 +1,122 @@
+"""
+GalHub - 预加载提示模块
+分析游戏入口页面，找出首屏需要的脚本、样式和图片，生成 Link: rel=preload 响应头
+"""
+
+import os
+import urllib.parse
+from html.parser import HTMLParser
+
+# 入口页面文件名
+ENTRY_PAGE = "index.html"
+# 每个游戏最多生成的预加载提示数
+MAX_HINTS = 8
+# 最多预加载的图片数（只取页面中靠前的非懒加载图片）
+MAX_IMAGES = 2
+# 分析入口页面时最多读取的字节数
+MAX_ENTRY_BYTES = 1024 * 1024
+
+class EntryPageParser(HTMLParser):
+    """收集入口页面中引用的关键子资源"""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.resources = []
+        self.images = 0
+
+    def add(self, url, as_type, rel="preload", crossorigin=None):
+        if url and not url.startswith(("data:", "blob:", "#")):
+            self.resources.append({"url": url.strip(), "as": as_type, "rel": rel, "crossorigin": crossorigin})
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        crossorigin = attrs.get("crossorigin")
+        if tag == "base" and self.base is None and attrs.get("href"):
+            self.base = attrs["href"]
+        elif tag == "script" and attrs.get("src"):
+            rel = "modulepreload" if attrs.get("type", "").lower() == "module" else "preload"
+            self.add(attrs["src"], "script", rel, crossorigin)
+        elif tag == "link" and attrs.get("href"):
+            rels = attrs.get("rel", "").lower().split()
+            if "stylesheet" in rels:
+                self.add(attrs["href"], "style", crossorigin=crossorigin)
+            elif "modulepreload" in rels:
+                self.add(attrs["href"], "script", "modulepreload", crossorigin)
+            elif "preload" in rels and attrs.get("as"):
+                # 页面自己声明的预加载，提前到响应头中
+                self.add(attrs["href"], attrs["as"].lower(), crossorigin=crossorigin)
+        elif tag == "img" and attrs.get("src") and self.images < MAX_IMAGES:
+            if attrs.get("loading", "").lower() != "lazy":
+                self.images += 1
+                self.add(attrs["src"], "image", crossorigin=crossorigin)
+
+def analyze_entry_page(game_dir):
+    """
+    分析游戏入口页面，生成预加载提示
+
+    只保留游戏目录中实际存在的文件，外部地址和不存在的文件被忽略。
+
+    Args:
+        game_dir (str): 游戏目录
+
+    Returns:
+        list: 预加载提示字典列表（url, as, rel, crossorigin），url 为相对游戏目录的地址
+    """
+    entry_path = os.path.join(game_dir, ENTRY_PAGE)
+    if not os.path.isfile(entry_path):
+        return []
+    with open(entry_path, "rb") as f:
+        html = f.read(MAX_ENTRY_BYTES).decode("utf-8", errors="replace")
+
+    parser = EntryPageParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # 不规范的页面只使用已解析出的部分
+        pass
+
+    # 以 /_/ 代表游戏根目录解析相对地址，超出游戏目录的地址会被过滤
+    page_url = urllib.parse.urljoin("/_/", parser.base or "")
+    game_root = os.path.abspath(game_dir)
+    hints = []
+    seen = set()
+    for resource in parser.resources:
+        url = urllib.parse.urljoin(page_url, resource["url"])
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme or parts.netloc or not parts.path.startswith("/_/"):
+            continue
+        relative = parts.path[len("/_/"):]
+        file_path = os.path.abspath(os.path.join(game_root, urllib.parse.unquote(relative)))
+        if not file_path.startswith(game_root + os.sep) or not os.path.isfile(file_path):
+            continue
+        relative += "?" + parts.query if parts.query else ""
+        if relative in seen:
+            continue
+        seen.add(relative)
+        hints.append(dict(resource, url=relative))
+        if len(hints) >= MAX_HINTS:
+            break
+    return hints
+
+def build_link_header(alias, hints):
+    """
+    生成 Link 响应头的值
+
+    Args:
+        alias (str): 游戏别名
+        hints (list): 预加载提示
+
+    Returns:
+        str: Link 头的值，没有提示时返回空字符串
+    """
+    links = []
+    prefix = "/" + urllib.parse.quote(alias) + "/"
+    for hint in hints:
+        link = f"<{prefix}{hint['url']}>; rel={hint['rel']}"
+        if hint["rel"] == "preload":
+            link += f"; as={hint['as']}"
+        if hint.get("crossorigin") is not None:
+            link += "; crossorigin" if not hint["crossorigin"] else f"; crossorigin={hint['crossorigin']}"
+        links.append(link)
+    return ", ".join(links)
\ No newline at end of file
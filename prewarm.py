@@ -0,0 +1,173 @@
+"""
+GalHub - 缓存预热模块
+服务器启动后根据最近的访问日志统计热门文件，在后台按限速读入系统页缓存
+"""
+
+import io
+import json
+import os
+import re
+import time
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta
+
+from logfiles import list_log_files, open_log
+from ratelimit import TokenBucket
+
+# 默认统计最近几天的日志
+DEFAULT_DAYS = 3
+# 热门文件快照文件名（位于日志目录中）
+SNAPSHOT_FILENAME = "popularity.json"
+# 快照中最多保存的条目数
+SNAPSHOT_LIMIT = 10000
+# 预热时每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 匹配成功响应的日志行，如 "[2024-01-01 12:00:00] 200 OK: /alias/main.js (application/javascript)"
+SERVED_PATTERN = re.compile(r"\] 20[06] [A-Za-z ]+: (\S+)")
+
+def recent_log_files(logs_dir, days):
+    """
+    获取最近几天的日志文件
+
+    Args:
+        logs_dir (str): 日志目录
+        days (int): 天数
+
+    Returns:
+        list: 日志文件路径列表，包括已压缩的日志段
+    """
+    oldest = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return list_log_files(logs_dir, start_date=oldest)
+
+def count_requests(log_files):
+    """
+    统计日志中各路径的成功响应次数
+
+    Returns:
+        Counter: 路径到次数的映射
+    """
+    counts = Counter()
+    for log_file in log_files:
+        with io.TextIOWrapper(open_log(log_file), encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = SERVED_PATTERN.search(line)
+                if match:
+                    counts[match.group(1).split("?", 1)[0]] += 1
+    return counts
+
+def rank_objects(logs_dir, days=DEFAULT_DAYS):
+    """
+    按访问次数对文件排序
+
+    日志未变化时直接使用上次保存的快照，避免重复解析大日志文件。
+
+    Args:
+        logs_dir (str): 日志目录
+        days (int): 统计最近几天的日志
+
+    Returns:
+        list: (路径, 次数) 列表，按次数降序
+    """
+    log_files = recent_log_files(logs_dir, days)
+    sources = {}
+    for log_file in log_files:
+        stat = os.stat(log_file)
+        sources[os.path.basename(log_file)] = [stat.st_size, stat.st_mtime]
+
+    snapshot_path = os.path.join(logs_dir, SNAPSHOT_FILENAME)
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("sources") == sources:
+            return [tuple(item) for item in snapshot["ranked"]]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    ranked = count_requests(log_files).most_common(SNAPSHOT_LIMIT)
+    if log_files:
+        try:
+            with open(snapshot_path, "w", encoding="utf-8") as f:
+                json.dump({"sources": sources, "ranked": ranked}, f, ensure_ascii=False)
+        except OSError:
+            pass
+    return ranked
+
+def resolve_path(games_root, url_path):
+    """
+    把请求路径映射为游戏目录中的文件
+
+    Returns:
+        str: 文件路径，无法映射到游戏文件时返回None
+    """
+    parts = urllib.parse.unquote(url_path).strip("/").split("/", 1)
+    if not parts[0]:
+        return None
+    game_dir = os.path.abspath(os.path.join(games_root, parts[0]))
+    relative = parts[1] if len(parts) > 1 and parts[1] else "index.html"
+    path = os.path.abspath(os.path.join(game_dir, relative))
+    if not path.startswith(game_dir + os.sep):
+        return None
+    if os.path.isdir(path):
+        path = os.path.join(path, "index.html")
+    return path if os.path.isfile(path) else None
+
+def prewarm(games_root, logs_dir, budget_bytes, rate_bytes=0, days=DEFAULT_DAYS, log=print, stop_event=None):
+    """
+    按热度顺序把游戏文件读入系统页缓存
+
+    Args:
+        games_root (str): 游戏文件根目录
+        logs_dir (str): 日志目录
+        budget_bytes (int): 最多预热的字节数
+        rate_bytes (int): 每秒最多读取的字节数，0表示不限速
+        days (int): 统计最近几天的日志
+        log (callable): 输出进度的函数
+        stop_event (threading.Event): 设置后提前结束
+
+    Returns:
+        tuple: (预热的文件数, 预热的字节数)
+    """
+    started = time.monotonic()
+    ranked = rank_objects(logs_dir, days)
+    log(f"Prewarm: {len(ranked)} object(s) ranked from recent logs, budget {budget_bytes} bytes")
+
+    bucket = TokenBucket(rate_bytes, rate_bytes) if rate_bytes else None
+    seen = set()
+    warmed_files = 0
+    warmed_bytes = 0
+    next_report = budget_bytes / 4
+    for url_path, hits in ranked:
+        if stop_event is not None and stop_event.is_set():
+            log("Prewarm: stopped early")
+            break
+        path = resolve_path(games_root, url_path)
+        if path is None or path in seen:
+            continue
+        seen.add(path)
+        try:
+            size = os.path.getsize(path)
+            # 放不下的大文件跳过，继续尝试排在后面的小文件
+            if warmed_bytes + size > budget_bytes:
+                continue
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if bucket is not None:
+                        wait = bucket.consume(len(chunk))
+                        if wait > 0:
+                            time.sleep(wait)
+        except OSError:
+            continue
+        warmed_files += 1
+        warmed_bytes += size
+        if warmed_bytes >= next_report:
+            log(f"Prewarm: {warmed_files} file(s), {warmed_bytes}/{budget_bytes} bytes")
+            next_report += budget_bytes / 4
+
+    log(f"Prewarm finished: {warmed_files} file(s), {warmed_bytes} bytes "
+        f"in {time.monotonic() - started:.1f}s")
+    return warmed_files, warmed_bytes
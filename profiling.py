@@ -0,0 +1,261 @@
+"""
+GalHub - 请求性能分析模块
+按阶段（路由、查找、打开文件、发送、写日志）统计请求耗时的分布，记录超过阈值的慢请求，
+并可以对接下来的若干个请求运行 cProfile；关闭时每个请求只多一次属性检查
+"""
+
+import bisect
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from database import load_typed_settings
+
+# 设置表中的性能分析配置项
+PROFILE_SETTINGS = {
+    'profile_requests': 0,       # 是否统计每个请求各阶段的耗时，0表示不统计
+    'slow_request_ms': 1000,     # 超过此耗时（毫秒）的请求记录为慢请求
+    'slow_request_keep': 100,    # 保留最近多少个慢请求
+}
+# 耗时分布的桶上限（毫秒）
+HISTOGRAM_BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+# cProfile 结果默认的排序方式和输出的函数数
+PROFILE_SORT = "cumulative"
+PROFILE_TOP_FUNCTIONS = 60
+PROFILE_SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time")
+
+_local = threading.local()
+
+def enter_phase(phase):
+    """
+    当前线程的请求正在计时时，把之后的时间计入指定阶段
+
+    Returns:
+        str: 之前的阶段，没有计时时返回None
+    """
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        return None
+    return timer.enter(phase)
+
+class RequestTimer:
+    """一个请求各阶段的耗时，只在处理该请求的线程中使用"""
+    __slots__ = ('started', 'last', 'phase', 'phases', 'profile')
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phase = 'route'
+        self.phases = {}
+        self.profile = None
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.last
+        self.last = now
+        previous, self.phase = self.phase, phase
+        return previous
+
+class Histogram:
+    """固定分桶的耗时分布"""
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 3) if self.count else 0,
+            'max_ms': round(self.max, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+class RequestProfiler:
+    """
+    请求耗时统计和慢请求记录，线程安全
+
+    begin() 在读取请求头时调用，end() 在请求处理完毕后调用；中间各处调用 enter_phase() 切换阶段。
+    """
+    def __init__(self, enabled=False, slow_ms=PROFILE_SETTINGS['slow_request_ms'],
+                 slow_keep=PROFILE_SETTINGS['slow_request_keep'], dump_dir="logs", log=None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.dump_dir = dump_dir
+        self.log = log
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = 0
+        self.slow_requests = deque(maxlen=max(1, slow_keep))
+        self.slow_count = 0
+        # cProfile：剩余要分析的请求数、已合并的结果和最近一次的输出
+        self.profile_remaining = 0
+        self.profile_sort = PROFILE_SORT
+        self.profile_busy = False
+        self.profile_stats = None
+        self.profile_requests = 0
+        self.last_profile = None
+
+    def begin(self):
+        """
+        开始一个请求的计时
+
+        Returns:
+            RequestTimer: 计时器，计时和cProfile都关闭时返回None
+        """
+        if not self.enabled and not self.profile_remaining:
+            return None
+        timer = RequestTimer()
+        if self.profile_remaining:
+            # 同一时间只分析一个请求（cProfile不支持多个线程同时启用）
+            with self.lock:
+                if self.profile_remaining and not self.profile_busy:
+                    self.profile_remaining -= 1
+                    self.profile_busy = True
+                    timer.profile = cProfile.Profile()
+            if timer.profile is not None:
+                timer.profile.enable()
+        _local.timer = timer
+        return timer
+
+    def end(self, timer, request):
+        """
+        结束请求的计时，记录各阶段耗时，超过阈值时记录为慢请求
+
+        Args:
+            timer (RequestTimer): begin() 返回的计时器
+            request (dict): 请求的描述（method, path, status, client）
+        """
+        _local.timer = None
+        if timer.profile is not None:
+            timer.profile.disable()
+            self.add_profile(timer.profile)
+        if not self.enabled:
+            return
+        timer.enter(None)
+        total_ms = (timer.last - timer.started) * 1000
+        phases = {phase: seconds * 1000 for phase, seconds in timer.phases.items()}
+        slow = None
+        with self.lock:
+            self.requests += 1
+            for phase, ms in list(phases.items()) + [('total', total_ms)]:
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    histogram = self.histograms[phase] = Histogram()
+                histogram.add(ms)
+            if total_ms >= self.slow_ms:
+                self.slow_count += 1
+                slow = dict(request, time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            total_ms=round(total_ms, 3),
+                            phases={phase: round(ms, 3) for phase, ms in phases.items()})
+                self.slow_requests.append(slow)
+        if slow is not None and self.log:
+            breakdown = ", ".join(f"{phase} {ms:.1f}ms" for phase, ms in slow['phases'].items())
+            self.log(f"Slow request: {slow['method']} {slow['path']} {slow['total_ms']:.1f}ms ({breakdown})")
+
+    def add_profile(self, profile):
+        with self.lock:
+            if self.profile_stats is None:
+                self.profile_stats = pstats.Stats(profile)
+            else:
+                self.profile_stats.add(profile)
+            self.profile_requests += 1
+            self.profile_busy = False
+            if self.profile_remaining:
+                return
+            stats, self.profile_stats = self.profile_stats, None
+            count, self.profile_requests = self.profile_requests, 0
+            sort = self.profile_sort
+        self.dump_profile(stats, count, sort)
+
+    def dump_profile(self, stats, count, sort):
+        """把合并后的cProfile结果按指定方式排序，写入日志目录"""
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(sort).print_stats(PROFILE_TOP_FUNCTIONS)
+        text = f"cProfile of {count} request(s), sorted by {sort}\n" + output.getvalue()
+        path = os.path.join(self.dump_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt")
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        except OSError:
+            path = None
+        with self.lock:
+            self.last_profile = {'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                 'requests': count, 'sort': sort, 'path': path, 'text': text}
+        if self.log:
+            self.log(f"Profiled {count} request(s), stats written to {path}")
+
+    def profile_next(self, count, sort=PROFILE_SORT):
+        """
+        对接下来的count个请求运行cProfile，完成后写入 logs/profile-*.txt
+
+        Args:
+            count (int): 请求数，0表示取消
+            sort (str): 排序方式，见 PROFILE_SORT_KEYS
+        """
+        if sort not in PROFILE_SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(PROFILE_SORT_KEYS)}")
+        with self.lock:
+            self.profile_remaining = max(0, count)
+            self.profile_sort = sort
+
+    def configure(self, enabled=None, slow_ms=None):
+        """修改计时开关和慢请求阈值"""
+        with self.lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if slow_ms is not None:
+                self.slow_ms = slow_ms
+
+    def reset(self):
+        """清空耗时分布和慢请求记录"""
+        with self.lock:
+            self.histograms.clear()
+            self.requests = 0
+            self.slow_requests.clear()
+            self.slow_count = 0
+
+    def get_stats(self, detail=False):
+        """
+        获取统计信息
+
+        Args:
+            detail (bool): 是否包括各阶段耗时分布、慢请求和最近一次cProfile的输出
+        """
+        with self.lock:
+            stats = {
+                'enabled': self.enabled,
+                'requests': self.requests,
+                'slow_ms': self.slow_ms,
+                'slow_requests': self.slow_count,
+                'profile_remaining': self.profile_remaining,
+            }
+            if detail:
+                stats['phases'] = {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}
+                stats['slow'] = list(self.slow_requests)
+                stats['last_profile'] = self.last_profile
+        return stats
+
+def load_request_profiler(dump_dir, log=None):
+    """
+    根据设置表中的配置创建请求性能分析器
+
+    Returns:
+        RequestProfiler: 性能分析器
+    """
+    values = load_typed_settings(PROFILE_SETTINGS)
+    return RequestProfiler(values['profile_requests'] != 0, values['slow_request_ms'],
+                           values['slow_request_keep'], dump_dir, log)
\ No newline at end of file
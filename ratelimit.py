@@ -0,0 +1,189 @@
+"""
+GalHub - 限流模块
+按客户端IP的令牌桶限流（请求速率、带宽）以及全局出口带宽限制
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from database import load_typed_settings
+
+# 设置表中的限流配置项，值为0表示不限制
+RATE_LIMIT_SETTINGS = {
+    'rate_limit_rps': 0.0,         # 每个客户端每秒请求数
+    'rate_limit_burst': 0.0,       # 每个客户端允许的突发请求数，0表示与rps相同
+    'rate_limit_bps': 0.0,         # 每个客户端每秒字节数
+    'global_egress_bps': 0.0,      # 全局出口每秒字节数
+}
+
+# 最多跟踪的客户端数量，超出后淘汰最久未访问的客户端
+MAX_TRACKED_CLIENTS = 10000
+
+class TokenBucket:
+    """令牌桶，线程安全"""
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, amount=1):
+        """
+        尝试取出令牌
+
+        Returns:
+            tuple: (是否成功, 需要等待的秒数)
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True, 0.0
+            return False, (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        """
+        取出令牌，令牌不足时记为欠账
+
+        Returns:
+            float: 调用方需要等待的秒数
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+class RateLimiter:
+    """
+    按客户端限流
+
+    请求速率超限的客户端直接拒绝（429），带宽超限的客户端在发送时被减速。
+    """
+    def __init__(self, requests_per_second=0, burst=0, bytes_per_second=0, global_bytes_per_second=0):
+        self.requests_per_second = requests_per_second
+        # 桶容量至少为1，否则小于1的速率（如0.5）下请求永远无法通过
+        self.burst = max(1.0, burst or requests_per_second)
+        self.bytes_per_second = bytes_per_second
+        self.global_bucket = None
+        if global_bytes_per_second:
+            self.global_bucket = TokenBucket(global_bytes_per_second, global_bytes_per_second)
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+        self.total_rejected = 0
+
+    def _get_client(self, client):
+        # 调用方需持有 self.lock
+        state = self.clients.get(client)
+        if state is None:
+            state = {
+                'requests': 0,
+                'rejected': 0,
+                'bytes': 0,
+                'throttled_seconds': 0.0,
+                'request_bucket': None,
+                'byte_bucket': None,
+            }
+            if self.requests_per_second:
+                state['request_bucket'] = TokenBucket(self.requests_per_second, self.burst)
+            if self.bytes_per_second:
+                # 允许一秒的突发
+                state['byte_bucket'] = TokenBucket(self.bytes_per_second, self.bytes_per_second)
+            self.clients[client] = state
+            if len(self.clients) > MAX_TRACKED_CLIENTS:
+                self.clients.popitem(last=False)
+        else:
+            self.clients.move_to_end(client)
+        return state
+
+    def allow_request(self, client):
+        """
+        判断客户端是否可以发起新请求
+
+        Args:
+            client (str): 客户端IP
+
+        Returns:
+            tuple: (是否允许, 建议的Retry-After秒数)
+        """
+        with self.lock:
+            state = self._get_client(client)
+            state['requests'] += 1
+        bucket = state['request_bucket']
+        if bucket is None:
+            return True, 0
+        allowed, retry_after = bucket.try_consume()
+        if not allowed:
+            with self.lock:
+                state['rejected'] += 1
+                self.total_rejected += 1
+        return allowed, retry_after
+
+    def throttle(self, client, nbytes):
+        """
+        记录客户端发送的字节数，超出带宽限制时阻塞当前线程
+
+        Args:
+            client (str): 客户端IP
+            nbytes (int): 即将发送的字节数
+        """
+        with self.lock:
+            state = self._get_client(client)
+            state['bytes'] += nbytes
+        wait = 0.0
+        if state['byte_bucket'] is not None:
+            wait = state['byte_bucket'].consume(nbytes)
+        if self.global_bucket is not None:
+            wait = max(wait, self.global_bucket.consume(nbytes))
+        if wait > 0:
+            with self.lock:
+                state['throttled_seconds'] += wait
+            time.sleep(wait)
+
+    def get_stats(self):
+        """
+        获取限流统计
+
+        Returns:
+            dict: 限流配置及各客户端的计数
+        """
+        with self.lock:
+            clients = {
+                client: {
+                    'requests': state['requests'],
+                    'rejected': state['rejected'],
+                    'bytes': state['bytes'],
+                    'throttled_seconds': round(state['throttled_seconds'], 3),
+                }
+                for client, state in self.clients.items()
+            }
+            return {
+                'requests_per_second': self.requests_per_second,
+                'burst': self.burst,
+                'bytes_per_second': self.bytes_per_second,
+                'global_bytes_per_second': self.global_bucket.rate if self.global_bucket else 0,
+                'total_rejected': self.total_rejected,
+                'clients': clients,
+            }
+
+def load_rate_limiter():
+    """
+    根据设置表中的配置创建限流器
+
+    Returns:
+        RateLimiter: 限流器
+    """
+    values = load_typed_settings(RATE_LIMIT_SETTINGS)
+    return RateLimiter(
+        requests_per_second=values['rate_limit_rps'],
+        burst=values['rate_limit_burst'],
+        bytes_per_second=values['rate_limit_bps'],
+        global_bytes_per_second=values['global_egress_bps'],
+    )
@@ -0,0 +1,250 @@
+"""
+GalHub - 节点同步模块
+从源站增量拉取游戏目录变更，只下载缺失或内容变化的文件
+"""
+
+import json
+import os
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_setting, set_setting, get_game_by_alias, get_game_files, set_game_files, upsert_game
+from manager import GAMES_ROOT, hash_file, is_valid_alias, get_game_file_path, remove_game, record_preload_hints
+
+# 默认并行下载数
+DEFAULT_WORKERS = 4
+# 每次请求的变更条数
+PAGE_SIZE = 100
+# 请求源站的超时时间（秒）
+TIMEOUT = 60
+# 下载时每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+def get_cursor_key(origin):
+    """同步进度保存在设置表中，每个源站单独记录"""
+    return f"replication_cursor:{origin}"
+
+def fetch_json(url):
+    """请求源站的JSON接口"""
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+def file_url(origin, alias, path):
+    """源站上游戏文件的地址"""
+    return f"{origin}/{urllib.parse.quote(alias)}/{urllib.parse.quote(path)}"
+
+def download_file(origin, alias, entry):
+    """
+    下载单个文件，支持断点续传并校验哈希
+
+    未完成的内容保存在 .part 文件中，下次同步时从已下载的位置继续。
+
+    Args:
+        origin (str): 源站地址
+        alias (str): 游戏别名
+        entry (dict): 源站文件清单中的条目（path, size, sha256）
+
+    Returns:
+        int: 本次实际下载的字节数
+    """
+    target = get_game_file_path(alias, entry["path"])
+    part = target + ".part"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset > entry["size"]:
+        os.remove(part)
+        offset = 0
+
+    downloaded = 0
+    if offset < entry["size"]:
+        request = urllib.request.Request(file_url(origin, alias, entry["path"]))
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            # 源站不支持Range时返回完整内容，从头写入
+            mode = "ab" if offset and response.status == 206 else "wb"
+            with open(part, mode) as f:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    downloaded += len(chunk)
+
+    if hash_file(part) != entry["sha256"]:
+        os.remove(part)
+        raise ValueError(f"hash mismatch for {alias}/{entry['path']}")
+    os.replace(part, target)
+    return downloaded
+
+def is_up_to_date(alias, entry, local_files):
+    """
+    判断本地文件是否与源站清单一致
+
+    本地清单记录的哈希、大小和修改时间都与磁盘一致时不重新计算哈希。
+    """
+    target = get_game_file_path(alias, entry["path"])
+    try:
+        stat = os.stat(target)
+    except OSError:
+        return False
+    if stat.st_size != entry["size"]:
+        return False
+    local = local_files.get(entry["path"])
+    if local and local["sha256"] == entry["sha256"] and local["mtime"] == stat.st_mtime:
+        return True
+    return hash_file(target) == entry["sha256"]
+
+def remove_stale_files(alias, remote_paths):
+    """删除源站清单中已不存在的本地文件和空目录"""
+    game_path = os.path.join(GAMES_ROOT, alias)
+    for root, dirs, filenames in os.walk(game_path, topdown=False):
+        for filename in filenames:
+            file_path = os.path.join(root, filename)
+            relative = os.path.relpath(file_path, game_path).replace(os.sep, "/")
+            # 保留未完成的下载，供断点续传
+            if relative.endswith(".part") and relative[:-5] in remote_paths:
+                continue
+            if relative not in remote_paths:
+                os.remove(file_path)
+        if root != game_path and not os.listdir(root):
+            os.rmdir(root)
+
+def build_local_manifest(alias, remote_files):
+    """根据源站清单和本地文件状态生成本地清单"""
+    files = []
+    for entry in remote_files:
+        stat = os.stat(get_game_file_path(alias, entry["path"]))
+        files.append({
+            "path": entry["path"],
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": entry["sha256"],
+        })
+    return files
+
+def check_change(change):
+    """
+    检查一项目录变更中的别名和文件路径
+
+    Returns:
+        str: 不安全时返回错误信息，否则返回None
+    """
+    alias = change.get("alias")
+    if not is_valid_alias(alias):
+        return f"rejected change with invalid alias {alias!r}"
+    if change["op"] == "delete":
+        return None
+    for entry in change["files"]:
+        try:
+            get_game_file_path(alias, entry["path"])
+        except ValueError as e:
+            return f"rejected change for {alias}: {e}"
+    return None
+
+def apply_changes(origin, changes, executor):
+    """
+    应用一页目录变更
+
+    Returns:
+        tuple: (本页是否全部成功, 统计信息)
+    """
+    stats = {"games": 0, "deleted": 0, "files": 0, "skipped": 0, "bytes": 0, "errors": []}
+    jobs = []
+    for change in changes:
+        alias = change["alias"]
+        # 源站发来的别名和路径在写入或删除前检查，不能跳出游戏目录
+        error = check_change(change)
+        if error:
+            stats["errors"].append(error)
+            continue
+        if change["op"] == "delete":
+            if get_game_by_alias(alias) or os.path.exists(os.path.join(GAMES_ROOT, alias)):
+                remove_game(alias)
+                stats["deleted"] += 1
+            continue
+
+        local_files = {f["path"]: f for f in get_game_files(alias)}
+        remote_paths = {f["path"] for f in change["files"]}
+        os.makedirs(os.path.join(GAMES_ROOT, alias), exist_ok=True)
+        remove_stale_files(alias, remote_paths)
+        futures = []
+        for entry in change["files"]:
+            if is_up_to_date(alias, entry, local_files):
+                stats["skipped"] += 1
+            else:
+                futures.append((entry, executor.submit(download_file, origin, alias, entry)))
+        jobs.append((change, futures))
+
+    all_ok = not stats["errors"]
+    for change, futures in jobs:
+        alias = change["alias"]
+        game_ok = True
+        for entry, future in futures:
+            try:
+                stats["bytes"] += future.result()
+                stats["files"] += 1
+            except Exception as e:
+                game_ok = False
+                stats["errors"].append(f"{alias}/{entry['path']}: {e}")
+        if not game_ok:
+            all_ok = False
+            continue
+        # 文件全部到位后再更新目录，避免对外提供不完整的游戏
+        game = change["game"]
+        upsert_game(game["name"], alias, game["upload_time"], os.path.join(GAMES_ROOT, alias))
+        set_game_files(alias, build_local_manifest(alias, change["files"]))
+        record_preload_hints(alias)
+        stats["games"] += 1
+    return all_ok, stats
+
+def replicate(origin, workers=DEFAULT_WORKERS):
+    """
+    从源站同步游戏目录和文件
+
+    同步进度按源站记录在设置表中，中途失败时进度停留在失败的那一页，重新运行即可继续。
+
+    Args:
+        origin (str): 源站地址，如 http://origin:8000
+        workers (int): 并行下载数
+
+    Returns:
+        bool: 全部同步成功返回True，否则返回False
+    """
+    origin = origin.rstrip("/")
+    cursor_key = get_cursor_key(origin)
+    cursor = int(get_setting(cursor_key, 0))
+    totals = {"games": 0, "deleted": 0, "files": 0, "skipped": 0, "bytes": 0}
+    print(f"Replicating from {origin} since change {cursor}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            try:
+                page = fetch_json(f"{origin}/api/export/changes?since={cursor}&limit={PAGE_SIZE}")
+            except Exception as e:
+                print(f"Error: Failed to fetch changes from {origin}: {e}")
+                return False
+            if not page["changes"]:
+                if page["next"] > cursor:
+                    cursor = page["next"]
+                    set_setting(cursor_key, cursor)
+                    continue
+                break
+
+            ok, stats = apply_changes(origin, page["changes"], executor)
+            for key in totals:
+                totals[key] += stats[key]
+            if not ok:
+                for error in stats["errors"]:
+                    print(f"Error: {error}")
+                print(f"Replication stopped at change {cursor}; run again to resume")
+                return False
+            cursor = page["next"]
+            set_setting(cursor_key, cursor)
+
+    print(f"Replication complete at change {cursor}: {totals['games']} game(s) updated, "
+          f"{totals['deleted']} removed, {totals['files']} file(s) downloaded "
+          f"({totals['bytes']} bytes), {totals['skipped']} unchanged")
+    return True
@@ -0,0 +1,317 @@
+"""
+GalHub - 文件完整性巡检模块
+在后台按限速重新计算游戏文件的哈希，与上传时记录在文件清单中的哈希比较，
+发现不一致（如磁盘故障导致文件被截断）时记录并可以移入隔离目录；请求较多时暂停，不与服务请求争抢磁盘
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from database import get_setting, set_setting, get_all_games, get_game_files, load_typed_settings
+from ratelimit import TokenBucket
+
+# 设置表中的巡检配置项
+SCRUB_SETTINGS = {
+    'scrub_enabled': 1,           # 服务器是否在后台巡检，0表示不巡检
+    'scrub_rate_mb': 10,          # 每秒最多读取的MB数，0表示不限速
+    'scrub_workers': 2,           # 同时计算哈希的线程数
+    'scrub_interval_hours': 24.0, # 一轮巡检结束后，隔多久开始下一轮（小时）
+    'scrub_busy_requests': 4,     # 进行中的请求数达到此值时暂停巡检，0表示不暂停
+    'scrub_quarantine': 0,        # 是否把哈希不一致的文件移入隔离目录，0表示只记录
+}
+# 上一轮巡检结束的时间保存在设置表中，重启后不会立即重新开始一轮
+LAST_PASS_KEY = 'scrub_last_pass'
+# 服务器启动后至少等待多久才开始巡检（秒）
+START_DELAY = 60
+# 暂停时检查请求数的间隔（秒）
+PAUSE_POLL = 0.5
+# 每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+# 隔离目录，位于游戏目录中，以 "." 开头的目录不会被当作游戏
+QUARANTINE_DIR = ".quarantine"
+# 保留最近多少条不一致记录
+KEEP_MISMATCHES = 100
+
+class ScrubStopped(Exception):
+    """服务器停止，中止巡检"""
+
+class Scrubber:
+    """
+    文件完整性巡检，线程安全
+
+    只检查修改时间与清单一致的文件：修改时间变化说明文件被直接修改过，由文件变化监视负责更新清单；
+    磁盘故障导致的损坏不会更新修改时间。
+    """
+    def __init__(self, games_root, settings=None, get_load=None, on_quarantine=None, log=print):
+        """
+        Args:
+            games_root (str): 游戏目录
+            settings (dict): 巡检配置，见 SCRUB_SETTINGS
+            get_load (callable): 返回当前进行中的请求数，None表示不暂停
+            on_quarantine (callable): 文件移入隔离目录后调用，参数为 {别名: 相对路径集合}
+            log (callable): 日志函数
+        """
+        self.games_root = games_root
+        self.settings = dict(SCRUB_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+        self.get_load = get_load
+        self.on_quarantine = on_quarantine
+        self.log = log
+        rate = self.settings['scrub_rate_mb'] * 1024 * 1024
+        self.bucket = TokenBucket(rate, rate) if rate > 0 else None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.mismatches = deque(maxlen=KEEP_MISMATCHES)
+        self.state = 'idle'
+        self.stats = {
+            'passes': 0,
+            'files': 0,
+            'bytes': 0,
+            'mismatches': 0,
+            'quarantined': 0,
+            'skipped': 0,
+            'paused_seconds': 0.0,
+            'pass_files': 0,
+            'pass_total': 0,
+            'last_pass': None,
+        }
+
+    def add_stats(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def wait_for_idle(self):
+        """进行中的请求数达到阈值时等待，服务器停止时抛出ScrubStopped"""
+        if self.stop_event.is_set():
+            raise ScrubStopped()
+        busy = self.settings['scrub_busy_requests']
+        if self.get_load is None or busy <= 0 or self.get_load() < busy:
+            return
+        started = time.monotonic()
+        self.state = 'paused'
+        while self.get_load() >= busy:
+            if self.stop_event.wait(PAUSE_POLL):
+                raise ScrubStopped()
+        self.state = 'running'
+        self.add_stats(paused_seconds=time.monotonic() - started)
+
+    def hash_file(self, file_path):
+        """
+        按限速计算文件的SHA-256，每读一块检查一次请求数
+
+        Returns:
+            tuple: (十六进制哈希值, 读取的字节数)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, 'rb') as f:
+            while True:
+                self.wait_for_idle()
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                if self.bucket is not None:
+                    wait = self.bucket.consume(len(chunk))
+                    if wait and self.stop_event.wait(wait):
+                        raise ScrubStopped()
+        return digest.hexdigest(), size
+
+    def check_file(self, alias, entry):
+        """
+        检查一个文件，在线程池中执行
+
+        Args:
+            alias (str): 游戏别名
+            entry (dict): 文件清单条目（path, size, mtime, sha256）
+
+        Returns:
+            dict: 哈希不一致时返回记录，否则返回None
+        """
+        file_path = os.path.join(self.games_root, alias, *entry['path'].split('/'))
+        try:
+            before = os.stat(file_path)
+        except OSError:
+            before = None
+        if before is None or before.st_mtime != entry['mtime']:
+            # 文件被直接修改或已删除，清单尚未更新
+            self.add_stats(skipped=1)
+            return None
+        try:
+            digest, size = self.hash_file(file_path)
+            after = os.stat(file_path)
+        except FileNotFoundError:
+            self.add_stats(skipped=1)
+            return None
+        except OSError as e:
+            # 读取失败（如坏扇区）同样是损坏
+            digest, size, after = f"unreadable: {e.strerror or e}", None, before
+        self.add_stats(files=1, bytes=size or 0)
+        if after.st_mtime != before.st_mtime:
+            # 计算哈希期间文件被修改
+            self.add_stats(skipped=1)
+            return None
+        if digest == entry['sha256'] and size == entry['size']:
+            return None
+        mismatch = {
+            'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'alias': alias,
+            'path': entry['path'],
+            'expected_sha256': entry['sha256'],
+            'actual_sha256': digest,
+            'expected_size': entry['size'],
+            'actual_size': after.st_size,
+            'quarantined': None,
+        }
+        if self.settings['scrub_quarantine']:
+            mismatch['quarantined'] = self.quarantine(alias, entry['path'], file_path)
+        with self.lock:
+            self.stats['mismatches'] += 1
+            self.mismatches.append(mismatch)
+        action = f", moved to {mismatch['quarantined']}" if mismatch['quarantined'] else ""
+        self.log(f"Scrub: {alias}/{entry['path']} does not match its recorded hash "
+                 f"(size {after.st_size}, expected {entry['size']}){action}")
+        return mismatch
+
+    def quarantine(self, alias, path, file_path):
+        """
+        把损坏的文件移入隔离目录，不再提供给客户端
+
+        Returns:
+            str: 隔离后的路径，移动失败时返回None
+        """
+        target = os.path.join(self.games_root, QUARANTINE_DIR, alias, *path.split('/'))
+        if os.path.exists(target):
+            target += "." + datetime.now().strftime("%Y%m%d-%H%M%S")
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(file_path, target)
+        except OSError as e:
+            self.log(f"Scrub: failed to quarantine {alias}/{path}: {e}")
+            return None
+        self.add_stats(quarantined=1)
+        if self.on_quarantine:
+            self.on_quarantine({alias: {path}})
+        return target
+
+    def run_pass(self, aliases=None):
+        """
+        巡检一轮
+
+        Args:
+            aliases (list): 要检查的游戏别名，None表示所有游戏
+
+        Returns:
+            list: 哈希不一致的文件记录
+        """
+        if aliases is None:
+            aliases = [game[0] for game in get_all_games()]
+        manifests = [(alias, get_game_files(alias)) for alias in aliases]
+        with self.lock:
+            self.stats['pass_files'] = 0
+            self.stats['pass_total'] = sum(len(files) for _, files in manifests)
+        self.state = 'running'
+        found = []
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.settings['scrub_workers'])) as executor:
+                for alias, files in manifests:
+                    for mismatch in executor.map(partial(self.check_file, alias), files):
+                        self.add_stats(pass_files=1)
+                        if mismatch is not None:
+                            found.append(mismatch)
+        finally:
+            self.state = 'idle'
+        with self.lock:
+            self.stats['passes'] += 1
+            self.stats['last_pass'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return found
+
+    def run(self):
+        """后台线程：按间隔重复巡检，直到服务器停止"""
+        interval = self.settings['scrub_interval_hours'] * 3600
+        while True:
+            try:
+                last = float(get_setting(LAST_PASS_KEY, 0))
+            except (TypeError, ValueError):
+                last = 0
+            delay = max(START_DELAY, last + interval - time.time())
+            if self.stop_event.wait(delay):
+                return
+            started = time.monotonic()
+            try:
+                found = self.run_pass()
+            except ScrubStopped:
+                return
+            except Exception as e:
+                self.log(f"Scrub failed: {e}")
+            else:
+                set_setting(LAST_PASS_KEY, time.time())
+                self.log(f"Scrub pass finished in {time.monotonic() - started:.0f}s: "
+                         f"{len(found)} mismatched file(s)")
+
+    def start(self, stop_event):
+        """
+        启动后台巡检线程
+
+        Args:
+            stop_event (threading.Event): 设置后停止巡检
+        """
+        self.stop_event = stop_event
+        threading.Thread(target=self.run, name="scrubber", daemon=True).start()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, state=self.state, paused_seconds=round(self.stats['paused_seconds'], 1))
+            stats['recent_mismatches'] = list(self.mismatches)
+        return stats
+
+def load_scrub_settings():
+    """
+    从设置表读取巡检配置
+
+    Returns:
+        dict: 配置项名称到数值的映射
+    """
+    return load_typed_settings(SCRUB_SETTINGS)
+
+def run_scrub(aliases=None, quarantine=False, workers=SCRUB_SETTINGS['scrub_workers'], rate_mb=0):
+    """
+    立即巡检一轮并输出结果（命令行使用）
+
+    Args:
+        aliases (list): 要检查的游戏别名，None表示所有游戏
+        quarantine (bool): 是否把哈希不一致的文件移入隔离目录
+        workers (int): 同时计算哈希的线程数
+        rate_mb (int): 每秒最多读取的MB数，0表示不限速
+
+    Returns:
+        bool: 所有文件都与清单一致返回True，否则返回False
+    """
+    from manager import GAMES_ROOT, sync_game_files
+
+    def sync(changes):
+        for alias, paths in changes.items():
+            sync_game_files(alias, paths)
+
+    settings = dict(SCRUB_SETTINGS, scrub_rate_mb=rate_mb, scrub_workers=workers,
+                    scrub_quarantine=int(quarantine))
+    scrubber = Scrubber(GAMES_ROOT, settings, on_quarantine=sync, log=lambda message: None)
+    started = time.monotonic()
+    found = scrubber.run_pass(aliases)
+    stats = scrubber.get_stats()
+    for mismatch in found:
+        status = f" -> {mismatch['quarantined']}" if mismatch['quarantined'] else ""
+        print(f"MISMATCH {mismatch['alias']}/{mismatch['path']}: size {mismatch['actual_size']} "
+              f"(expected {mismatch['expected_size']}), sha256 {mismatch['actual_sha256'][:16]} "
+              f"(expected {mismatch['expected_sha256'][:16]}){status}")
+    print(f"Checked {stats['files']} file(s), {stats['bytes']} bytes in {time.monotonic() - started:.1f}s: "
+          f"{len(found)} mismatched, {stats['skipped']} skipped (modified since the manifest was recorded)")
+    return not found
\ No newline at end of file
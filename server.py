@@ -1,3 +1,4 @@
+import http.client
 import http.server
 import socketserver
 import urllib.parse
@@ -5,9 +6,29 @@ import os
 import mimetypes
 import json
 import sys
+import signal
+import socket
+import subprocess
+import tempfile
 import threading
+import time
 from datetime import datetime
-from database import get_game_by_alias, get_all_games
+from database import get_game_by_alias, get_all_games, search_games, get_changes_since, load_typed_settings
+from manager import get_manifest, get_preload, sync_game_files
+from preload import ENTRY_PAGE, build_link_header
+from assetfiles import WEBP_SUFFIX
+from ratelimit import RateLimiter, load_rate_limiter
+from edge import EdgeCache, EdgeError, CACHE_DIR, CACHE_MAX_BYTES
+from prewarm import prewarm
+from logfiles import LogWriter, load_log_writer
+from popularity import PopularityCounter, load_popularity_counter
+from negcache import NegativeCache, load_negative_cache, render_error_page
+from watcher import GamesWatcher, load_watch_settings
+from scrubber import Scrubber, load_scrub_settings
+from zipstream import ZipLayoutError, load_layout, get_layout_cache
+from uploadapi import UploadError, UploadReceiver, load_upload_settings, clean_staging, check_token
+from profiling import PROFILE_SORT, RequestProfiler, enter_phase, load_request_profiler
+from memstats import MemoryTracer, TOP_ENTRIES, TRACE_FRAMES, get_memory_report
 
 # 默认端口
 PORT = 8000
@@ -15,11 +36,63 @@ PORT = 8000
 GAMES_ROOT = "games"
 # 日志目录
 LOGS_DIR = "logs"
+# 优雅停止时等待进行中请求完成的最长时间（秒）
+DRAIN_TIMEOUT = 10
+# 热重启时通过该环境变量把监听套接字交给新进程
+LISTEN_FD_ENV = "GALHUB_LISTEN_FD"
+# 新进程就绪后创建该环境变量指定的文件，通知旧进程停止接受连接
+READY_FILE_ENV = "GALHUB_READY_FILE"
+# 等待新进程就绪的最长时间（秒）
+RESTART_READY_TIMEOUT = 30
+# 发送文件时每次写入的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 设置表中的连接限制配置项及默认值
+CONNECTION_SETTINGS = {
+    'max_connections': 256,          # 最大并发连接数
+    'max_connections_per_ip': 32,    # 每个客户端IP的最大并发连接数
+    'header_timeout': 10.0,          # 读取请求行和请求头的总时限（秒），可以是小数
+    'write_timeout': 30.0,           # 发送响应时单次写入停滞的时限（秒），可以是小数
+    'listen_backlog': 128,           # 监听队列长度
+    'max_header_bytes': 32768,       # 请求行和请求头的最大总字节数
+}
+
+# 连接数超限时直接写回的响应，不进入处理线程
+SHED_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: 0\r\n\r\n"
+)
 
 # 全局变量用于存储服务器实例和日志
 server_instance = None
 server_logs = []
 log_lock = threading.Lock()
+# 限流器，服务器启动时根据设置表重新创建
+rate_limiter = RateLimiter()
+# 边缘缓存，仅在指定上游源站时启用
+edge_cache = None
+# 日志文件写入器，服务器启动时根据设置表重新创建
+log_writer = LogWriter(LOGS_DIR)
+# 是否为游戏入口页面发送 103 Early Hints，服务器启动时从设置表读取
+early_hints = False
+# 游戏热度计数器，服务器启动时根据设置表重新创建
+popularity = PopularityCounter()
+# 不存在的别名和文件路径的缓存，服务器启动时根据设置表重新创建
+negative_cache = NegativeCache()
+# 预先生成的404响应内容
+NOT_FOUND_BODY = render_error_page(404, "Game or file not found")
+# 游戏目录监视器，服务器启动时根据设置表创建
+games_watcher = None
+# HTTP上传接收器，服务器启动时根据设置表重新创建
+upload_receiver = UploadReceiver()
+# 请求性能分析器，服务器启动时根据设置表重新创建
+profiler = RequestProfiler()
+# tracemalloc 管理器
+memory_tracer = MemoryTracer()
+# 文件完整性巡检，服务器启动时根据设置表创建
+scrubber = None
 
 # 检查是否在PyInstaller打包环境中运行
 def get_resource_path(relative_path):
@@ -30,17 +103,10 @@ def get_resource_path(relative_path):
     # 开发环境
     return os.path.join(os.path.abspath("."), relative_path)
 
-def setup_log_directory():
-    """创建日志目录"""
-    os.makedirs(LOGS_DIR, exist_ok=True)
-
-def get_log_filename():
-    """获取当前日期的日志文件名"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    return os.path.join(LOGS_DIR, f"server_{today}.log")
-
 def log_message(message):
     """记录日志消息"""
+    # 请求计时开启时，写日志的时间单独计入 log 阶段
+    previous = enter_phase('log')
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}"
     
@@ -50,36 +116,194 @@ def log_message(message):
         if len(server_logs) > 1000:
             server_logs.pop(0)
         
-        # 保存日志到文件
+        # 保存日志到文件（按日期和大小切分，旧日志段在后台压缩）
         try:
-            setup_log_directory()
-            log_file = get_log_filename()
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_entry + "\n")
+            log_writer.write(log_entry)
         except Exception as e:
             # 如果无法写入文件，至少打印到控制台
             print(f"Failed to write to log file: {e}")
     
     # 同时打印到控制台
     print(log_entry)
+    if previous is not None:
+        enter_phase(previous)
 
 def get_server_logs():
     """获取服务器日志"""
     with log_lock:
         return list(server_logs)
 
+def load_connection_limits():
+    """
+    从设置表读取连接限制配置
+    
+    Returns:
+        dict: 配置项名称到数值的映射
+    """
+    return load_typed_settings(CONNECTION_SETTINGS, log=log_message)
+
+class HeaderReader:
+    """
+    读取请求头时包装rfile，限制总时长和总字节数
+    
+    每次底层读取前把套接字超时设为剩余时间，慢速逐字节发送的客户端也会在期限到达时超时。
+    """
+    def __init__(self, rfile, connection, timeout, max_bytes):
+        self.rfile = rfile
+        self.connection = connection
+        self.deadline = time.monotonic() + timeout
+        self.remaining_bytes = max_bytes
+
+    def readline(self, limit=-1):
+        if self.remaining_bytes <= 0:
+            raise http.client.LineTooLong("request header block")
+        if limit is None or limit < 0 or limit > self.remaining_bytes + 1:
+            limit = self.remaining_bytes + 1
+        line = b""
+        while len(line) < limit:
+            remaining_time = self.deadline - time.monotonic()
+            if remaining_time <= 0:
+                raise socket.timeout("header read timed out")
+            self.connection.settimeout(remaining_time)
+            # peek最多触发一次底层recv，之后的read只从缓冲区取数据
+            buffered = self.rfile.peek(1)
+            if not buffered:
+                break
+            wanted = limit - len(line)
+            newline = buffered.find(b"\n", 0, wanted)
+            take = newline + 1 if newline >= 0 else min(len(buffered), wanted)
+            line += self.rfile.read(take)
+            if newline >= 0:
+                break
+        if len(line) > self.remaining_bytes:
+            raise http.client.LineTooLong("request header block")
+        self.remaining_bytes -= len(line)
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self.rfile, name)
+
 class GameRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # 以HTTP/1.1响应：支持keep-alive和 103 Early Hints，每个响应都需要Content-Length或关闭连接
+    protocol_version = "HTTP/1.1"
+    # 当前请求的计时器，性能分析关闭时为None
+    timer = None
+    status_code = None
+    # 当前响应是否已发送Connection响应头
+    connection_header_sent = False
+    
     def log_message(self, format, *args):
         """重写日志消息方法，使用我们自定义的日志记录"""
         log_message(f"{self.address_string()} - {format % args}")
     
+    def setup(self):
+        super().setup()
+        self.raw_rfile = self.rfile
+        self.first_request = True
+    
+    def wait_for_next_request(self):
+        """
+        在keep-alive连接上等待下一个请求，最多等待 header_timeout 秒
+        
+        等待期间连接登记为空闲，服务器停止时直接关闭，不拖延排空。
+        
+        Returns:
+            bool: 收到下一个请求的数据返回True，超时、客户端关闭或服务器停止返回False
+        """
+        if not self.server.begin_idle(self.connection):
+            return False
+        try:
+            self.connection.settimeout(self.server.limits['header_timeout'])
+            return bool(self.raw_rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.server.end_idle(self.connection)
+    
+    def handle_one_request(self):
+        if not self.first_request and not self.wait_for_next_request():
+            self.close_connection = True
+            return
+        self.first_request = False
+        # 请求头阶段使用限时、限长的读取器，期限从收到请求的第一个字节开始
+        limits = self.server.limits
+        self.rfile = HeaderReader(self.raw_rfile, self.connection,
+                                  limits['header_timeout'], limits['max_header_bytes'])
+        try:
+            super().handle_one_request()
+        except http.client.LineTooLong:
+            # 读取请求头时超长由 parse_request 返回431，这里只会是请求行本身超过 max_header_bytes
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.close_connection = True
+            self.send_error(414)
+        finally:
+            self.rfile = self.raw_rfile
+            if self.timer is not None:
+                profiler.end(self.timer, {
+                    'method': self.command,
+                    'path': self.path,
+                    'status': self.status_code,
+                    'client': self.client_address[0],
+                })
+                self.timer = None
+    
+    def parse_request(self):
+        # 请求行已读取，从这里开始计时（不包括keep-alive连接上等待下一个请求的时间）
+        self.timer = profiler.begin()
+        self.status_code = None
+        result = super().parse_request()
+        # 请求头读取完毕，之后的超时用于检测响应发送停滞
+        self.rfile = self.raw_rfile
+        self.connection.settimeout(self.server.limits['write_timeout'])
+        return result
+    
+    def send_response_only(self, code, message=None):
+        self.status_code = code
+        self.connection_header_sent = False
+        super().send_response_only(code, message)
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection':
+            self.connection_header_sent = True
+        super().send_header(keyword, value)
+    
+    def end_headers(self):
+        # 之后的时间计入发送阶段
+        enter_phase('send')
+        # 将要关闭连接（请求体未读取、响应长度未知或服务器正在停止）时告诉客户端，1xx 响应除外
+        if self.status_code and self.status_code >= 200 and not self.connection_header_sent:
+            if not self.server.running:
+                self.close_connection = True
+            if self.close_connection:
+                self.send_header("Connection", "close")
+        super().end_headers()
+    
     def do_GET(self):
         # 解析请求路径
         parsed_path = urllib.parse.urlparse(self.path)
-        path_parts = parsed_path.path.strip('/').split('/', 1)
+        request_path = urllib.parse.unquote(parsed_path.path)
+        path_parts = request_path.strip('/').split('/', 1)
+        game_alias = path_parts[0]
+        game_path = path_parts[1] if len(path_parts) > 1 else ''
+        
+        # 已知不存在的别名或文件（/api/ 以外的路径）不再查询数据库和文件系统
+        known_missing = bool(game_alias) and game_alias != 'api' and negative_cache.lookup(game_alias, game_path)
+        
+        # 记录请求（已知不存在的路径只记录访问日志）
+        if not known_missing:
+            log_message(f"GET {self.path} from {self.address_string()}")
         
-        # 记录请求
-        log_message(f"GET {self.path} from {self.address_string()}")
+        # 请求速率超限的客户端直接返回429
+        allowed, retry_after = rate_limiter.allow_request(self.client_address[0])
+        if not allowed:
+            self.send_too_many_requests(retry_after)
+            return
+        
+        if known_missing:
+            self.send_cached_not_found()
+            return
         
         # 如果请求根路径，显示默认主页
         if parsed_path.path == '/' or parsed_path.path == '':
@@ -91,37 +315,84 @@ class GameRequestHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_game_list()
             return
             
+        enter_phase('lookup')
+        
         # 如果请求API获取游戏列表
         if parsed_path.path == '/api/games':
-            self.send_game_list_api()
+            self.send_game_list_api(urllib.parse.parse_qs(parsed_path.query))
+            return
+        
+        # 如果请求服务器统计信息
+        # 匿名请求只返回汇总计数，带管理令牌时返回各客户端IP等明细
+        if parsed_path.path == '/api/stats':
+            detail = 'Authorization' in self.headers
+            if not detail or self.require_admin():
+                self.send_json(get_server_stats(detail))
+            return
+        
+        # 如果请求性能分析结果（需要管理令牌）
+        if parsed_path.path == '/api/profile':
+            if self.require_admin():
+                self.send_json(profiler.get_stats(detail=True))
+            return
+        
+        # 如果请求内存统计（需要管理令牌）
+        if parsed_path.path == '/api/memory':
+            if self.require_admin():
+                self.send_json(get_server_memory())
+            return
+        
+        # 如果其他节点请求目录变更
+        if parsed_path.path == '/api/export/changes':
+            self.send_changes_api(urllib.parse.parse_qs(parsed_path.query))
             return
         
         # 如果请求游戏，提供游戏内容
-        if len(path_parts) >= 1 and path_parts[0]:
-            game_alias = path_parts[0]
+        if game_alias:
             game = get_game_by_alias(game_alias)
             
+            # 整个游戏的ZIP下载：/<alias>.zip
+            if game is None and not game_path and game_alias.endswith('.zip'):
+                if get_game_by_alias(game_alias[:-len('.zip')]):
+                    self.serve_zip(game_alias[:-len('.zip')])
+                    return
+            
             if game:
                 # 构建文件路径
-                remaining_path = path_parts[1] if len(path_parts) > 1 else 'index.html'
-                if not remaining_path:
-                    remaining_path = 'index.html'
+                remaining_path = game_path or 'index.html'
                 
-                file_path = os.path.join(GAMES_ROOT, game_alias, remaining_path)
+                game_dir = os.path.join(GAMES_ROOT, game_alias)
+                file_path = safe_join(game_dir, remaining_path)
                 
                 # 检查文件是否存在
-                if os.path.exists(file_path) and os.path.isfile(file_path):
-                    self.serve_file(file_path)
+                if file_path is None:
+                    pass
+                elif os.path.exists(file_path) and os.path.isfile(file_path):
+                    # 游戏入口页面附带首屏关键资源的预加载提示
+                    link = None
+                    entry = file_path == os.path.abspath(os.path.join(game_dir, ENTRY_PAGE))
+                    if entry:
+                        link = build_link_header(game_alias, get_preload(game_alias))
+                        # 确定是入口页面后立即发送 103，在打开文件之前让浏览器开始加载关键资源
+                        if link and early_hints and self.can_send_early_hints():
+                            self.send_early_hints(link)
+                    self.serve_file(file_path, link, game_alias, play=entry)
                     return
                 else:
                     # 尝试添加index.html
                     if not remaining_path.endswith('/') and not '.' in remaining_path.split('/')[-1]:
                         index_path = os.path.join(file_path, 'index.html')
                         if os.path.exists(index_path):
-                            self.serve_file(index_path)
+                            self.serve_file(index_path, alias=game_alias)
                             return
+            elif edge_cache is not None:
+                # 边缘模式：本地没有的游戏从上游源站拉取
+                self.serve_edge(parsed_path.path.lstrip('/'))
+                return
             
-            # 游戏未找到
+            # 游戏未找到，记录到404缓存
+            if game_alias != 'api':
+                negative_cache.add(game_alias, game_path if game else None)
             log_message(f"404 Not Found: {self.path}")
             self.send_error(404, "Game or file not found")
             return
@@ -130,29 +401,270 @@ class GameRequestHandler(http.server.SimpleHTTPRequestHandler):
         log_message(f"404 Not Found: {self.path}")
         self.send_error(404, "Not found")
     
-    def send_game_list_api(self):
+    def do_PUT(self):
+        """上传游戏：PUT/POST /api/games/<alias>，请求体为ZIP或tar包"""
+        parsed_path = urllib.parse.urlparse(self.path)
+        request_path = urllib.parse.unquote(parsed_path.path)
+        log_message(f"{self.command} {self.path} from {self.address_string()}")
+        # 请求体可能没有读取，响应后关闭连接
+        self.close_connection = True
+        
+        allowed, retry_after = rate_limiter.allow_request(self.client_address[0])
+        if not allowed:
+            self.send_too_many_requests(retry_after)
+            return
+        
+        if not request_path.startswith('/api/games/'):
+            self.send_error(405, "Method not allowed")
+            return
+        alias = request_path[len('/api/games/'):]
+        if edge_cache is not None or not upload_receiver.enabled:
+            self.send_json({'error': "Upload API is disabled"}, 403)
+            return
+        if not upload_receiver.authorize(self.headers.get('Authorization')):
+            log_message(f"401 Unauthorized upload: {self.path} from {self.address_string()}")
+            self.send_json({'error': "Invalid or missing token"}, 401, {'WWW-Authenticate': 'Bearer'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length'))
+            if length < 0:
+                raise ValueError(length)
+        except (TypeError, ValueError):
+            # 不支持 Transfer-Encoding: chunked，需要预先知道大小以检查限制
+            self.send_json({'error': "Content-Length required"}, 411)
+            return
+        
+        query = urllib.parse.parse_qs(parsed_path.query)
+        name = query.get('name', [alias])[0] or alias
+        webp = query.get('webp', ['0'])[0] not in ('0', '')
+        optimize = webp or query.get('optimize', ['0'])[0] not in ('0', '')
+        offline = query.get('offline', ['0'])[0] not in ('0', '')
+        started = time.monotonic()
+        enter_phase('upload')
+        try:
+            result, status = upload_receiver.receive(alias, name, self.rfile, length, optimize, webp, offline), 201
+            negative_cache.invalidate(alias)
+            log_message(f"Uploaded '{alias}': {result['files']} file(s), {length} bytes "
+                        f"in {time.monotonic() - started:.1f}s")
+        except UploadError as e:
+            log_message(f"Upload of '{alias}' failed: {e.status} {e}")
+            result, status = {'error': str(e)}, e.status
+        except socket.timeout:
+            log_message(f"Upload of '{alias}' failed: request body timed out")
+            result, status = {'error': "Request body timed out"}, 408
+        except Exception as e:
+            log_message(f"Upload of '{alias}' failed: {e}")
+            result, status = {'error': "Upload failed"}, 500
+        try:
+            self.send_json(result, status)
+        except (ConnectionResetError, BrokenPipeError) as e:
+            # 客户端在上传过程中断开
+            log_message(f"Client disconnected: {self.path} - {str(e)}")
+    
+    def do_POST(self):
+        parsed_path = urllib.parse.urlparse(self.path)
+        # 管理接口，其他路径按上传处理
+        admin_handlers = {
+            '/api/profile': self.configure_profiler,
+            '/api/memory': self.control_memory,
+        }
+        handler = admin_handlers.get(parsed_path.path)
+        if handler is None:
+            self.do_PUT()
+            return
+        log_message(f"POST {self.path} from {self.address_string()}")
+        self.close_connection = True
+        if self.require_admin():
+            handler(urllib.parse.parse_qs(parsed_path.query))
+    
+    def require_admin(self):
+        """
+        检查 Authorization: Bearer <admin_token>，未通过时发送错误响应
+        
+        Returns:
+            bool: 令牌正确返回True
+        """
+        token = upload_receiver.settings['admin_token']
+        if not token:
+            self.send_json({'error': "Admin API is disabled"}, 403)
+            return False
+        if not check_token(self.headers.get('Authorization'), token):
+            log_message(f"401 Unauthorized: {self.path} from {self.address_string()}")
+            self.send_json({'error': "Invalid or missing token"}, 401, {'WWW-Authenticate': 'Bearer'})
+            return False
+        return True
+    
+    def configure_profiler(self, query):
+        """
+        修改性能分析设置：POST /api/profile
+        
+        Args:
+            query (dict): 查询参数，timing为1/0开启或关闭阶段计时，slow_ms为慢请求阈值，
+                          cprofile为要运行cProfile的请求数，sort为结果排序方式，reset=1清空统计
+        """
+        try:
+            enabled = query.get('timing', [None])[0]
+            slow_ms = query.get('slow_ms', [None])[0]
+            profiler.configure(None if enabled is None else enabled not in ('0', ''),
+                               None if slow_ms is None else float(slow_ms))
+            if 'cprofile' in query:
+                profiler.profile_next(int(query['cprofile'][0]), query.get('sort', [PROFILE_SORT])[0])
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        if query.get('reset', ['0'])[0] not in ('0', ''):
+            profiler.reset()
+        log_message(f"Profiler updated: {profiler.get_stats()}")
+        self.send_json(profiler.get_stats())
+    
+    def control_memory(self, query):
+        """
+        控制 tracemalloc：POST /api/memory
+        
+        Args:
+            query (dict): 查询参数，tracemalloc为start/stop，frames为记录的调用栈深度；
+                          snapshot=1拍摄快照并与上一次比较，top为条目数，group为 lineno/filename/traceback
+        """
+        try:
+            action = query.get('tracemalloc', [None])[0]
+            if action == 'start':
+                memory_tracer.start(int(query.get('frames', [TRACE_FRAMES])[0]))
+            elif action == 'stop':
+                memory_tracer.stop()
+            elif action is not None:
+                raise ValueError("tracemalloc must be start or stop")
+            if query.get('snapshot', ['0'])[0] not in ('0', ''):
+                result = memory_tracer.snapshot(int(query.get('top', [TOP_ENTRIES])[0]),
+                                                query.get('group', ['lineno'])[0])
+            else:
+                result = memory_tracer.get_stats()
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        except RuntimeError as e:
+            self.send_json({'error': str(e)}, 409)
+            return
+        if action:
+            log_message(f"tracemalloc {action}")
+        self.send_json(result)
+    
+    def send_too_many_requests(self, retry_after):
+        """
+        发送429响应
+        
+        Args:
+            retry_after (float): 建议客户端等待的秒数
+        """
+        log_message(f"429 Too Many Requests: {self.path} from {self.address_string()}")
+        body = b"Too Many Requests"
+        self.send_response(429)
+        self.send_header("Retry-After", str(max(1, int(retry_after + 0.999))))
+        self.send_header("Content-type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_cached_not_found(self):
+        """发送预先生成的404响应"""
+        self.send_response(404, "Not Found")
+        self.send_header("Content-Type", self.error_content_type)
+        self.send_header("Content-Length", str(len(NOT_FOUND_BODY)))
+        self.end_headers()
+        self.wfile.write(NOT_FOUND_BODY)
+    
+    def send_json(self, data, status=200, headers=None):
+        """
+        发送JSON响应
+        
+        Args:
+            data: 可序列化为JSON的数据
+            status (int): HTTP状态码
+            headers (dict): 额外的响应头
+        """
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_game_list_api(self, query):
         """
         发送游戏列表API响应
+        
+        Args:
+            query (dict): 查询参数，sort为 recent（默认）或 popular，q为搜索内容，limit和offset用于分页
         """
-        games = get_all_games()
+        sort = query.get('sort', ['recent'])[0]
+        if sort not in ('recent', 'popular'):
+            self.send_error(400, "Invalid sort")
+            return
+        try:
+            limit = int(query.get('limit', ['-1'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+        except ValueError:
+            self.send_error(400, "Invalid limit or offset")
+            return
+        games = search_games(query.get('q', [''])[0], limit, offset, sort)
+        
+        # 加上尚未写入数据库的计数
+        pending = popularity.get_pending()
         
         # 转换为字典列表
         games_data = []
-        for game in games:
+        for alias, name, upload_time, play_count, bytes_served in games:
+            plays, nbytes = pending.get(alias, (0, 0))
             games_data.append({
-                'name': game[0],
-                'alias': game[1],
-                'upload_time': game[2]
+                'name': name,
+                'alias': alias,
+                'upload_time': upload_time,
+                'play_count': play_count + plays,
+                'bytes_served': bytes_served + nbytes,
             })
         
         response = {
             'games': games_data
         }
         
-        self.send_response(200)
-        self.send_header("Content-type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        self.send_json(response)
+    
+    def send_changes_api(self, query):
+        """
+        发送目录变更API响应，供其他节点增量同步
+        
+        Args:
+            query (dict): 查询参数，since为上次同步到的变更序号，limit为最多返回的条数
+        """
+        try:
+            since = int(query.get('since', ['0'])[0])
+            limit = min(int(query.get('limit', ['100'])[0]), 1000)
+        except ValueError:
+            self.send_error(400, "Invalid since or limit")
+            return
+        
+        changes = []
+        for seq, alias, op in get_changes_since(since, limit):
+            change = {'seq': seq, 'alias': alias, 'op': op}
+            if op == 'upsert':
+                game = get_game_by_alias(alias)
+                if game is None:
+                    # 之后又被删除，等待读取删除记录
+                    continue
+                change['game'] = {
+                    'name': game['name'],
+                    'alias': game['alias'],
+                    'upload_time': game['upload_time'],
+                }
+                change['files'] = [
+                    {'path': f['path'], 'size': f['size'], 'sha256': f['sha256']}
+                    for f in get_manifest(alias)
+                ]
+            changes.append(change)
+            since = seq
+        
+        self.send_json({'changes': changes, 'next': since})
     
     def send_game_list(self):
         """
@@ -206,73 +718,778 @@ class GameRequestHandler(http.server.SimpleHTTPRequestHandler):
         </html>
         '''
         
+        body = html.encode('utf-8')
         self.send_response(200)
         self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def etag_matches(self, etag):
+        """检查请求的If-None-Match是否与ETag匹配"""
+        if not etag:
+            return False
+        if_none_match = self.headers.get("If-None-Match")
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    
+    def send_not_modified(self, etag):
+        """发送304响应"""
+        self.send_response(304)
+        self.send_header("ETag", etag)
         self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        log_message(f"304 Not Modified: {self.path}")
     
-    def serve_file(self, file_path):
+    def send_body(self, fileobj, length=None):
+        """
+        分块发送响应内容，每块发送前按客户端和全局带宽限制限速
+        
+        Args:
+            fileobj: 提供read(size)方法的对象
+            length (int): 最多发送的字节数，None表示发送到末尾
+        
+        Returns:
+            int: 发送的字节数
         """
-        提供文件内容服务
+        client = self.client_address[0]
+        sent = 0
+        while length is None or sent < length:
+            size = CHUNK_SIZE if length is None else min(CHUNK_SIZE, length - sent)
+            chunk = fileobj.read(size)
+            if not chunk:
+                break
+            rate_limiter.throttle(client, len(chunk))
+            self.wfile.write(chunk)
+            sent += len(chunk)
+        return sent
+    
+    def parse_range(self, size, etag):
+        """
+        解析单段Range请求头
+        
+        Args:
+            size (int): 文件大小
+            etag (str): 文件当前的ETag，用于检查If-Range
+        
+        Returns:
+            tuple: (start, end) 包含两端的字节范围；不是有效的单段范围请求时返回None；
+                   范围无法满足时返回 (None, None)
         """
+        range_header = self.headers.get("Range")
+        if not range_header or not range_header.startswith("bytes="):
+            return None
+        # 文件已变化时忽略Range，返回完整内容
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range != etag:
+            return None
+        spec = range_header[len("bytes="):].strip()
+        if "," in spec or "-" not in spec:
+            return None
+        start_text, end_text = spec.split("-", 1)
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+            else:
+                start = max(0, size - int(end_text))
+                end = size - 1
+        except ValueError:
+            return None
+        end = min(end, size - 1)
+        if start > end:
+            return None, None
+        return start, end
+    
+    def can_send_early_hints(self):
+        """
+        是否可以发送 103 Early Hints
+        
+        1xx 响应只在 HTTP/1.1 中定义：客户端使用 HTTP/1.0 时只发送 Link 响应头。
+        Range 请求不是浏览器加载页面，不发送。
+        """
+        return self.request_version >= "HTTP/1.1" and 'Range' not in self.headers
+    
+    def send_early_hints(self, link):
+        """在最终响应之前发送 103 Early Hints，浏览器可以提前开始加载关键资源"""
+        self.send_response_only(103)
+        self.send_header("Link", link)
+        self.end_headers()
+    
+    def serve_file(self, file_path, link=None, alias=None, play=False):
+        """
+        提供文件内容服务，支持ETag条件请求和单段Range请求
+        
+        Args:
+            file_path (str): 文件路径
+            link (str): 预加载提示，非空时作为 Link 响应头发送
+            alias (str): 文件所属的游戏，用于统计热度
+            play (bool): 是否为游戏入口页面，完整请求（含304）计为一次游玩
+        """
+        enter_phase('open')
         try:
             # 确定文件MIME类型
             mime_type, _ = mimetypes.guess_type(file_path)
             if mime_type is None:
                 mime_type = 'application/octet-stream'
             
-            # 读取文件内容
-            with open(file_path, 'rb') as f:
-                content = f.read()
+            # 优化时生成了WebP版本的图片，按 Accept 头选择返回原图或WebP版本
+            vary = False
+            if mime_type in ('image/png', 'image/jpeg') and os.path.isfile(file_path + WEBP_SUFFIX):
+                vary = True
+                if 'image/webp' in self.headers.get('Accept', ''):
+                    file_path += WEBP_SUFFIX
+                    mime_type = 'image/webp'
             
-            # 发送响应
-            self.send_response(200)
-            self.send_header("Content-type", mime_type)
-            self.end_headers()
-            self.wfile.write(content)
+            with open(file_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                etag = make_etag(stat)
+                if self.etag_matches(etag):
+                    self.send_not_modified(etag)
+                    if alias and play:
+                        popularity.record(alias, 0, play=True)
+                    return
+                
+                byte_range = self.parse_range(stat.st_size, etag)
+                if byte_range == (None, None):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    log_message(f"416 Range Not Satisfiable: {self.path}")
+                    return
+                
+                # 发送响应头
+                if byte_range:
+                    start, end = byte_range
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+                    length = end - start + 1
+                    f.seek(start)
+                else:
+                    self.send_response(200)
+                    length = stat.st_size
+                self.send_header("Content-type", mime_type)
+                self.send_header("Content-Length", str(length))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", etag)
+                if link:
+                    self.send_header("Link", link)
+                if vary:
+                    self.send_header("Vary", "Accept")
+                self.end_headers()
+                
+                sent = self.send_body(f, length)
+                if sent < length:
+                    # 文件在发送期间被截短，内容与Content-Length不符，不能继续使用该连接
+                    self.close_connection = True
             
-            log_message(f"200 OK: {self.path} ({mime_type})")
+            if alias:
+                popularity.record(alias, sent, play=play and not byte_range)
+            if byte_range:
+                log_message(f"206 Partial Content: {self.path} ({mime_type}, range {start}-{end}, {sent} bytes)")
+            else:
+                log_message(f"200 OK: {self.path} ({mime_type}, {sent} bytes)")
+        except (ConnectionResetError, BrokenPipeError) as e:
+            # 响应头已发送，客户端中途断开时无法再返回错误页
+            log_message(f"Client disconnected: {self.path} - {str(e)}")
         except Exception as e:
             log_message(f"500 Internal Server Error: {self.path} - {str(e)}")
             self.send_error(500, f"Error serving file: {str(e)}")
+    
+    def serve_zip(self, alias):
+        """
+        以ZIP格式提供整个游戏目录的下载，边读取文件边生成，支持ETag条件请求和单段Range请求
+        
+        Args:
+            alias (str): 游戏别名
+        """
+        enter_phase('open')
+        game_dir = os.path.join(GAMES_ROOT, alias)
+        try:
+            try:
+                layout, digest = load_layout(alias, game_dir, get_manifest(alias))
+            except (OSError, ZipLayoutError):
+                # 文件清单与磁盘上的文件不一致（如服务器停止期间修改了文件），同步清单后重试一次
+                sync_game_files(alias)
+                layout, digest = load_layout(alias, game_dir, get_manifest(alias))
+        except (OSError, ZipLayoutError) as e:
+            log_message(f"500 Internal Server Error: {self.path} - {str(e)}")
+            self.send_error(500, "Error preparing download")
+            return
+        
+        etag = f'"zip-{digest[:16]}-{layout.size:x}"'
+        if self.etag_matches(etag):
+            self.send_not_modified(etag)
+            return
+        
+        byte_range = self.parse_range(layout.size, etag)
+        if byte_range == (None, None):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{layout.size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            log_message(f"416 Range Not Satisfiable: {self.path}")
+            return
+        
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{layout.size}")
+        else:
+            start, end = 0, layout.size - 1
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header("Content-type", "application/zip")
+        self.send_header("Content-Length", str(length))
+        filename = urllib.parse.quote(alias) + ".zip"
+        self.send_header("Content-Disposition", f"attachment; filename=\"{filename}\"; filename*=UTF-8''{filename}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        
+        try:
+            sent = self.send_body(layout.open(start, end), length)
+        except (ConnectionResetError, BrokenPipeError) as e:
+            log_message(f"Client disconnected: {self.path} - {str(e)}")
+            return
+        except (OSError, ZipLayoutError) as e:
+            # 响应头已发送，只能断开连接，客户端会发现长度不足
+            log_message(f"ZIP stream aborted: {self.path} - {str(e)}")
+            self.close_connection = True
+            return
+        popularity.record(alias, sent)
+        
+        if byte_range:
+            log_message(f"206 Partial Content: {self.path} (application/zip, range {start}-{end}, {sent} bytes)")
+        else:
+            log_message(f"200 OK: {self.path} (application/zip, {sent} bytes)")
+    
+    def serve_edge(self, key):
+        """
+        边缘模式下从缓存或上游源站提供游戏文件
+        
+        Args:
+            key (str): 去掉开头斜杠的请求路径，如 "alias/js/main.js"
+        """
+        enter_phase('upstream')
+        try:
+            response = edge_cache.open(key)
+        except EdgeError as e:
+            log_message(f"502 Bad Gateway: {self.path} - {str(e)}")
+            self.send_error(502, "Upstream unavailable")
+            return
+        
+        if response.status == 404:
+            log_message(f"404 Not Found (upstream): {self.path}")
+            self.send_error(404, "Game or file not found")
+            return
+        
+        meta = response.meta
+        try:
+            etag = meta.get("etag")
+            if self.etag_matches(etag):
+                self.send_not_modified(etag)
+                return
+            
+            self.send_response(200)
+            self.send_header("Content-type", meta["content_type"])
+            if meta.get("size") is not None:
+                self.send_header("Content-Length", str(meta["size"]))
+            else:
+                # 源站未给出长度，以关闭连接表示响应结束
+                self.close_connection = True
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("X-Cache", response.source)
+            self.end_headers()
+            
+            sent = self.send_body(response.body)
+            log_message(f"200 OK: {self.path} ({meta['content_type']}, edge {response.source}, {sent} bytes)")
+        except (ConnectionResetError, BrokenPipeError) as e:
+            log_message(f"Client disconnected: {self.path} - {str(e)}")
+        except EdgeError as e:
+            # 已发送响应头，只能断开连接
+            log_message(f"Edge fetch failed while sending: {self.path} - {str(e)}")
+            self.close_connection = True
+        finally:
+            # 未命中时源站内容由后台线程继续写入缓存，不受客户端断开影响
+            response.body.close()
 
-class StoppableHTTPServer(socketserver.TCPServer):
-    """可停止的HTTP服务器"""
-    def __init__(self, server_address, RequestHandlerClass):
-        super().__init__(server_address, RequestHandlerClass)
+def safe_join(base, relative_path):
+    """
+    拼接路径并确保结果位于base目录之内
+    
+    Args:
+        base (str): 基础目录
+        relative_path (str): 请求中的相对路径
+    
+    Returns:
+        str: 拼接后的路径，越出base目录时返回None
+    """
+    base_abs = os.path.abspath(base)
+    path = os.path.abspath(os.path.join(base_abs, relative_path))
+    if path != base_abs and not path.startswith(base_abs + os.sep):
+        return None
+    return path
+
+def make_etag(stat):
+    """
+    根据文件修改时间和大小生成ETag
+    
+    Args:
+        stat (os.stat_result): 文件状态
+    
+    Returns:
+        str: 带引号的ETag
+    """
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def on_games_changed(changes):
+    """
+    游戏目录中的文件被直接修改后，更新受影响游戏的404缓存、文件清单和预加载提示
+    
+    Args:
+        changes (dict): 游戏别名到变化路径集合的映射，None表示整个游戏目录；别名None表示主页文件
+    """
+    for alias, paths in changes.items():
+        if alias is None:
+            log_message("Watcher: homepage changed")
+            continue
+        negative_cache.invalidate(alias)
+        if get_game_by_alias(alias) is None:
+            continue
+        changed = sync_game_files(alias, paths)
+        if changed:
+            log_message(f"Watcher: {alias}: {len(changed)} file(s) changed on disk, manifest updated")
+
+def get_memory_structures():
+    """
+    进程内主要数据结构及保护它们的锁，供内存统计使用
+    
+    Returns:
+        dict: 名称到 (对象, 锁) 的映射
+    """
+    server = server_instance
+    layouts, layouts_lock = get_layout_cache()
+    structures = {
+        'server_logs': (server_logs, log_lock),
+        'negative_cache': (negative_cache.entries, negative_cache.lock),
+        'rate_limit_clients': (rate_limiter.clients, rate_limiter.lock),
+        'popularity_pending': (popularity.pending, popularity.lock),
+        'zip_layouts': (layouts, layouts_lock),
+        'profiler_histograms': (profiler.histograms, profiler.lock),
+        'slow_requests': (profiler.slow_requests, profiler.lock),
+    }
+    if server:
+        structures['connections_per_ip'] = (server.connections_per_ip, server.active_lock)
+    if edge_cache:
+        structures['edge_index'] = (edge_cache.index, edge_cache.lock)
+    if games_watcher:
+        structures['watcher_pending'] = (games_watcher.pending, None)
+        structures['watcher_watches'] = (games_watcher.watches, None)
+    if scrubber:
+        structures['scrub_mismatches'] = (scrubber.mismatches, scrubber.lock)
+    return structures
+
+def get_server_memory():
+    """
+    获取服务器进程的内存报告：RSS、各数据结构的大小、进行中请求的发送缓冲和 tracemalloc 状态
+    
+    Returns:
+        dict: 内存报告
+    """
+    report = get_memory_report(get_memory_structures(), memory_tracer)
+    active = server_instance.get_busy_requests() if server_instance else 0
+    report['in_flight'] = {'requests': active, 'buffer_bytes': active * CHUNK_SIZE}
+    return report
+
+def get_server_stats(detail=False):
+    """
+    获取服务器统计信息
+    
+    Args:
+        detail (bool): 是否包括各客户端IP的计数、上传、性能分析和不一致文件等明细（需要管理令牌）
+    
+    Returns:
+        dict: 进行中的请求数和限流统计
+    """
+    server = server_instance
+    rate_limit = rate_limiter.get_stats()
+    clients = rate_limit.pop('clients')
+    edge = edge_cache.get_stats() if edge_cache else None
+    scrub = scrubber.get_stats() if scrubber else None
+    mismatches = scrub.pop('recent_mismatches') if scrub else None
+    stats = {
+        'running': bool(server and server.running),
+        'active_requests': server.get_busy_requests() if server else 0,
+        'idle_connections': len(server.idle_connections) if server else 0,
+        'shed_connections': server.shed_connections if server else 0,
+        'rate_limit': rate_limit,
+        'edge_cache': edge,
+        'popularity': popularity.get_stats(),
+        'negative_cache': negative_cache.get_stats(),
+        'watcher': games_watcher.get_stats() if games_watcher else None,
+        'scrubber': scrub,
+    }
+    if not detail:
+        if edge:
+            edge.pop('upstream')
+        return stats
+    
+    stats['connections_per_ip'] = dict(server.connections_per_ip) if server else {}
+    rate_limit['clients'] = clients
+    if scrub:
+        scrub['recent_mismatches'] = mismatches
+    stats['uploads'] = upload_receiver.get_stats()
+    stats['profiler'] = profiler.get_stats()
+    return stats
+
+class StoppableHTTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """可停止的HTTP服务器，每个连接一个线程，并跟踪进行中的请求以便优雅停止"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, RequestHandlerClass, sock=None, limits=None):
+        self.limits = dict(CONNECTION_SETTINGS)
+        if limits:
+            self.limits.update(limits)
+        self.request_queue_size = self.limits['listen_backlog']
+        # 继承的套接字已经绑定并处于监听状态，不需要再次bind/listen
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate=sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
         self.running = True
+        self.active_requests = 0
+        self.connections_per_ip = {}
+        self.shed_connections = 0
+        self.active_lock = threading.Condition()
+        self.stopped = threading.Event()
+        # keep-alive连接上正在等待下一个请求的套接字
+        self.idle_connections = set()
+
+    def process_request(self, request, client_address):
+        # 在接受线程中计数，避免停止时漏掉刚被接受、线程尚未启动的请求
+        client = client_address[0]
+        with self.active_lock:
+            over_limit = (self.active_requests >= self.limits['max_connections'] or
+                          self.connections_per_ip.get(client, 0) >= self.limits['max_connections_per_ip'])
+            if over_limit:
+                self.shed_connections += 1
+            else:
+                self.active_requests += 1
+                self.connections_per_ip[client] = self.connections_per_ip.get(client, 0) + 1
+        if over_limit:
+            self.shed_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._request_finished(client_address)
+            raise
 
-def start_server(port=PORT):
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._request_finished(client_address)
+
+    def _request_finished(self, client_address):
+        client = client_address[0]
+        with self.active_lock:
+            self.active_requests -= 1
+            count = self.connections_per_ip.get(client, 0) - 1
+            if count > 0:
+                self.connections_per_ip[client] = count
+            else:
+                self.connections_per_ip.pop(client, None)
+            self.active_lock.notify_all()
+
+    def begin_idle(self, connection):
+        """
+        登记空闲的keep-alive连接
+
+        Returns:
+            bool: 服务器正在停止时返回False，调用方应关闭连接
+        """
+        with self.active_lock:
+            if not self.running:
+                return False
+            self.idle_connections.add(connection)
+            return True
+
+    def end_idle(self, connection):
+        with self.active_lock:
+            self.idle_connections.discard(connection)
+
+    def close_idle_connections(self):
+        """关闭所有空闲的keep-alive连接，等待下一个请求的处理线程随即退出"""
+        with self.active_lock:
+            for connection in self.idle_connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def get_busy_requests(self):
+        """进行中的请求数，不包括空闲的keep-alive连接"""
+        with self.active_lock:
+            return self.active_requests - len(self.idle_connections)
+
+    def shed_request(self, request):
+        """连接数超限时立即返回503并关闭连接，不占用处理线程"""
+        try:
+            request.setblocking(False)
+            request.send(SHED_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def wait_for_drain(self, timeout):
+        """
+        等待进行中的请求全部完成
+
+        Args:
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            bool: 在期限内全部完成返回True，否则返回False
+        """
+        with self.active_lock:
+            return self.active_lock.wait_for(lambda: self.active_requests == 0, timeout)
+
+def get_inherited_socket():
+    """
+    获取热重启时由旧进程交过来的监听套接字
+
+    Returns:
+        socket.socket: 继承的套接字，如果不是由热重启启动则返回None
+    """
+    value = os.environ.pop(LISTEN_FD_ENV, None)
+    if not value:
+        return None
+    if value == "share":
+        # Windows: 旧进程通过标准输入发送 socket.share() 的数据
+        return socket.fromshare(sys.stdin.buffer.read())
+    return socket.socket(fileno=int(value))
+
+def notify_ready():
+    """通知启动本进程的旧进程：新进程已经开始监听"""
+    ready_file = os.environ.pop(READY_FILE_ENV, None)
+    if ready_file:
+        with open(ready_file, "w") as f:
+            f.write(str(os.getpid()))
+
+def start_server(port=PORT, drain_timeout=DRAIN_TIMEOUT, upstream=None,
+                 cache_dir=CACHE_DIR, cache_max_bytes=CACHE_MAX_BYTES,
+                 prewarm_bytes=0, prewarm_rate=0):
     """
     启动HTTP服务器
     
     Args:
         port (int): 服务器端口，默认8000
+        drain_timeout (float): 停止时等待进行中请求完成的最长时间（秒）
+        upstream (str): 上游GalHub源站地址，指定后作为边缘节点运行
+        cache_dir (str): 边缘缓存目录
+        cache_max_bytes (int): 边缘缓存容量上限（字节）
+        prewarm_bytes (int): 启动后根据访问日志预热的热门文件字节数，0表示不预热
+        prewarm_rate (int): 预热时每秒最多读取的字节数，0表示不限速
     """
-    global server_instance
+    global server_instance, rate_limiter, edge_cache, log_writer, early_hints, popularity, negative_cache
+    global games_watcher, upload_receiver, profiler, scrubber
     
     # 确保游戏目录存在
     os.makedirs(GAMES_ROOT, exist_ok=True)
     
-    # 创建服务器实例
-    server_instance = StoppableHTTPServer(("", port), GameRequestHandler)
+    # 根据设置表加载限流和日志切分配置
+    rate_limiter = load_rate_limiter()
+    log_writer = load_log_writer(LOGS_DIR)
+    popularity = load_popularity_counter()
+    negative_cache = load_negative_cache()
+    upload_receiver = UploadReceiver(load_upload_settings())
+    profiler = load_request_profiler(LOGS_DIR, log=log_message)
+    early_hints = load_typed_settings({'early_hints': 0}, log=log_message)['early_hints'] != 0
+    
+    # 边缘模式：本地没有的游戏从上游源站拉取并缓存
+    if upstream:
+        edge_cache = EdgeCache(upstream, cache_dir, cache_max_bytes, log=log_message)
+        log_message(f"Edge mode: upstream {upstream}, cache {cache_dir} "
+                    f"({edge_cache.total_bytes}/{cache_max_bytes} bytes, {len(edge_cache.index)} entries)")
     
-    log_message(f"Game CDN server starting at http://localhost:{port}/")
+    # 删除之前中断的上传留下的暂存文件
+    if not upstream:
+        clean_staging()
+    
+    # 创建服务器实例（热重启时直接使用旧进程交过来的监听套接字）
+    sock = get_inherited_socket()
+    server = StoppableHTTPServer(("", port), GameRequestHandler, sock=sock, limits=load_connection_limits())
+    server_instance = server
+    
+    if sock is not None:
+        log_message(f"Game CDN server resumed on inherited socket at http://localhost:{port}/")
+    else:
+        log_message(f"Game CDN server starting at http://localhost:{port}/")
+    notify_ready()
+    
+    # 在后台定期把热度计数写入数据库，请求处理线程只更新内存中的计数
+    popularity.start(server.stopped, log=log_message)
+    
+    # 监视游戏目录，运维直接修改文件后更新缓存和文件清单（边缘模式不使用本地游戏目录）
+    watch_settings = load_watch_settings()
+    if watch_settings['watch_games'] and not upstream:
+        games_watcher = GamesWatcher(GAMES_ROOT, get_resource_path('index.html'), on_games_changed,
+                                     debounce=watch_settings['watch_debounce'],
+                                     poll_interval=watch_settings['watch_poll_interval'], log=log_message)
+        games_watcher.start(server.stopped)
+    
+    # 在后台按限速检查游戏文件是否与上传时记录的哈希一致，请求较多时暂停
+    scrub_settings = load_scrub_settings()
+    if scrub_settings['scrub_enabled'] and not upstream:
+        scrubber = Scrubber(GAMES_ROOT, scrub_settings, get_load=server.get_busy_requests,
+                            on_quarantine=on_games_changed, log=log_message)
+        scrubber.start(server.stopped)
+    
+    # 端口已绑定，在后台预热热门文件，不影响接受请求
+    if prewarm_bytes:
+        threading.Thread(
+            target=prewarm,
+            args=(GAMES_ROOT, LOGS_DIR, prewarm_bytes, prewarm_rate),
+            kwargs={'log': log_message, 'stop_event': server.stopped},
+            daemon=True,
+        ).start()
     
     try:
-        while server_instance.running:
-            server_instance.handle_request()
+        server.serve_forever(poll_interval=0.5)
     except Exception as e:
         log_message(f"Server error: {str(e)}")
+    finally:
+        # 先停止接受新连接，再等待进行中的响应发送完毕
+        server.running = False
+        server.server_close()
+        server.close_idle_connections()
+        log_message(f"Draining {server.active_requests} in-flight request(s)")
+        if server.wait_for_drain(drain_timeout):
+            log_message("All in-flight requests completed")
+        else:
+            log_message(f"Drain timeout after {drain_timeout}s, {server.active_requests} request(s) abandoned")
+        if server_instance is server:
+            server_instance = None
+        # 写入最后一批热度计数
+        try:
+            popularity.flush()
+        except Exception as e:
+            log_message(f"Failed to save game stats: {e}")
+        server.stopped.set()
     
     log_message("Server stopped")
 
-def stop_server():
-    """停止服务器"""
-    global server_instance
+def stop_server(wait=False, timeout=None):
+    """
+    停止服务器：不再接受新连接，等待进行中的请求完成后关闭监听套接字
+    
+    Args:
+        wait (bool): 是否等待服务器完全停止
+        timeout (float): 等待的最长时间（秒），None表示一直等待
+    
+    Returns:
+        bool: 服务器正在运行并已请求停止返回True，否则返回False
+    """
+    server = server_instance
     
-    if server_instance:
-        server_instance.running = False
+    if server and server.running:
+        server.running = False
         log_message("Server stop requested")
+        # shutdown() 会阻塞到服务循环退出，放到单独线程中执行，
+        # 这样在信号处理函数或请求处理线程中调用也不会死锁
+        threading.Thread(target=server.shutdown, daemon=True).start()
+        if wait:
+            server.stopped.wait(timeout)
         return True
-    return False
\ No newline at end of file
+    return False
+
+def get_restart_command():
+    """获取热重启时启动新进程的命令行"""
+    if getattr(sys, "frozen", False):
+        command = [sys.executable]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]
+    # 通过命令行启动的服务器沿用原来的参数，UI中启动的服务器只传端口
+    if "serve" in sys.argv[1:]:
+        return command + sys.argv[1:]
+    port = server_instance.server_address[1] if server_instance else PORT
+    return command + ["serve", "--port", str(port)]
+
+def restart_server():
+    """
+    热重启：把监听套接字交给新启动的进程，新进程就绪后当前进程优雅停止
+    
+    监听套接字始终保持打开，排队中的连接由新进程接受，进行中的请求由当前进程发送完毕。
+    
+    Returns:
+        bool: 新进程启动成功并已接管监听返回True，否则返回False
+    """
+    server = server_instance
+    if not server or not server.running:
+        return False
+    
+    fd, ready_file = tempfile.mkstemp(prefix="galhub_ready_")
+    os.close(fd)
+    os.remove(ready_file)
+    
+    env = dict(os.environ)
+    env[READY_FILE_ENV] = ready_file
+    command = get_restart_command()
+    log_message(f"Hot restart requested, spawning: {' '.join(command)}")
+    
+    try:
+        if hasattr(socket.socket, "share"):
+            # Windows不能直接继承套接字句柄，通过标准输入传递共享数据
+            env[LISTEN_FD_ENV] = "share"
+            proc = subprocess.Popen(command, env=env, stdin=subprocess.PIPE)
+            proc.stdin.write(server.socket.share(proc.pid))
+            proc.stdin.close()
+        else:
+            listen_fd = server.socket.fileno()
+            env[LISTEN_FD_ENV] = str(listen_fd)
+            proc = subprocess.Popen(command, env=env, pass_fds=(listen_fd,))
+    except Exception as e:
+        log_message(f"Hot restart failed: {str(e)}")
+        return False
+    
+    # 等待新进程就绪，失败时继续由当前进程提供服务
+    deadline = time.monotonic() + RESTART_READY_TIMEOUT
+    while not os.path.exists(ready_file):
+        if proc.poll() is not None:
+            log_message(f"Hot restart failed: new process exited with code {proc.returncode}")
+            return False
+        if time.monotonic() > deadline:
+            log_message("Hot restart failed: new process did not become ready in time")
+            proc.terminate()
+            return False
+        time.sleep(0.1)
+    os.remove(ready_file)
+    
+    log_message(f"New server process {proc.pid} is ready, handing over")
+    return stop_server()
+
+def install_signal_handlers():
+    """
+    安装信号处理：SIGTERM/SIGINT 优雅停止，SIGHUP（Windows上为Ctrl+Break）热重启
+    
+    只能在主线程中调用。
+    """
+    # 信号处理函数在主线程中执行，可能打断持有 log_lock 的 log_message()，因此交给其他线程处理
+    def handle_stop(signum, frame):
+        threading.Thread(target=stop_server, daemon=True).start()
+
+    def handle_restart(signum, frame):
+        threading.Thread(target=restart_server, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    restart_signal = getattr(signal, "SIGHUP", None) or getattr(signal, "SIGBREAK", None)
+    if restart_signal is not None:
+        signal.signal(restart_signal, handle_restart)
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+GalHub - 快照导出和导入模块
+把数据库的一致备份和所有游戏文件（按内容哈希去重）写入一个顺序的tar流；
+新节点顺序读取这一个文件即可恢复，读取的同时在多个线程中校验哈希并放置文件
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import DB_PATH, backup_db, read_catalog, check_db_integrity, ensure_db, get_all_games
+from manager import GAMES_ROOT, is_valid_alias, get_game_file_path, get_manifest, sync_game_files
+
+# 快照格式标识和版本
+SNAPSHOT_FORMAT = "galhub-snapshot"
+SNAPSHOT_VERSION = 1
+# 快照中的成员名：依次为说明、数据库、按哈希命名的文件内容
+HEADER_NAME = "SNAPSHOT.json"
+DATABASE_NAME = "games.db"
+BLOB_PREFIX = "blobs/"
+# 导入时的暂存目录，全部文件校验通过后再移入游戏目录
+STAGING_DIR = os.path.join(GAMES_ROOT, ".snapshot")
+# 读写文件时每次处理的块大小
+CHUNK_SIZE = 1024 * 1024
+# 导入时默认的校验线程数
+DEFAULT_WORKERS = 4
+
+class SnapshotError(Exception):
+    """快照内容不完整或与记录的哈希不一致"""
+
+class HashingReader:
+    """读取文件的同时计算SHA-256，tarfile按成员大小读取"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+def add_bytes(archive, name, data):
+    """把内存中的数据作为一个成员写入tar流"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(data))
+
+def export_snapshot(output):
+    """
+    导出快照
+
+    Args:
+        output (str): 输出文件路径，"-" 表示写到标准输出（可以直接通过管道传给新节点）
+
+    Returns:
+        bool: 成功返回True，否则返回False
+    """
+    # 写到标准输出时提示信息输出到标准错误，不混入快照内容
+    log = sys.stderr if output == "-" else sys.stdout
+    started = time.monotonic()
+
+    # 先把直接修改过的文件同步到清单（旧版本上传的游戏先生成清单），使备份中的哈希与磁盘一致
+    for alias, _, _ in get_all_games():
+        get_manifest(alias)
+        sync_game_files(alias)
+
+    fd, backup_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    stream = None
+    try:
+        backup_db(backup_path)
+        catalog = read_catalog(backup_path)
+        blobs = {}
+        for alias, files in catalog.items():
+            for entry in files:
+                blobs.setdefault(entry['sha256'], (alias, entry))
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'created': datetime.now().isoformat(timespec="seconds"),
+            'games': len(catalog),
+            'files': sum(len(files) for files in catalog.values()),
+            'blobs': len(blobs),
+            'bytes': sum(entry['size'] for _, entry in blobs.values()),
+        }
+
+        stream = sys.stdout.buffer if output == "-" else open(output + ".tmp", "wb")
+        with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+            add_bytes(archive, HEADER_NAME, json.dumps(header, ensure_ascii=False).encode("utf-8"))
+            with open(backup_path, "rb") as f:
+                archive.addfile(archive.gettarinfo(fileobj=f, arcname=DATABASE_NAME), f)
+            for sha256, (alias, entry) in blobs.items():
+                file_path = os.path.join(GAMES_ROOT, alias, *entry['path'].split('/'))
+                info = tarfile.TarInfo(BLOB_PREFIX + sha256)
+                info.size = entry['size']
+                info.mtime = int(entry['mtime'])
+                with open(file_path, "rb") as f:
+                    reader = HashingReader(f)
+                    # 文件比清单记录的短时 tarfile 会抛出 OSError
+                    archive.addfile(info, reader)
+                if reader.digest.hexdigest() != sha256:
+                    raise SnapshotError(f"{alias}/{entry['path']} changed during export")
+        if output != "-":
+            stream.close()
+            os.replace(output + ".tmp", output)
+    except (OSError, SnapshotError, tarfile.TarError) as e:
+        print(f"Error exporting snapshot: {str(e)}", file=log)
+        if output != "-" and stream is not None:
+            stream.close()
+            if os.path.exists(output + ".tmp"):
+                os.remove(output + ".tmp")
+        return False
+    finally:
+        os.remove(backup_path)
+
+    print(f"Snapshot exported: {header['games']} game(s), {header['files']} file(s), "
+          f"{header['blobs']} unique blob(s), {header['bytes']} bytes in {time.monotonic() - started:.1f}s", file=log)
+    return True
+
+def place_blob(blob_path, sha256, size, targets):
+    """
+    校验暂存的文件内容，放到使用它的每个位置并恢复修改时间，在线程池中执行
+
+    Args:
+        blob_path (str): 暂存文件
+        sha256 (str): 清单记录的哈希
+        size (int): 清单记录的大小
+        targets (list): (目标路径, 修改时间) 列表
+    """
+    digest = hashlib.sha256()
+    with open(blob_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    if digest.hexdigest() != sha256 or os.path.getsize(blob_path) != size:
+        raise SnapshotError(f"blob {sha256} does not match its hash")
+    for index, (target, mtime) in enumerate(targets):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if index == len(targets) - 1:
+            os.replace(blob_path, target)
+        else:
+            shutil.copyfile(blob_path, target)
+        os.utime(target, (mtime, mtime))
+
+def import_snapshot(source, workers=DEFAULT_WORKERS):
+    """
+    导入快照：顺序读取一次，文件内容在多个线程中校验并放置，全部完成后替换数据库
+
+    只能导入到没有游戏的节点。
+
+    Args:
+        source (str): 快照文件路径，"-" 表示从标准输入读取
+        workers (int): 校验和放置文件的线程数
+
+    Returns:
+        bool: 成功返回True，否则返回False
+    """
+    if get_all_games() or any(not name.startswith(".") for name in os.listdir(GAMES_ROOT)):
+        print("Error: Snapshots can only be imported into an empty node (no games in the database or games/)")
+        return False
+
+    started = time.monotonic()
+    db_tmp = DB_PATH + ".import"
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    os.makedirs(STAGING_DIR)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    # 限制等待校验的暂存文件数，读取速度超过校验速度时暂停读取
+    slots = threading.BoundedSemaphore(max(1, workers) * 4)
+    futures = []
+    received = set()
+    try:
+        stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+        with stream, tarfile.open(fileobj=stream, mode="r|*") as archive:
+            header, targets = None, None
+            for info in archive:
+                if header is None:
+                    if info.name != HEADER_NAME:
+                        raise SnapshotError("not a GalHub snapshot")
+                    header = json.loads(archive.extractfile(info).read().decode("utf-8"))
+                    if header.get('format') != SNAPSHOT_FORMAT or header.get('version') != SNAPSHOT_VERSION:
+                        raise SnapshotError(f"unsupported snapshot format {header.get('format')} "
+                                            f"version {header.get('version')}")
+                elif targets is None:
+                    if info.name != DATABASE_NAME:
+                        raise SnapshotError("database missing from snapshot")
+                    copy_member(archive, info, db_tmp)
+                    result = check_db_integrity(db_tmp)
+                    if result != "ok":
+                        raise SnapshotError(f"database integrity check failed: {result}")
+                    targets = build_targets(read_catalog(db_tmp))
+                elif info.name.startswith(BLOB_PREFIX) and info.isfile():
+                    sha256 = info.name[len(BLOB_PREFIX):]
+                    if sha256 not in targets or sha256 in received:
+                        continue
+                    blob_path = os.path.join(STAGING_DIR, sha256 + ".blob")
+                    slots.acquire()
+                    try:
+                        copy_member(archive, info, blob_path)
+                        future = executor.submit(place_blob, blob_path, sha256, info.size, targets[sha256])
+                    except BaseException:
+                        slots.release()
+                        raise
+                    future.add_done_callback(lambda future: slots.release())
+                    futures.append(future)
+                    received.add(sha256)
+            if targets is None:
+                raise SnapshotError("snapshot is truncated")
+
+        for future in futures:
+            future.result()
+        missing = len(targets) - len(received)
+        if missing:
+            raise SnapshotError(f"{missing} blob(s) missing from snapshot")
+
+        # 全部校验通过：移入游戏目录，最后替换数据库
+        catalog = read_catalog(db_tmp)
+        for alias in catalog:
+            staged = os.path.join(STAGING_DIR, "games", alias)
+            os.makedirs(staged, exist_ok=True)
+            os.rename(staged, os.path.join(GAMES_ROOT, alias))
+        os.replace(db_tmp, DB_PATH)
+        ensure_db()
+    except (OSError, ValueError, SnapshotError, tarfile.TarError) as e:
+        print(f"Error importing snapshot: {str(e)}")
+        return False
+    finally:
+        executor.shutdown(cancel_futures=True)
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        if os.path.exists(db_tmp):
+            os.remove(db_tmp)
+
+    print(f"Snapshot imported: {header['games']} game(s), {header['files']} file(s), "
+          f"{header['bytes']} bytes verified in {time.monotonic() - started:.1f}s")
+    return True
+
+def copy_member(archive, info, path):
+    """把tar成员的内容写入文件"""
+    with archive.extractfile(info) as fsrc, open(path, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+def build_targets(catalog):
+    """
+    根据快照中的文件清单计算每个内容哈希需要放置的位置
+
+    快照中的别名和路径不可信，任何一个可能跳出游戏目录时整个导入失败。
+
+    Returns:
+        dict: 哈希到 (暂存目录中的目标路径, 修改时间) 列表的映射
+    """
+    targets = {}
+    for alias, files in catalog.items():
+        if not is_valid_alias(alias):
+            raise SnapshotError(f"invalid alias in snapshot: {alias!r}")
+        for entry in files:
+            try:
+                target = get_game_file_path(alias, entry['path'], root=os.path.join(STAGING_DIR, "games"))
+            except ValueError as e:
+                raise SnapshotError(str(e))
+            targets.setdefault(entry['sha256'], []).append((target, entry['mtime']))
+    return targets
\ No newline at end of file
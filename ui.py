@@ -1,9 +1,14 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
-from database import init_db, get_all_games, get_domain, set_domain
+import queue
+import re
+from database import init_db, search_games, get_domain, set_domain
 from manager import upload_game, remove_game, init_manager, get_game_url, update_domain
 from server import start_server, stop_server, get_server_logs
+from logview import LogFile
+from logfiles import LOGS_DIR, list_log_files
+from logstats import format_bytes
 import threading
 import time
 from datetime import datetime
@@ -16,6 +21,110 @@ except ImportError:
     pyperclip = None
     PYPERCLIP_AVAILABLE = False
 
+# 游戏列表每次加载的行数
+GAME_PAGE_SIZE = 200
+
+def load_game_rows(query, limit, offset, order):
+    """查询一页游戏，转换为列表中显示的行（流量格式化为易读的单位）"""
+    return [
+        (alias, name, upload_time, play_count, format_bytes(bytes_served))
+        for alias, name, upload_time, play_count, bytes_served in search_games(query, limit, offset, order)
+    ]
+
+class Job:
+    """
+    后台任务
+
+    工作线程通过 report() 报告进度，界面线程通过 cancel() 请求取消，
+    任务函数需要自行检查 cancel_event 并尽快返回。
+    """
+    # 进度报告的最小间隔（秒），避免大量进度事件堆积在队列中
+    REPORT_INTERVAL = 0.1
+
+    def __init__(self, func, on_done=None, on_progress=None, description=""):
+        self.func = func
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.description = description
+        self.cancel_event = threading.Event()
+        self.started_at = None
+        self.last_report = 0
+        self.events = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report(self, *args, force=False):
+        """在工作线程中报告进度，进度回调稍后在界面线程中调用"""
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_report < self.REPORT_INTERVAL:
+            return
+        self.last_report = now
+        self.events.put((self.on_progress, (self,) + args))
+
+class JobQueue:
+    """
+    在工作线程中执行耗时操作的任务队列
+
+    任务的进度和结果放入线程安全的事件队列，由界面线程通过 root.after 定时取出并调用回调，
+    因此回调中可以直接操作界面控件，主循环在任务执行期间保持响应。
+    """
+    def __init__(self, root, workers=2, interval=100):
+        self.root = root
+        self.interval = interval
+        self.tasks = queue.Queue()
+        self.events = queue.Queue()
+        for _ in range(workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+        self.root.after(self.interval, self.poll)
+
+    def submit(self, func, on_done=None, on_progress=None, description=""):
+        """
+        提交任务
+
+        Args:
+            func (callable): 在工作线程中执行的函数，参数为 Job
+            on_done (callable): 完成后在界面线程中调用，参数为 (job, 返回值, 异常)
+            on_progress (callable): 在界面线程中调用的进度回调，参数为 (job, *report的参数)
+            description (str): 任务说明
+
+        Returns:
+            Job: 提交的任务
+        """
+        job = Job(func, on_done, on_progress, description)
+        job.events = self.events
+        self.tasks.put(job)
+        return job
+
+    def worker(self):
+        while True:
+            job = self.tasks.get()
+            job.started_at = time.monotonic()
+            result, error = None, None
+            try:
+                result = job.func(job)
+            except Exception as e:
+                error = e
+            if job.on_done:
+                self.events.put((job.on_done, (job, result, error)))
+
+    def poll(self):
+        """在界面线程中处理工作线程发来的进度和结果"""
+        try:
+            while True:
+                try:
+                    callback, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                callback(*args)
+        finally:
+            self.root.after(self.interval, self.poll)
+
 class GameCDNUI:
     def __init__(self, root):
         self.root = root
@@ -26,6 +135,20 @@ class GameCDNUI:
         self.server_thread = None
         self.log_update_job = None
         
+        # 后台任务：上传、删除和刷新列表在工作线程中执行
+        self.jobs = JobQueue(self.root)
+        self.upload_job = None
+        
+        # 游戏列表：按别名记录已显示的行，滚动到底部时分页加载
+        self.game_rows = {}
+        self.game_query = ""
+        self.game_order = "recent"
+        self.games_loaded = 0
+        self.games_exhausted = False
+        self.games_loading = False
+        self.refresh_generation = 0
+        self.search_job = None
+        
         # 初始化数据库
         init_manager()
         
@@ -103,9 +226,27 @@ class GameCDNUI:
         browse_button = ttk.Button(upload_frame, text="浏览", command=self.browse_folder)
         browse_button.grid(row=2, column=2, padx=(10, 0), pady=2)
         
+        # 上传选项：压缩JS、CSS、JSON和图片，可选生成WebP版本和离线缓存
+        option_frame = ttk.Frame(upload_frame)
+        option_frame.grid(row=3, column=0, sticky="w")
+        self.optimize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="优化资源", variable=self.optimize_var).pack(side="left")
+        self.webp_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="WebP", variable=self.webp_var).pack(side="left", padx=(5, 0))
+        self.offline_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="离线缓存", variable=self.offline_var).pack(side="left", padx=(5, 0))
+        
         # 上传按钮
-        upload_button = ttk.Button(upload_frame, text="上传游戏", command=self.upload_game)
-        upload_button.grid(row=3, column=1, pady=10)
+        self.upload_button = ttk.Button(upload_frame, text="上传游戏", command=self.upload_game)
+        self.upload_button.grid(row=3, column=1, pady=10)
+        
+        # 任务进度
+        self.job_progress = ttk.Progressbar(upload_frame, mode="determinate", maximum=100)
+        self.job_progress.grid(row=4, column=0, columnspan=2, sticky="ew", pady=2)
+        self.job_cancel_button = ttk.Button(upload_frame, text="取消", command=self.cancel_upload, state="disabled")
+        self.job_cancel_button.grid(row=4, column=2, padx=(10, 0), pady=2)
+        self.job_status_label = ttk.Label(upload_frame, text="")
+        self.job_status_label.grid(row=5, column=0, columnspan=3, sticky="w")
         
         upload_frame.columnconfigure(1, weight=1)
         
@@ -113,27 +254,44 @@ class GameCDNUI:
         list_frame = ttk.LabelFrame(self.manage_tab, text="游戏列表", padding="10")
         list_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
         
+        # 搜索框，按别名或名称前缀过滤
+        search_frame = ttk.Frame(list_frame)
+        search_frame.pack(side="top", fill="x", pady=(0, 5))
+        ttk.Label(search_frame, text="搜索:").pack(side="left")
+        self.game_search_var = tk.StringVar()
+        self.game_search_var.trace_add("write", self.on_game_search_changed)
+        ttk.Entry(search_frame, textvariable=self.game_search_var, width=30).pack(side="left", padx=(5, 0))
+        self.game_popular_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="按热度排序", variable=self.game_popular_var,
+                        command=self.on_game_order_changed).pack(side="left", padx=(10, 0))
+        self.game_count_label = ttk.Label(search_frame, text="")
+        self.game_count_label.pack(side="right")
+        
         # 创建Treeview来显示游戏列表
-        columns = ("alias", "name", "upload_time")
+        columns = ("alias", "name", "upload_time", "play_count", "bytes_served")
         self.game_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
         
         # 定义列标题（调整列顺序，将游戏名称放在游戏别名之后）
         self.game_tree.heading("alias", text="游戏别名")
         self.game_tree.heading("name", text="游戏名称")
         self.game_tree.heading("upload_time", text="上传时间")
+        self.game_tree.heading("play_count", text="游玩次数")
+        self.game_tree.heading("bytes_served", text="流量")
         
         # 设置列宽
         self.game_tree.column("alias", width=150)
         self.game_tree.column("name", width=200)
         self.game_tree.column("upload_time", width=200)
+        self.game_tree.column("play_count", width=80, anchor="e")
+        self.game_tree.column("bytes_served", width=90, anchor="e")
         
         # 添加滚动条
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.game_tree.yview)
-        self.game_tree.configure(yscrollcommand=scrollbar.set)
+        self.game_scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.game_tree.yview)
+        self.game_tree.configure(yscrollcommand=self.on_game_list_scroll)
         
         # 布局
         self.game_tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.game_scrollbar.pack(side="right", fill="y")
         
         # 操作区域
         button_frame = ttk.Frame(list_frame)
@@ -174,8 +332,8 @@ class GameCDNUI:
         refresh_button = ttk.Button(buttons_frame, text="刷新列表", command=self.refresh_game_list)
         refresh_button.pack(fill="x", pady=(0, 5))
         
-        delete_button = ttk.Button(buttons_frame, text="删除选中游戏", command=self.delete_game)
-        delete_button.pack(fill="x", pady=(0, 5))
+        self.delete_button = ttk.Button(buttons_frame, text="删除选中游戏", command=self.delete_game)
+        self.delete_button.pack(fill="x", pady=(0, 5))
         
         copy_link_button = ttk.Button(buttons_frame, text="复制选中游戏链接", command=self.copy_game_link)
         copy_link_button.pack(fill="x")
@@ -237,6 +395,17 @@ class GameCDNUI:
         log_frame = ttk.LabelFrame(self.log_tab, text="日志文件查看", padding="10")
         log_frame.pack(fill="both", expand=True, padx=10, pady=10)
         
+        # 当前打开的日志文件及后台任务状态
+        self.log_view = None
+        self.log_top_line = 0
+        self.log_cancel_event = None
+        self.log_index_thread = None
+        self.log_search_thread = None
+        self.log_search_result = None
+        self.log_search_pattern = None
+        self.log_jump_to_end = False
+        self.log_poll_job = None
+        
         # 日期选择区域
         date_frame = ttk.Frame(log_frame)
         date_frame.pack(fill="x", pady=(0, 10))
@@ -246,13 +415,10 @@ class GameCDNUI:
         # 获取可用的日志文件日期
         log_dates = self.get_available_log_dates()
         self.log_date_var = tk.StringVar()
-        
         if log_dates:
             self.log_date_var.set(log_dates[0])  # 默认选择最新日期
-            date_combo = ttk.Combobox(date_frame, textvariable=self.log_date_var, values=log_dates, state="readonly", width=15)
-            date_combo.pack(side="left", padx=(10, 10))
-        else:
-            ttk.Label(date_frame, text="暂无日志文件").pack(side="left", padx=(10, 0))
+        self.log_date_combo = ttk.Combobox(date_frame, textvariable=self.log_date_var, values=log_dates, state="readonly", width=15)
+        self.log_date_combo.pack(side="left", padx=(10, 10))
         
         # 刷新按钮
         refresh_button = ttk.Button(date_frame, text="刷新", command=self.refresh_log_dates)
@@ -262,95 +428,282 @@ class GameCDNUI:
         load_button = ttk.Button(date_frame, text="加载日志", command=self.load_selected_log)
         load_button.pack(side="left", padx=(10, 0))
         
-        # 日志显示区域
+        # 搜索区域
+        search_frame = ttk.Frame(log_frame)
+        search_frame.pack(fill="x")
+        
+        ttk.Label(search_frame, text="查找:").pack(side="left")
+        self.log_search_entry = ttk.Entry(search_frame, width=30)
+        self.log_search_entry.pack(side="left", padx=(10, 10), fill="x", expand=True)
+        self.log_search_entry.bind("<Return>", lambda event: self.search_log())
+        self.log_regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="正则", variable=self.log_regex_var).pack(side="left")
+        ttk.Button(search_frame, text="上一个", command=lambda: self.search_log(backwards=True)).pack(side="left", padx=(10, 0))
+        ttk.Button(search_frame, text="下一个", command=self.search_log).pack(side="left", padx=(5, 0))
+        
+        # 日志显示区域：只渲染当前可见的一页
         log_text_frame = ttk.Frame(log_frame)
         log_text_frame.pack(fill="both", expand=True, pady=(10, 0))
         
-        self.file_log_text = tk.Text(log_text_frame, state="disabled")
-        log_scrollbar = ttk.Scrollbar(log_text_frame, orient="vertical", command=self.file_log_text.yview)
-        self.file_log_text.configure(yscrollcommand=log_scrollbar.set)
+        self.file_log_text = tk.Text(log_text_frame, state="disabled", wrap="none")
+        self.file_log_text.tag_configure("match", background="yellow")
+        self.file_log_scrollbar = ttk.Scrollbar(log_text_frame, orient="vertical", command=self.scroll_log)
         
         self.file_log_text.pack(side="left", fill="both", expand=True)
-        log_scrollbar.pack(side="right", fill="y")
+        self.file_log_scrollbar.pack(side="right", fill="y")
+        
+        # 滚轮和窗口大小变化时重新渲染当前页
+        self.file_log_text.bind("<MouseWheel>", lambda event: self.scroll_log("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.file_log_text.bind("<Button-4>", lambda event: self.scroll_log("scroll", -1, "units"))
+        self.file_log_text.bind("<Button-5>", lambda event: self.scroll_log("scroll", 1, "units"))
+        self.file_log_text.bind("<Configure>", lambda event: self.render_log_page())
         
         # 操作按钮
         button_frame = ttk.Frame(log_frame)
         button_frame.pack(fill="x", pady=(10, 0))
         
+        self.log_status_label = ttk.Label(button_frame, text="")
+        self.log_status_label.pack(side="left")
+        
         clear_button = ttk.Button(button_frame, text="清空显示", command=self.clear_file_logs)
         clear_button.pack(side="right")
         
+        end_button = ttk.Button(button_frame, text="跳到末尾", command=self.jump_log_end)
+        end_button.pack(side="right", padx=(0, 10))
+        
+        top_button = ttk.Button(button_frame, text="跳到开头", command=lambda: self.show_log_line(0))
+        top_button.pack(side="right", padx=(0, 10))
+        
+        self.log_follow_var = tk.BooleanVar(value=False)
+        follow_check = ttk.Checkbutton(button_frame, text="实时跟踪", variable=self.log_follow_var)
+        follow_check.pack(side="right", padx=(0, 10))
+        
         # 如果有日志文件，自动加载最新日志
         if log_dates:
             self.load_selected_log()
     
     def get_available_log_dates(self):
-        """获取可用的日志文件日期"""
-        log_dates = []
-        logs_dir = "logs"
-        
-        if os.path.exists(logs_dir) and os.path.isdir(logs_dir):
-            for filename in os.listdir(logs_dir):
-                if filename.startswith("server_") and filename.endswith(".log"):
-                    # 提取日期部分
-                    date_part = filename[7:-4]  # 去掉 "server_" 前缀和 ".log" 后缀
-                    log_dates.append(date_part)
-            
-            # 按日期倒序排列（最新的在前）
-            log_dates.sort(reverse=True)
-        
-        return log_dates
+        """获取可用的日志段，如 "2024-01-01"、"2024-01-01.1"（当天切分出的第1段）"""
+        # 按时间倒序排列（最新的在前），已压缩的日志段同样可以查看
+        self.log_files = {}
+        for path in reversed(list_log_files(LOGS_DIR)):
+            filename = os.path.basename(path)
+            label = filename[len("server_"):].split(".log")[0]
+            self.log_files[label] = path
+        return list(self.log_files)
     
     def refresh_log_dates(self):
         """刷新日志日期列表"""
         log_dates = self.get_available_log_dates()
-        
-        # 更新下拉框
-        date_combo = None
-        for widget in self.log_tab.winfo_children():
-            if isinstance(widget, ttk.LabelFrame):
-                for child in widget.winfo_children():
-                    if isinstance(child, ttk.Frame):
-                        for subchild in child.winfo_children():
-                            if isinstance(subchild, ttk.Combobox):
-                                date_combo = subchild
-                                break
-        
-        if date_combo:
-            date_combo['values'] = log_dates
-            if log_dates:
-                self.log_date_var.set(log_dates[0])
+        self.log_date_combo['values'] = log_dates
+        if log_dates:
+            self.log_date_var.set(log_dates[0])
     
     def load_selected_log(self):
-        """加载选中的日志文件"""
+        """打开选中的日志文件，在后台建立行索引，只显示可见的一页"""
         selected_date = self.log_date_var.get()
         if not selected_date:
             messagebox.showwarning("警告", "请先选择一个日期")
             return
         
-        log_filename = f"logs/server_{selected_date}.log"
+        log_filename = self.log_files.get(selected_date, "")
+        if not os.path.exists(log_filename) and os.path.exists(log_filename + ".gz"):
+            # 列出之后该日志段已在后台压缩
+            log_filename += ".gz"
         
         if not os.path.exists(log_filename):
             messagebox.showerror("错误", f"日志文件不存在: {log_filename}")
             return
         
+        self.close_log_view()
         try:
-            with open(log_filename, "r", encoding="utf-8") as f:
-                content = f.read()
-            
-            self.file_log_text.config(state="normal")
-            self.file_log_text.delete(1.0, tk.END)
-            self.file_log_text.insert(tk.END, content)
-            self.file_log_text.config(state="disabled")
-            self.file_log_text.see(tk.END)
+            self.log_view = LogFile(log_filename)
         except Exception as e:
             messagebox.showerror("错误", f"读取日志文件时出错: {str(e)}")
+            return
+        
+        # 索引完成后跳到末尾，与之前加载完整文件后的显示位置一致
+        self.log_cancel_event = threading.Event()
+        self.log_top_line = 0
+        self.log_jump_to_end = True
+        self.start_log_indexing()
+        self.render_log_page()
+        self.poll_log_view()
+    
+    def start_log_indexing(self):
+        """在后台线程中建立或延伸行索引"""
+        if self.log_index_thread and self.log_index_thread.is_alive():
+            return
+        view = self.log_view
+        cancel_event = self.log_cancel_event
+        
+        def build():
+            view.remap()
+            view.build_index(cancel_event)
+        
+        self.log_index_thread = threading.Thread(target=build, daemon=True)
+        self.log_index_thread.start()
+    
+    def poll_log_view(self):
+        """定时检查后台索引和搜索的进度，实时跟踪时读取新追加的内容"""
+        self.log_poll_job = None
+        if self.log_view is None:
+            return
+        
+        indexing = self.log_index_thread is not None and self.log_index_thread.is_alive()
+        if not indexing and self.log_jump_to_end:
+            self.log_jump_to_end = False
+            self.jump_log_end()
+        
+        # 后台搜索完成
+        if self.log_search_result is not None:
+            result, self.log_search_result = self.log_search_result, None
+            if isinstance(result, Exception):
+                messagebox.showerror("错误", f"查找失败: {str(result)}")
+            elif result < 0:
+                messagebox.showinfo("查找", "未找到匹配内容")
+            else:
+                self.show_log_line(result)
+        
+        if self.log_follow_var.get() and not indexing:
+            self.start_log_indexing()
+            if not self.log_jump_to_end:
+                self.jump_log_end()
+        else:
+            self.render_log_page()
+        
+        self.log_poll_job = self.root.after(500, self.poll_log_view)
+    
+    def get_log_page_size(self):
+        """当前窗口能显示的行数"""
+        height = self.file_log_text.winfo_height()
+        line_height = max(1, self.file_log_text.tk.call("font", "metrics", self.file_log_text.cget("font"), "-linespace"))
+        return max(1, height // line_height if height > 1 else 30)
+    
+    def render_log_page(self):
+        """只把当前页的行写入文本框"""
+        view = self.log_view
+        if view is None:
+            return
+        page_size = self.get_log_page_size()
+        total = view.total_lines()
+        self.log_top_line = max(0, min(self.log_top_line, total - page_size))
+        lines = view.get_lines(self.log_top_line, page_size)
+        
+        self.file_log_text.config(state="normal")
+        self.file_log_text.delete(1.0, tk.END)
+        self.file_log_text.insert(tk.END, "\n".join(lines))
+        if self.log_search_pattern:
+            self.highlight_log_matches(lines)
+        self.file_log_text.config(state="disabled")
+        
+        if total:
+            self.file_log_scrollbar.set(self.log_top_line / total, min(1.0, (self.log_top_line + page_size) / total))
+        else:
+            self.file_log_scrollbar.set(0, 1)
+        
+        status = f"第 {self.log_top_line + 1 if lines else 0}-{self.log_top_line + len(lines)} 行 / 共 {total} 行"
+        if self.log_index_thread is not None and self.log_index_thread.is_alive():
+            status += "（正在建立索引…）"
+        if self.log_search_thread is not None and self.log_search_thread.is_alive():
+            status += "（正在查找…）"
+        self.log_status_label.config(text=status)
+    
+    def highlight_log_matches(self, lines):
+        """高亮当前页中的搜索匹配"""
+        pattern, regex = self.log_search_pattern
+        try:
+            compiled = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+        except re.error:
+            return
+        for number, line in enumerate(lines, start=1):
+            for match in compiled.finditer(line):
+                if match.end() > match.start():
+                    self.file_log_text.tag_add("match", f"{number}.{match.start()}", f"{number}.{match.end()}")
+    
+    def scroll_log(self, action, amount=None, unit=None):
+        """处理滚动条和滚轮事件"""
+        if self.log_view is None:
+            return
+        page_size = self.get_log_page_size()
+        if action == "moveto":
+            self.log_top_line = int(float(amount) * self.log_view.total_lines())
+        elif action == "scroll":
+            step = page_size if unit == "pages" else 3
+            self.log_top_line += int(amount) * step
+        self.log_top_line = max(0, self.log_top_line)
+        # 用户手动滚动后停止实时跟踪
+        if self.log_follow_var.get() and action != "moveto" and int(amount or 0) < 0:
+            self.log_follow_var.set(False)
+        self.render_log_page()
+    
+    def show_log_line(self, line):
+        """滚动到指定行"""
+        self.log_top_line = max(0, line - 2)
+        self.render_log_page()
+    
+    def jump_log_end(self):
+        """跳到日志末尾"""
+        if self.log_view is None:
+            return
+        self.log_top_line = self.log_view.total_lines()
+        self.render_log_page()
+    
+    def search_log(self, backwards=False):
+        """在后台线程中查找下一个或上一个匹配"""
+        pattern = self.log_search_entry.get()
+        if self.log_view is None or not pattern:
+            return
+        if self.log_search_thread is not None and self.log_search_thread.is_alive():
+            return
+        regex = self.log_regex_var.get()
+        self.log_search_pattern = (pattern, regex)
+        view = self.log_view
+        cancel_event = self.log_cancel_event
+        # 从当前页第一行之后（向后）或之前（向前）开始查找
+        start_line = self.log_top_line + 2 if backwards else self.log_top_line + 3
+        
+        def search():
+            try:
+                result = view.search(pattern, regex, True, start_line, backwards, cancel_event)
+            except Exception as e:
+                result = e
+            # 查找期间已切换到其他日志文件时丢弃结果
+            if self.log_view is view and not cancel_event.is_set():
+                self.log_search_result = result
+        
+        self.log_follow_var.set(False)
+        self.log_search_thread = threading.Thread(target=search, daemon=True)
+        self.log_search_thread.start()
+        self.render_log_page()
+    
+    def close_log_view(self):
+        """关闭当前日志文件并停止后台任务"""
+        if self.log_cancel_event is not None:
+            self.log_cancel_event.set()
+        if self.log_poll_job:
+            self.root.after_cancel(self.log_poll_job)
+            self.log_poll_job = None
+        if self.log_view is not None:
+            view = self.log_view
+            self.log_view = None
+            # 等后台线程退出后再关闭映射
+            threads = [t for t in (self.log_index_thread, self.log_search_thread) if t is not None]
+            for thread in threads:
+                thread.join(timeout=1)
+            view.close()
+        self.log_index_thread = None
+        self.log_search_thread = None
+        self.log_search_result = None
+        self.log_search_pattern = None
     
     def clear_file_logs(self):
         """清空文件日志显示"""
+        self.close_log_view()
         self.file_log_text.config(state="normal")
         self.file_log_text.delete(1.0, tk.END)
         self.file_log_text.config(state="disabled")
+        self.log_status_label.config(text="")
     
     def create_settings_tab(self):
         # 设置区域
@@ -447,29 +800,174 @@ class GameCDNUI:
             messagebox.showerror("错误", "指定的路径不存在")
             return
         
-        # 上传游戏
-        success = upload_game(name, alias, path)
-        
+        webp = self.webp_var.get()
+        optimize = self.optimize_var.get() or webp
+        offline = self.offline_var.get()
+        
+        # 在后台上传游戏，复制文件期间界面保持响应
+        def run(job):
+            return upload_game(name, alias, path, progress=job.report, cancel_event=job.cancel_event,
+                               optimize=optimize, webp=webp, offline=offline)
+        
+        self.upload_button.config(state="disabled")
+        self.job_cancel_button.config(state="normal")
+        self.job_progress.config(mode="determinate", value=0)
+        self.job_status_label.config(text=f"正在上传 '{name}'...")
+        self.upload_job = self.jobs.submit(run, on_done=self.on_upload_done,
+                                           on_progress=self.on_upload_progress, description=name)
+    
+    def on_upload_progress(self, job, copied_files, total_files, copied_bytes, total_bytes):
+        """显示上传进度：文件数、字节数和预计剩余时间"""
+        if job.cancelled():
+            return
+        percent = copied_bytes * 100 / total_bytes if total_bytes else 100
+        self.job_progress.config(value=percent)
+        text = (f"正在上传 '{job.description}': {copied_files}/{total_files} 个文件，"
+                f"{format_bytes(copied_bytes)}/{format_bytes(total_bytes)}")
+        elapsed = time.monotonic() - job.started_at
+        if copied_bytes and elapsed > 0 and copied_bytes < total_bytes:
+            remaining = (total_bytes - copied_bytes) / (copied_bytes / elapsed)
+            text += f"，剩余约 {int(remaining) + 1} 秒"
+        self.job_status_label.config(text=text)
+    
+    def on_upload_done(self, job, success, error):
+        self.upload_job = None
+        self.upload_button.config(state="normal")
+        self.job_cancel_button.config(state="disabled")
+        self.job_progress.config(value=0)
+        self.job_status_label.config(text="")
+        
+        # 取消请求可能晚于复制完成，以实际结果为准
         if success:
-            messagebox.showinfo("成功", f"游戏 '{name}' 上传成功")
+            messagebox.showinfo("成功", f"游戏 '{job.description}' 上传成功")
             # 清空输入框
             self.name_entry.delete(0, tk.END)
             self.alias_entry.delete(0, tk.END)
             self.path_entry.delete(0, tk.END)
             # 刷新游戏列表
             self.refresh_game_list()
+        elif job.cancelled():
+            messagebox.showinfo("已取消", f"游戏 '{job.description}' 的上传已取消")
         else:
             messagebox.showerror("错误", "游戏上传失败，请检查是否已存在同名别名的游戏")
     
+    def cancel_upload(self):
+        """取消正在进行的上传，已复制的文件由上传函数清理"""
+        if self.upload_job:
+            self.upload_job.cancel()
+            self.job_cancel_button.config(state="disabled")
+            self.job_status_label.config(text=f"正在取消 '{self.upload_job.description}' 的上传...")
+    
     def refresh_game_list(self):
-        # 清空现有列表
-        for item in self.game_tree.get_children():
-            self.game_tree.delete(item)
+        """在后台重新读取已加载范围内的游戏，只更新变化的行，保留选中项和滚动位置"""
+        self.refresh_generation += 1
+        generation = self.refresh_generation
+        query = self.game_query
+        order = self.game_order
+        limit = max(self.games_loaded, GAME_PAGE_SIZE)
+        self.games_loading = True
+        
+        def on_done(job, games, error):
+            # 只使用最后一次刷新的结果
+            if generation != self.refresh_generation:
+                return
+            self.games_loading = False
+            if error:
+                messagebox.showerror("错误", f"读取游戏列表失败: {error}")
+                return
+            self.apply_game_rows(games)
+            self.games_loaded = len(games)
+            self.games_exhausted = len(games) < limit
+            self.update_game_count()
         
-        # 获取游戏列表并添加到Treeview
-        games = get_all_games()
-        for game in games:
-            self.game_tree.insert("", "end", values=game)
+        self.jobs.submit(lambda job: load_game_rows(query, limit, 0, order), on_done=on_done, description="刷新列表")
+    
+    def apply_game_rows(self, games):
+        """按别名比较新旧列表，只插入、更新、移动或删除变化的行"""
+        wanted = {game[0] for game in games}
+        removed = [alias for alias in self.game_rows if alias not in wanted]
+        if removed:
+            self.game_tree.delete(*removed)
+            for alias in removed:
+                del self.game_rows[alias]
+        
+        # 已有的行顺序变化时才移动
+        existing = [game[0] for game in games if game[0] in self.game_rows]
+        if list(self.game_tree.get_children()) != existing:
+            for index, alias in enumerate(existing):
+                self.game_tree.move(alias, "", index)
+        
+        for index, game in enumerate(games):
+            alias = game[0]
+            old = self.game_rows.get(alias)
+            if old is None:
+                self.game_tree.insert("", index, iid=alias, values=game)
+            elif old != game:
+                self.game_tree.item(alias, values=game)
+            self.game_rows[alias] = game
+    
+    def load_more_games(self):
+        """加载下一页游戏"""
+        if self.games_loading or self.games_exhausted:
+            return
+        self.games_loading = True
+        generation = self.refresh_generation
+        query = self.game_query
+        order = self.game_order
+        offset = self.games_loaded
+        
+        def on_done(job, games, error):
+            if generation != self.refresh_generation:
+                return
+            self.games_loading = False
+            if error:
+                return
+            for game in games:
+                # 加载期间有新游戏上传时，分页结果可能与已显示的行重复
+                if game[0] not in self.game_rows:
+                    self.game_rows[game[0]] = game
+                    self.game_tree.insert("", "end", iid=game[0], values=game)
+            self.games_loaded += len(games)
+            self.games_exhausted = len(games) < GAME_PAGE_SIZE
+            self.update_game_count()
+        
+        self.jobs.submit(lambda job: load_game_rows(query, GAME_PAGE_SIZE, offset, order),
+                         on_done=on_done, description="加载游戏列表")
+    
+    def on_game_list_scroll(self, first, last):
+        """列表滚动时更新滚动条，接近底部时加载下一页"""
+        self.game_scrollbar.set(first, last)
+        if float(last) > 0.9:
+            self.load_more_games()
+    
+    def update_game_count(self):
+        more = "" if self.games_exhausted else "+"
+        self.game_count_label.config(text=f"已加载 {len(self.game_rows)}{more} 个游戏")
+    
+    def on_game_search_changed(self, *args):
+        """输入停顿后再搜索，避免每次按键都查询数据库"""
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(300, self.apply_game_search)
+    
+    def apply_game_search(self):
+        self.search_job = None
+        query = self.game_search_var.get().strip()
+        if query == self.game_query:
+            return
+        self.game_query = query
+        self.games_loaded = 0
+        self.games_exhausted = False
+        self.game_tree.yview_moveto(0)
+        self.refresh_game_list()
+    
+    def on_game_order_changed(self):
+        """切换按上传时间或按游玩次数排序"""
+        self.game_order = "popular" if self.game_popular_var.get() else "recent"
+        self.games_loaded = 0
+        self.games_exhausted = False
+        self.game_tree.yview_moveto(0)
+        self.refresh_game_list()
     
     def delete_game(self):
         # 获取选中的游戏
@@ -478,20 +976,32 @@ class GameCDNUI:
             messagebox.showwarning("警告", "请先选择要删除的游戏")
             return
         
-        # 获取选中游戏的别名
-        item = self.game_tree.item(selected[0])
-        alias = item["values"][0]  # 游戏别名在第一列
-        name = item["values"][1]   # 游戏名称在第二列
+        # 行的ID即游戏别名
+        alias = selected[0]
+        name = self.game_rows[alias][1]
         
         # 确认删除
         result = messagebox.askyesno("确认删除", f"确定要删除游戏 '{name}' 吗？此操作不可撤销。")
         if result:
-            success = remove_game(alias)
-            if success:
-                messagebox.showinfo("成功", f"游戏 '{name}' 已删除")
-                self.refresh_game_list()
-            else:
-                messagebox.showerror("错误", "删除游戏失败")
+            # 删除大量文件可能较慢，在后台执行
+            def on_done(job, success, error):
+                self.delete_button.config(state="normal")
+                if not self.upload_job:
+                    self.job_progress.stop()
+                    self.job_progress.config(mode="determinate", value=0)
+                    self.job_status_label.config(text="")
+                if success:
+                    messagebox.showinfo("成功", f"游戏 '{name}' 已删除")
+                    self.refresh_game_list()
+                else:
+                    messagebox.showerror("错误", "删除游戏失败")
+            
+            self.delete_button.config(state="disabled")
+            if not self.upload_job:
+                self.job_progress.config(mode="indeterminate")
+                self.job_progress.start()
+                self.job_status_label.config(text=f"正在删除 '{name}'...")
+            self.jobs.submit(lambda job: remove_game(alias), on_done=on_done, description=name)
     
     def copy_game_link(self):
         # 获取选中的游戏
@@ -500,9 +1010,8 @@ class GameCDNUI:
             messagebox.showwarning("警告", "请先选择游戏")
             return
         
-        # 获取选中游戏的别名
-        item = self.game_tree.item(selected[0])
-        alias = item["values"][0]  # 游戏别名在第一列
+        # 行的ID即游戏别名
+        alias = selected[0]
         
         # 获取协议和端口设置
         protocol = self.protocol_var.get()
@@ -556,10 +1065,27 @@ class GameCDNUI:
         messagebox.showinfo("服务器启动", f"服务器已在端口 {port} 上启动")
     
     def stop_server(self):
-        # 停止服务器
-        success = stop_server()
+        # 请求停止服务器：不再接受新连接，进行中的请求在后台发送完毕
+        if not stop_server():
+            messagebox.showinfo("服务器停止", "服务器未在运行")
+            self.on_server_stopped()
+            return
         
         # 更新UI
+        self.server_status.config(text="服务器状态: 正在停止（等待进行中的请求完成）", foreground="orange")
+        self.stop_button.config(state="disabled")
+        self.wait_server_stopped()
+    
+    def wait_server_stopped(self):
+        """等待服务器线程结束后更新界面"""
+        if self.server_thread and self.server_thread.is_alive():
+            self.root.after(200, self.wait_server_stopped)
+            return
+        self.on_server_stopped()
+        messagebox.showinfo("服务器停止", "服务器已停止")
+    
+    def on_server_stopped(self):
+        """服务器停止后更新界面"""
         self.server_status.config(text="服务器状态: 已停止", foreground="red")
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
@@ -568,11 +1094,6 @@ class GameCDNUI:
         if self.log_update_job:
             self.root.after_cancel(self.log_update_job)
             self.log_update_job = None
-        
-        if success:
-            messagebox.showinfo("服务器停止", "服务器已停止")
-        else:
-            messagebox.showinfo("服务器停止", "已请求停止服务器。注意：程序仍在后台运行，需要完全停止请关闭整个应用程序。")
     
     def update_logs(self):
         """更新日志显示"""
@@ -0,0 +1,324 @@
+"""
+GalHub - HTTP上传模块
+接收 PUT/POST /api/games/<alias> 上传的ZIP或tar包：请求体分块写入暂存目录，边写边计算哈希，
+解包时同时生成文件清单，然后移入游戏目录并与命令行上传使用同一个发布流程
+"""
+
+import hashlib
+import hmac
+import os
+import shutil
+import stat
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from database import get_game_by_alias, load_typed_settings
+from manager import GAMES_ROOT, is_valid_alias, publish_game
+
+# 设置表中的上传API配置项
+UPLOAD_SETTINGS = {
+    'admin_token': '',                               # 上传令牌，为空表示不开放上传API
+    'upload_max_bytes': 4 * 1024 * 1024 * 1024,      # 请求体（压缩包）最大字节数
+    'upload_max_extract_bytes': 16 * 1024 * 1024 * 1024,  # 解包后文件的最大总字节数
+    'upload_max_files': 100000,                      # 压缩包中的最大文件数
+    'upload_max_concurrent': 2,                      # 同时进行的上传数
+}
+# 上传的暂存目录，与游戏目录在同一文件系统中，解包完成后直接改名发布
+STAGING_DIR = os.path.join(GAMES_ROOT, ".upload")
+# 暂存文件超过该时间（秒）未修改视为中断的上传
+STALE_STAGING_AGE = 24 * 3600
+# 读取请求体和解包时每次处理的块大小
+CHUNK_SIZE = 1024 * 1024
+# 解包时忽略的目录（macOS压缩工具生成的元数据）
+IGNORED_DIRS = {"__MACOSX"}
+
+class UploadError(Exception):
+    """上传失败，status 为返回给客户端的HTTP状态码"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def load_upload_settings():
+    """
+    从设置表读取上传API配置
+
+    Returns:
+        dict: 配置项名称到值的映射
+    """
+    return load_typed_settings(UPLOAD_SETTINGS)
+
+def check_token(authorization, token):
+    """
+    检查 Authorization: Bearer <令牌> 请求头
+
+    Args:
+        authorization (str): Authorization请求头，可以为None
+        token (str): 设置的上传令牌
+
+    Returns:
+        bool: 令牌正确返回True
+    """
+    if not token or not authorization:
+        return False
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    return hmac.compare_digest(value.strip().encode("utf-8"), token.encode("utf-8"))
+
+def check_alias(alias):
+    """检查别名能否作为游戏目录名"""
+    if not is_valid_alias(alias) or alias == "api":
+        raise UploadError(400, "Invalid alias")
+    if get_game_by_alias(alias) or os.path.exists(os.path.join(GAMES_ROOT, alias)):
+        raise UploadError(409, f"Game with alias '{alias}' already exists")
+
+def receive_body(rfile, length, path):
+    """
+    把请求体分块写入文件，同时计算哈希，不在内存中保留整个请求体
+
+    Args:
+        rfile: 请求的输入流
+        length (int): Content-Length
+        path (str): 写入的文件路径
+
+    Returns:
+        str: 请求体的SHA-256
+    """
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, "wb") as f:
+        while remaining > 0:
+            chunk = rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise UploadError(400, f"Request body ended after {length - remaining} of {length} bytes")
+            f.write(chunk)
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def split_member_path(name):
+    """
+    把压缩包中的成员名拆分为路径各部分，拒绝绝对路径和 .. 等跳出目录的路径
+
+    Returns:
+        list: 路径各部分，应忽略的成员返回空列表
+    """
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if name.startswith(("/", "\\")) or any(part == ".." or ":" in part for part in parts):
+        raise UploadError(400, f"Unsafe path in archive: {name}")
+    if parts and parts[0] in IGNORED_DIRS:
+        return []
+    return parts
+
+def list_members(archive):
+    """
+    列出压缩包中的目录和普通文件，符号链接、设备文件等被忽略
+
+    Returns:
+        list: (路径各部分, 是否为目录, 修改时间, 打开文件内容的函数) 列表
+    """
+    members = []
+    if isinstance(archive, zipfile.ZipFile):
+        for info in archive.infolist():
+            if stat.S_ISLNK(info.external_attr >> 16):
+                continue
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            opener = (lambda info=info: archive.open(info))
+            members.append((split_member_path(info.filename), info.is_dir(), mtime, opener))
+    else:
+        for info in archive:
+            if not (info.isdir() or info.isfile()):
+                continue
+            opener = (lambda info=info: archive.extractfile(info))
+            members.append((split_member_path(info.name), info.isdir(), info.mtime, opener))
+    return [member for member in members if member[0]]
+
+def strip_common_root(members):
+    """压缩包中所有内容都在同一个顶层目录中时（常见于直接压缩游戏文件夹），去掉这一层"""
+    files = [parts for parts, is_dir, _, _ in members if not is_dir]
+    if not files or any(len(parts) < 2 for parts in files) or len({parts[0] for parts in files}) != 1:
+        return members
+    root = files[0][0]
+    return [(parts[1:], is_dir, mtime, opener) for parts, is_dir, mtime, opener in members
+            if parts[0] == root and len(parts) > 1]
+
+def extract_archive(archive_path, target_path, max_bytes, max_files):
+    """
+    解包到目标目录，写入的同时计算每个文件的哈希；按实际写入的字节数检查大小限制
+
+    Args:
+        archive_path (str): ZIP或tar（可压缩）文件
+        target_path (str): 目标目录
+        max_bytes (int): 解包后文件的最大总字节数
+        max_files (int): 最大文件数
+
+    Returns:
+        list: 文件清单（path, size, mtime, sha256）
+    """
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+    elif tarfile.is_tarfile(archive_path):
+        archive = tarfile.open(archive_path, "r:*")
+    else:
+        raise UploadError(415, "Request body is not a ZIP or tar archive")
+
+    manifest = {}
+    total_bytes = 0
+    try:
+        with archive:
+            members = strip_common_root(list_members(archive))
+            if sum(1 for member in members if not member[1]) > max_files:
+                raise UploadError(413, f"Archive contains more than {max_files} files")
+            for parts, is_dir, mtime, opener in members:
+                path = os.path.join(target_path, *parts)
+                if is_dir:
+                    os.makedirs(path, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                digest = hashlib.sha256()
+                with opener() as fsrc, open(path, "wb") as fdst:
+                    while True:
+                        chunk = fsrc.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        total_bytes += len(chunk)
+                        if total_bytes > max_bytes:
+                            raise UploadError(413, f"Extracted files exceed {max_bytes} bytes")
+                        fdst.write(chunk)
+                        digest.update(chunk)
+                os.utime(path, (mtime, mtime))
+                file_stat = os.stat(path)
+                manifest["/".join(parts)] = {
+                    'path': "/".join(parts),
+                    'size': file_stat.st_size,
+                    'mtime': file_stat.st_mtime,
+                    'sha256': digest.hexdigest(),
+                }
+    except (zipfile.BadZipFile, tarfile.TarError, RuntimeError, EOFError, zlib.error) as e:
+        # 损坏、加密或截断的压缩包
+        raise UploadError(400, f"Invalid archive: {e}")
+    if not manifest:
+        raise UploadError(400, "Archive contains no files")
+    return [manifest[path] for path in sorted(manifest)]
+
+class UploadReceiver:
+    """
+    处理上传请求，限制同时进行的上传数
+
+    每个连接由独立线程处理，上传只占用自己的线程；请求体直接写入磁盘，内存占用与压缩包大小无关。
+    """
+    def __init__(self, settings=None):
+        self.settings = dict(UPLOAD_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+        self.slots = threading.BoundedSemaphore(max(1, self.settings['upload_max_concurrent']))
+        self.lock = threading.Lock()
+        self.active = 0
+        self.stats = {
+            'uploads': 0,
+            'failed': 0,
+            'bytes_received': 0,
+        }
+
+    @property
+    def enabled(self):
+        return bool(self.settings['admin_token'])
+
+    def authorize(self, authorization):
+        return check_token(authorization, self.settings['admin_token'])
+
+    def receive(self, alias, name, rfile, length, optimize=False, webp=False, offline=False):
+        """
+        接收压缩包并发布游戏
+
+        Args:
+            alias (str): 游戏别名
+            name (str): 游戏名
+            rfile: 请求的输入流，读取位置在请求体开头
+            length (int): Content-Length
+            optimize (bool): 是否压缩JS、CSS、JSON和图片
+            webp (bool): 优化时是否为PNG/JPEG生成WebP版本
+            offline (bool): 是否生成离线缓存用的 Service Worker 和预缓存清单
+
+        Returns:
+            dict: 上传结果（alias, name, files, bytes, sha256）
+        """
+        # 先检查不需要读取请求体的条件，出错时客户端不必发送整个压缩包
+        check_alias(alias)
+        if length > self.settings['upload_max_bytes']:
+            raise UploadError(413, f"Request body exceeds {self.settings['upload_max_bytes']} bytes")
+        if not self.slots.acquire(blocking=False):
+            raise UploadError(503, "Too many uploads in progress")
+        with self.lock:
+            self.active += 1
+        staging_path = os.path.join(STAGING_DIR, f"{alias}-{uuid.uuid4().hex}")
+        archive_path = staging_path + ".part"
+        try:
+            os.makedirs(STAGING_DIR, exist_ok=True)
+            body_sha256 = receive_body(rfile, length, archive_path)
+            with self.lock:
+                self.stats['bytes_received'] += length
+            manifest = extract_archive(archive_path, staging_path,
+                                       self.settings['upload_max_extract_bytes'], self.settings['upload_max_files'])
+            os.remove(archive_path)
+
+            # 暂存目录与游戏目录在同一文件系统中，改名即可发布
+            target_path = os.path.join(GAMES_ROOT, alias)
+            try:
+                os.rename(staging_path, target_path)
+            except OSError:
+                raise UploadError(409, f"Game with alias '{alias}' already exists")
+            if not publish_game(name, alias, target_path, manifest, optimize, webp, offline):
+                raise UploadError(500, "Failed to publish game")
+            with self.lock:
+                self.stats['uploads'] += 1
+            return {
+                'alias': alias,
+                'name': name,
+                'files': len(manifest),
+                'bytes': sum(entry['size'] for entry in manifest),
+                'sha256': body_sha256,
+            }
+        except Exception:
+            with self.lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            for path in (archive_path, staging_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+                elif os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, enabled=self.enabled, active=self.active,
+                        max_concurrent=self.settings['upload_max_concurrent'])
+
+def clean_staging(max_age=STALE_STAGING_AGE):
+    """
+    删除中断的上传遗留的暂存文件
+
+    Args:
+        max_age (float): 只删除超过该时间（秒）未修改的条目，热重启时旧进程可能仍在接收上传
+    """
+    if not os.path.isdir(STAGING_DIR):
+        return
+    now = time.time()
+    for entry in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, entry)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
\ No newline at end of file
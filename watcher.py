@@ -0,0 +1,354 @@
+"""
+GalHub - 文件变化监视模块
+监视游戏目录和主页文件，把一段时间内的变化合并为一批通知服务器更新缓存和文件清单；
+Linux上使用inotify，其他平台定期比较文件的修改时间和大小
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from database import load_typed_settings
+
+# 设置表中的文件监视配置项
+WATCH_SETTINGS = {
+    'watch_games': 1,              # 是否监视游戏目录，0表示不监视
+    'watch_poll_interval': 10.0,   # 无法使用inotify时扫描文件的间隔（秒）
+    'watch_debounce': 1.0,         # 最后一次变化之后等待的时间（秒），期间的变化合并为一批
+}
+# 持续有变化时，最长等待多久也要处理一批（秒）
+MAX_BATCH_DELAY = 10.0
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# 不监视 IN_MODIFY：写入大文件时每次 write() 都会产生一个事件，写完关闭时的 IN_CLOSE_WRITE 已经足够
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+def load_inotify():
+    """
+    加载libc中的inotify函数
+
+    Returns:
+        ctypes.CDLL: libc，不是Linux或缺少inotify时返回None
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class GamesWatcher:
+    """
+    监视游戏目录和主页文件的变化
+
+    变化以 {别名: 相对路径集合} 的形式交给回调函数，路径集合为None表示整个游戏目录都需要检查，
+    别名为None表示主页文件变化。回调函数在监视线程中执行。
+    """
+    def __init__(self, games_root, homepage, on_change, debounce=WATCH_SETTINGS['watch_debounce'],
+                 poll_interval=WATCH_SETTINGS['watch_poll_interval'], log=print):
+        self.games_root = os.path.abspath(games_root)
+        self.homepage = os.path.abspath(homepage)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.log = log
+        self.backend = None
+        self.pending = {}
+        self.first_change = None
+        self.last_change = None
+        self.lock = threading.Lock()
+        self.watches = {}
+        self.stats = {
+            'events': 0,
+            'batches': 0,
+            'scans': 0,
+            'scan_seconds': 0.0,
+            'handler_seconds': 0.0,
+            'cpu_seconds': 0.0,
+            'overflows': 0,
+        }
+
+    def add_change(self, alias, path):
+        """
+        记录一项变化
+
+        Args:
+            alias (str): 游戏别名，None表示主页文件
+            path (str): 游戏中以/分隔的相对路径，None表示整个游戏目录
+        """
+        if alias is not None and alias.startswith("."):
+            # 批量导入的暂存目录等
+            return
+        now = time.monotonic()
+        if self.first_change is None:
+            self.first_change = now
+        self.last_change = now
+        paths = self.pending.setdefault(alias, set())
+        if paths is None:
+            return
+        if path is None:
+            self.pending[alias] = None
+        else:
+            paths.add(path)
+
+    def split_path(self, full_path):
+        """把游戏目录中的绝对路径拆分为 (别名, 相对路径)，不在游戏目录中时返回None"""
+        relative = os.path.relpath(full_path, self.games_root)
+        if relative == "." or relative.startswith(".."):
+            return None
+        parts = relative.replace(os.sep, "/").split("/", 1)
+        return parts[0], parts[1] if len(parts) > 1 else None
+
+    def batch_due(self, now):
+        if self.first_change is None:
+            return False
+        return now - self.last_change >= self.debounce or now - self.first_change >= MAX_BATCH_DELAY
+
+    def flush(self):
+        """把累计的变化交给回调函数"""
+        changes, self.pending = self.pending, {}
+        self.first_change = self.last_change = None
+        if not changes:
+            return
+        started = time.monotonic()
+        try:
+            self.on_change(changes)
+        except Exception as e:
+            self.log(f"Watcher: failed to apply changes: {e}")
+        with self.lock:
+            self.stats['batches'] += 1
+            self.stats['handler_seconds'] += time.monotonic() - started
+
+    def start(self, stop_event):
+        """
+        在后台线程中开始监视，优先使用inotify
+
+        Args:
+            stop_event (threading.Event): 设置后停止监视
+        """
+        thread = threading.Thread(target=self.run, args=(stop_event,), daemon=True)
+        thread.start()
+        return thread
+
+    def run(self, stop_event):
+        libc = load_inotify()
+        if libc is not None:
+            try:
+                self.run_inotify(libc, stop_event)
+                return
+            except OSError as e:
+                # 如超出 fs.inotify.max_user_watches
+                self.log(f"Watcher: inotify unavailable ({e}), falling back to polling")
+        self.run_polling(stop_event)
+
+    def update_cpu(self):
+        with self.lock:
+            self.stats['cpu_seconds'] = time.thread_time()
+
+    # ---------- inotify ----------
+
+    def add_watch(self, libc, fd, path):
+        wd = libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # 刚创建就被删除
+                return
+            raise OSError(error, os.strerror(error), path)
+        self.watches[wd] = path
+
+    def add_tree(self, libc, fd, top, report=False):
+        """
+        监视目录及其所有子目录
+
+        Args:
+            report (bool): 是否把目录中已有的文件记为变化（新出现的目录在添加监视之前可能已写入文件）
+        """
+        for root, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if not (root == self.games_root and d.startswith("."))]
+            self.add_watch(libc, fd, root)
+            if report:
+                for filename in files:
+                    parts = self.split_path(os.path.join(root, filename))
+                    if parts:
+                        self.add_change(*parts)
+
+    def run_inotify(self, libc, stop_event):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        try:
+            os.makedirs(self.games_root, exist_ok=True)
+            started = time.monotonic()
+            self.add_tree(libc, fd, self.games_root)
+            # 主页文件常被编辑器以改名的方式替换，监视所在目录并按文件名过滤
+            self.add_watch(libc, fd, os.path.dirname(self.homepage))
+            with self.lock:
+                self.backend = "inotify"
+                self.stats['scan_seconds'] += time.monotonic() - started
+            self.log(f"Watcher: watching {len(self.watches)} directories with inotify")
+
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            while not stop_event.is_set():
+                if self.first_change is None:
+                    timeout = 0.5
+                else:
+                    timeout = max(0.0, min(self.last_change + self.debounce,
+                                           self.first_change + MAX_BATCH_DELAY) - time.monotonic())
+                if poller.poll(timeout * 1000):
+                    try:
+                        data = os.read(fd, READ_SIZE)
+                    except BlockingIOError:
+                        data = b""
+                    self.handle_events(libc, fd, data)
+                if self.batch_due(time.monotonic()):
+                    self.flush()
+                self.update_cpu()
+        finally:
+            os.close(fd)
+            self.watches.clear()
+
+    def handle_events(self, libc, fd, data):
+        offset = 0
+        count = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            count += 1
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失了部分事件：检查所有游戏
+                with self.lock:
+                    self.stats['overflows'] += 1
+                for alias in os.listdir(self.games_root):
+                    self.add_change(alias, None)
+                self.add_change(None, None)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+
+            full_path = os.path.join(directory, name)
+            if directory == os.path.dirname(self.homepage) and full_path == self.homepage:
+                self.add_change(None, None)
+            parts = self.split_path(full_path)
+            if parts is None:
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(libc, fd, full_path, report=True)
+            self.add_change(*parts)
+        with self.lock:
+            self.stats['events'] += count
+
+    # ---------- polling ----------
+
+    def scan(self):
+        """
+        记录所有文件的修改时间和大小
+
+        Returns:
+            dict: (别名, 相对路径) 到 (修改时间, 大小) 的映射，主页文件的别名为None
+        """
+        snapshot = {}
+        try:
+            stat = os.stat(self.homepage)
+            snapshot[(None, None)] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        if not os.path.isdir(self.games_root):
+            return snapshot
+        for alias in os.listdir(self.games_root):
+            game_dir = os.path.join(self.games_root, alias)
+            if alias.startswith(".") or not os.path.isdir(game_dir):
+                continue
+            snapshot[(alias, None)] = None
+            for root, dirs, files in os.walk(game_dir):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    relative = os.path.relpath(path, game_dir).replace(os.sep, "/")
+                    snapshot[(alias, relative)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def timed_scan(self):
+        started = time.monotonic()
+        snapshot = self.scan()
+        with self.lock:
+            self.stats['scans'] += 1
+            self.stats['scan_seconds'] += time.monotonic() - started
+        return snapshot
+
+    def run_polling(self, stop_event):
+        with self.lock:
+            self.backend = "polling"
+        self.log(f"Watcher: scanning for changes every {self.poll_interval}s")
+        snapshot = self.timed_scan()
+        self.update_cpu()
+        interval = self.poll_interval
+        while not stop_event.wait(interval):
+            current = self.timed_scan()
+            changed = [key for key in current.keys() | snapshot.keys() if current.get(key) != snapshot.get(key)]
+            for alias, path in changed:
+                self.add_change(alias, path)
+            with self.lock:
+                self.stats['events'] += len(changed)
+            snapshot = current
+            # 发现变化后缩短扫描间隔，直到一次扫描没有新的变化（或等待过久）再处理这一批
+            if changed and time.monotonic() - self.first_change < MAX_BATCH_DELAY:
+                interval = self.debounce
+            else:
+                self.flush()
+                interval = self.poll_interval
+            self.update_cpu()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, backend=self.backend, watches=len(self.watches))
+        for key in ('scan_seconds', 'handler_seconds', 'cpu_seconds'):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+def load_watch_settings():
+    """
+    从设置表读取文件监视配置
+
+    Returns:
+        dict: 配置项名称到数值的映射
+    """
+    return load_typed_settings(WATCH_SETTINGS)
\ No newline at end of file
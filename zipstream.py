@@ -0,0 +1,307 @@
+"""
+GalHub - ZIP下载模块
+按需生成整个游戏目录的ZIP流，不写临时文件；已压缩的媒体文件直接存储，其他文件用deflate压缩。
+每个文件的CRC和压缩后大小缓存在数据库中，因此总长度可以预先确定，支持Range请求和断点续传。
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from database import get_zip_layout, set_zip_layout
+
+# 布局格式版本，修改压缩方式或布局内容时需要递增
+LAYOUT_VERSION = 1
+# 压缩和读取文件时每次处理的块大小，生成布局与发送时必须一致才能得到相同的压缩结果
+CHUNK_SIZE = 256 * 1024
+# deflate压缩级别
+COMPRESS_LEVEL = 6
+# 直接存储不再压缩的文件类型（本身已经压缩）
+STORED_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.mp3', '.ogg', '.oga', '.opus', '.m4a', '.aac', '.flac',
+    '.mp4', '.m4v', '.webm', '.ogv', '.mkv',
+    '.woff', '.woff2', '.zip', '.gz', '.br', '.7z', '.rar', '.xz', '.bz2',
+}
+# 进程内缓存的布局数
+MAX_CACHED_LAYOUTS = 32
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+# 超过此值的大小和偏移量需要使用ZIP64扩展字段
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# 通用标志位11：文件名使用UTF-8编码
+FLAG_UTF8 = 0x0800
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_LOCATOR = struct.Struct("<IIQI")
+
+class ZipLayoutError(Exception):
+    """游戏文件与缓存的ZIP布局不一致"""
+
+def get_manifest_digest(files):
+    """根据文件清单生成摘要，清单变化时缓存的布局失效"""
+    digest = hashlib.sha256(f"{LAYOUT_VERSION}:{zlib.ZLIB_RUNTIME_VERSION}:{COMPRESS_LEVEL}".encode())
+    for f in files:
+        digest.update(f"{f['path']}\0{f['sha256']}\0{f['mtime']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def dos_datetime(mtime):
+    """把修改时间转换为ZIP使用的DOS日期和时间"""
+    t = time.localtime(mtime)
+    year = min(max(t.tm_year, 1980), 2107)
+    if year != t.tm_year:
+        return 0, ((year - 1980) << 9) | (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+def iter_file(path, size):
+    """分块读取文件，大小与布局记录的不一致时抛出ZipLayoutError"""
+    read = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            read += len(chunk)
+            yield chunk
+    if read != size:
+        raise ZipLayoutError(f"file changed: {path}")
+
+def iter_deflate(path, size):
+    """分块压缩文件（raw deflate）"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    for chunk in iter_file(path, size):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def scan_entry(game_dir, f):
+    """
+    读取一个文件，计算CRC并决定存储方式
+
+    Returns:
+        list: [路径, 压缩方式, CRC, 压缩后大小, 原始大小, 修改时间]
+    """
+    path = os.path.join(game_dir, *f['path'].split('/'))
+    crc = 0
+    for chunk in iter_file(path, f['size']):
+        crc = zlib.crc32(chunk, crc)
+    method, compressed = METHOD_STORED, f['size']
+    if os.path.splitext(f['path'])[1].lower() not in STORED_EXTENSIONS and f['size'] > 0:
+        deflated = sum(len(data) for data in iter_deflate(path, f['size']))
+        if deflated < f['size']:
+            method, compressed = METHOD_DEFLATED, deflated
+    return [f['path'], method, crc, compressed, f['size'], f['mtime']]
+
+class ZipLayout:
+    """
+    ZIP文件的布局：每个文件的本地文件头、数据，然后是中央目录和结束记录
+
+    只保存每个文件的元数据，文件头在发送时生成，内存占用与游戏大小无关。
+    """
+    def __init__(self, game_dir, entries):
+        self.game_dir = game_dir
+        self.entries = entries
+        self.names = [entry[0].encode('utf-8') for entry in entries]
+        self.offsets = []
+        # (起始位置, 长度, 类型, 序号)，类型为 local/data/central/end
+        self.parts = []
+        position = 0
+        for index, entry in enumerate(entries):
+            self.offsets.append(position)
+            position = self.add_part(position, len(self.local_header(index)), 'local', index)
+            position = self.add_part(position, entry[3], 'data', index)
+        self.central_offset = position
+        for index in range(len(entries)):
+            position = self.add_part(position, len(self.central_header(index)), 'central', index)
+        self.central_size = position - self.central_offset
+        position = self.add_part(position, len(self.end_records()), 'end', 0)
+        self.size = position
+
+    def add_part(self, position, length, kind, index):
+        if length:
+            self.parts.append((position, length, kind, index))
+        return position + length
+
+    def local_header(self, index):
+        path, method, crc, compressed, size, mtime = self.entries[index]
+        dostime, dosdate = dos_datetime(mtime)
+        extra = b""
+        if compressed >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            extra = struct.pack("<HHQQ", 1, 16, size, compressed)
+            compressed = size = ZIP64_LIMIT
+        name = self.names[index]
+        return LOCAL_HEADER.pack(0x04034b50, 45 if extra else 20, FLAG_UTF8, method, dostime, dosdate,
+                                 crc, compressed, size, len(name), len(extra)) + name + extra
+
+    def central_header(self, index):
+        path, method, crc, compressed, size, mtime = self.entries[index]
+        offset = self.offsets[index]
+        dostime, dosdate = dos_datetime(mtime)
+        fields = []
+        if size >= ZIP64_LIMIT:
+            fields.append(size)
+            size = ZIP64_LIMIT
+        if compressed >= ZIP64_LIMIT:
+            fields.append(compressed)
+            compressed = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+        version = 45 if extra else 20
+        name = self.names[index]
+        # 创建系统为Unix(3)，外部属性中保存普通文件的权限 0644
+        return CENTRAL_HEADER.pack(0x02014b50, (3 << 8) | version, version, FLAG_UTF8, method, dostime, dosdate,
+                                   crc, compressed, size, len(name), len(extra), 0, 0, 0,
+                                   (0o100644 << 16), offset) + name + extra
+
+    def end_records(self):
+        count = len(self.entries)
+        records = b""
+        if count >= ZIP64_COUNT_LIMIT or self.central_offset >= ZIP64_LIMIT or self.central_size >= ZIP64_LIMIT:
+            zip64_offset = self.central_offset + self.central_size
+            records += ZIP64_END_RECORD.pack(0x06064b50, 44, (3 << 8) | 45, 45, 0, 0, count, count,
+                                             self.central_size, self.central_offset)
+            records += ZIP64_END_LOCATOR.pack(0x07064b50, 0, zip64_offset, 1)
+            return records + END_RECORD.pack(0x06054b50, 0, 0, ZIP64_COUNT_LIMIT, ZIP64_COUNT_LIMIT,
+                                             ZIP64_LIMIT, ZIP64_LIMIT, 0)
+        return END_RECORD.pack(0x06054b50, 0, 0, count, count, self.central_size, self.central_offset, 0)
+
+    def iter_part(self, kind, index, skip):
+        """生成一个部分从skip开始的内容"""
+        if kind == 'local':
+            yield self.local_header(index)[skip:]
+        elif kind == 'central':
+            yield self.central_header(index)[skip:]
+        elif kind == 'end':
+            yield self.end_records()[skip:]
+        else:
+            path, method, crc, compressed, size, mtime = self.entries[index]
+            file_path = os.path.join(self.game_dir, *path.split('/'))
+            if method == METHOD_STORED:
+                with open(file_path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size != size:
+                        raise ZipLayoutError(f"file changed: {path}")
+                    f.seek(skip)
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+            else:
+                # deflate的输出无法定位，从头重新压缩并丢弃skip之前的部分
+                produced = 0
+                for data in iter_deflate(file_path, size):
+                    if produced + len(data) > skip:
+                        yield data[max(0, skip - produced):]
+                    produced += len(data)
+                if produced != compressed:
+                    raise ZipLayoutError(f"compressed size changed: {path}")
+
+    def iter_range(self, start, end):
+        """
+        生成ZIP文件中 [start, end] 范围的内容
+
+        Args:
+            start (int): 起始位置
+            end (int): 结束位置（包含）
+        """
+        for part_start, length, kind, index in self.parts:
+            part_end = part_start + length - 1
+            if part_end < start:
+                continue
+            if part_start > end:
+                break
+            skip = max(0, start - part_start)
+            remaining = min(part_end, end) - max(part_start, start) + 1
+            for chunk in self.iter_part(kind, index, skip):
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+                if remaining <= 0:
+                    break
+
+    def open(self, start=0, end=None):
+        """打开一个可以 read(size) 的读取器"""
+        return ZipReader(self.iter_range(start, self.size - 1 if end is None else end))
+
+class ZipReader:
+    """把按块生成的内容包装为可以 read(size) 的对象"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+_layouts = OrderedDict()
+_layouts_lock = threading.Lock()
+# 正在生成布局的游戏，同一游戏的并发请求只生成一次，其余请求等待其完成后使用缓存
+_inflight = {}
+
+def get_layout_cache():
+    """返回进程内缓存的布局及保护它的锁，供内存统计使用"""
+    return _layouts, _layouts_lock
+
+def load_layout(alias, game_dir, files):
+    """
+    获取游戏的ZIP布局，缓存不存在或文件清单已变化时重新读取所有文件生成
+
+    Args:
+        alias (str): 游戏别名
+        game_dir (str): 游戏目录
+        files (list): 文件清单
+
+    Returns:
+        tuple: (ZipLayout, 清单摘要)
+    """
+    digest = get_manifest_digest(files)
+    while True:
+        with _layouts_lock:
+            cached = _layouts.get(alias)
+            if cached is not None and cached[1] == digest:
+                _layouts.move_to_end(alias)
+                return cached
+            event = _inflight.get(alias)
+            if event is None:
+                event = _inflight[alias] = threading.Event()
+                break
+        # 其他请求正在生成同一游戏的布局，等待其完成后重新检查缓存
+        event.wait()
+
+    try:
+        stored = get_zip_layout(alias)
+        if stored is not None and stored[0] == digest:
+            entries = json.loads(stored[1])
+        else:
+            entries = [scan_entry(game_dir, f) for f in files]
+            set_zip_layout(alias, digest, json.dumps(entries, ensure_ascii=False))
+        layout = (ZipLayout(game_dir, entries), digest)
+
+        with _layouts_lock:
+            _layouts[alias] = layout
+            while len(_layouts) > MAX_CACHED_LAYOUTS:
+                _layouts.popitem(last=False)
+    finally:
+        with _layouts_lock:
+            _inflight.pop(alias, None)
+        event.set()
+    return layout
\ No newline at end of file